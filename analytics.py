@@ -0,0 +1,311 @@
+"""Alerts for a month: budget overruns, unusual days and duplicate charges
+
+Usage: python analytics.py 2024-03 [--today 2024-03-15] [--db PATH]
+
+The daily spend of every category over the month and the WINDOW days before
+it is read with one grouped query along the (date, category_id, amount)
+index into a (categories, days) array. Everything else is NumPy on that
+array:
+    
+    overruns    cumulative spend against the month's budget; a category
+                already over says when it went over, otherwise the burn
+                rate of its day-to-day spending so far says when it will
+    outliers    days whose spend is Z_THRESHOLD standard deviations above
+                the category's mean over the WINDOW days before, from
+                running sums of x and x squared
+    duplicates  charges with the same category, amount and description
+                within DUPLICATE_DAYS of each other, found by comparing
+                neighbours sorted by NumPy; descriptions are only read
+                for the pairs that match otherwise
+
+A month with tens of thousands of expenses is checked in a few tens of
+milliseconds however long the history is.
+"""
+import json
+import calendar
+import argparse
+from datetime import date
+
+import numpy as np
+
+import archive
+import categories
+import database
+import recurring
+from reports import month_range
+
+# Days of history behind each day's z-score
+WINDOW = 28
+Z_THRESHOLD = 3.0
+# Categories spending on fewer days of the window than this have no
+# meaningful spread; any purchase would stand out
+MIN_ACTIVE_DAYS = WINDOW // 2
+# Burn rates over fewer days are mostly the first bills of the month
+MIN_PROJECTION_DAYS = 7
+DUPLICATE_DAYS = 1
+# Idempotency keys looked up per statement, well under SQLite's variable limit
+KEY_CHUNK = 500
+
+
+def ordinal(day):
+    """1 -> "1st", 22 -> "22nd", 13 -> "13th" """
+    suffix = "th" if 10 <= day % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(day % 10, "th")
+    return f"{day}{suffix}"
+
+
+def load_series(conn, start, end):
+    """Return (category ids, (categories, days) daily spend) for [start, end)
+    
+    Column 0 is start. Each archived year in the range adds one arm to the
+    UNION ALL; the query is still one round trip.
+    """
+    arms = [f"""
+        SELECT CAST(julianday(date) - julianday(?) AS INTEGER), category_id, SUM(amount)
+        FROM {schema}.expenses
+        WHERE date >= ? AND date < ?
+        GROUP BY date, category_id
+    """ for schema in archive.schemas(conn, start, end)]
+    rows = conn.execute(" UNION ALL ".join(arms), (start, start, end) * len(arms)).fetchall() if arms else []
+    
+    day_count = date.fromisoformat(end).toordinal() - date.fromisoformat(start).toordinal()
+    category_ids = np.array(sorted(categories.names(conn)), dtype=np.int64)
+    spend = np.zeros((len(category_ids), day_count))
+    if rows:
+        days, row_categories, totals = (np.asarray(column) for column in zip(*rows))
+        rows_index, known = category_index(category_ids, row_categories)
+        spend[rows_index[known], days[known]] = totals[known]
+    return category_ids, spend
+
+
+def category_index(category_ids, values):
+    """Return (row of each value in the sorted category_ids, mask of the values found there)"""
+    index = np.minimum(np.searchsorted(category_ids, values), max(len(category_ids) - 1, 0))
+    known = category_ids[index] == values if len(category_ids) else np.zeros(len(values), dtype=bool)
+    return index, known
+
+
+def rolling_zscores(spend, window=WINDOW):
+    """z-score of each day against the `window` days before it, per row
+    
+    NaN where there is not a full window yet, where the window has fewer
+    than MIN_ACTIVE_DAYS days with spending, or where it has no spread.
+    """
+    rows, days = spend.shape
+    result = np.full((rows, days), np.nan)
+    if days <= window:
+        return result
+    
+    def window_sums(values):
+        sums = np.cumsum(np.pad(values, ((0, 0), (1, 0))), axis=1)
+        # The window of day t is days t - window .. t - 1
+        return sums[:, window:-1] - sums[:, :-window - 1]
+    
+    mean = window_sums(spend) / window
+    variance = np.maximum(window_sums(spend * spend) / window - mean * mean, 0.0)
+    std = np.sqrt(variance)
+    active = window_sums((spend > 0).astype(float))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = (spend[:, window:] - mean) / std
+    z[(std <= 0.005) | (active < MIN_ACTIVE_DAYS)] = np.nan
+    result[:, window:] = z
+    return result
+
+
+def month_alerts(conn, year, month_num, today=None):
+    """Return the alerts for a month, most urgent first
+    
+    Each alert is a dict with kind ("over budget", "projected overrun",
+    "unusual day" or "duplicate"), category, date, amount and message.
+    Only days up to today count, so a month in the future has no alerts
+    apart from duplicates among expenses already entered.
+    """
+    today = today or date.today()
+    start, end = month_range(year, month_num)
+    first = date.fromisoformat(start)
+    history_start = date.fromordinal(first.toordinal() - WINDOW).isoformat()
+    
+    category_ids, spend = load_series(conn, history_start, end)
+    names = categories.names(conn)
+    month = spend[:, WINDOW:]
+    days_in_month = month.shape[1]
+    # Days of the month that have happened
+    elapsed = min(days_in_month, max(0, today.toordinal() - first.toordinal() + 1))
+    
+    one_off = one_off_spend(conn, category_ids, start, date.fromordinal(first.toordinal() + elapsed).isoformat())
+    alerts = overruns(conn, category_ids, month, one_off, elapsed, year, month_num, names)
+    alerts += outliers(category_ids, spend, elapsed, first, names)
+    alerts += duplicates(conn, start, end, names)
+    return alerts
+
+
+def one_off_spend(conn, category_ids, start, end):
+    """Per category, recurring expenses plus the largest other expense in [start, end)
+    
+    Neither says how fast the rest of a budget goes: rent paid on the 1st
+    would otherwise project an overrun every month.
+    """
+    recurring_spend = np.zeros(len(category_ids))
+    largest = np.zeros(len(category_ids))
+    keys = recurring.occurrence_keys(conn, start, end)
+    for schema in archive.schemas(conn, start, end):
+        recurring_rows = []
+        for offset in range(0, len(keys), KEY_CHUNK):
+            chunk = keys[offset:offset + KEY_CHUNK]
+            recurring_rows += conn.execute(f"""
+                SELECT id, category_id, amount FROM {schema}.expenses
+                WHERE import_hash IN ({", ".join("?" * len(chunk))}) AND date >= ? AND date < ?
+            """, (*chunk, start, end)).fetchall()
+        if recurring_rows:
+            _, row_categories, amounts = (np.asarray(column) for column in zip(*recurring_rows))
+            index, known = category_index(category_ids, row_categories)
+            np.add.at(recurring_spend, index[known], amounts[known])
+        
+        # The largest single charge comes from the covering date index
+        rows = conn.execute(f"""
+            SELECT category_id, MAX(amount) FROM {schema}.expenses
+            WHERE date >= ? AND date < ? AND id NOT IN (SELECT value FROM json_each(?))
+            GROUP BY category_id
+        """, (start, end, json.dumps([row[0] for row in recurring_rows]))).fetchall()
+        if rows:
+            row_categories, amounts = (np.asarray(column) for column in zip(*rows))
+            index, known = category_index(category_ids, row_categories)
+            np.maximum.at(largest, index[known], amounts[known])
+    return recurring_spend + largest
+
+
+def overruns(conn, category_ids, month, one_off, elapsed, year, month_num, names):
+    """Budget alerts from the cumulative spend of the month's first elapsed days
+    
+    one_off is each category's spend that is left out of the burn rate.
+    """
+    if elapsed == 0:
+        return []
+    budget = np.zeros(len(category_ids))
+    rows = conn.execute("SELECT category_id, amount FROM budgets WHERE year = ? AND month = ? AND amount > 0",
+                        (year, calendar.month_name[month_num])).fetchall()
+    if not rows:
+        return []
+    budget_ids, amounts = (np.asarray(column) for column in zip(*rows))
+    index, known = category_index(category_ids, budget_ids)
+    budget[index[known]] = amounts[known]
+    
+    cumulative = np.cumsum(month[:, :elapsed], axis=1)
+    spent = cumulative[:, -1]
+    budgeted = budget > 0
+    over = budgeted & (spent > budget)
+    # First day the running total passed the budget
+    went_over = np.argmax(cumulative > budget[:, None], axis=1) + 1
+    
+    # At the burn rate of day-to-day spending so far, the day the rest of
+    # the budget runs out. A budget already used up to the cent has no rest.
+    days_in_month = month.shape[1]
+    remaining = budget - spent
+    rate = np.maximum(spent - one_off, 0.0) / elapsed
+    with np.errstate(divide="ignore", invalid="ignore"):
+        runs_out = elapsed + np.floor(remaining / rate) + 1
+    projected = (budgeted & (remaining > 0.005) & (rate > 0.005) & (runs_out <= days_in_month)
+                 & (elapsed >= MIN_PROJECTION_DAYS))
+    
+    alerts = []
+    for index in np.flatnonzero(over):
+        name, day = names[category_ids[index]], int(went_over[index])
+        alerts.append({"kind": "over budget", "category": name, "date": date(year, month_num, day).isoformat(),
+                       "amount": float(spent[index] - budget[index]),
+                       "message": f"{name} went over budget on the {ordinal(day)} "
+                                  f"(${spent[index] - budget[index]:,.2f} over)"})
+    for index in np.flatnonzero(projected)[np.argsort(runs_out[projected], kind="stable")]:
+        name, day = names[category_ids[index]], int(runs_out[index])
+        alerts.append({"kind": "projected overrun", "category": name, "date": date(year, month_num, day).isoformat(),
+                       "amount": float(one_off[index] + rate[index] * days_in_month - budget[index]),
+                       "message": f"{name} will exceed budget on the {ordinal(day)} at ${rate[index]:,.2f} a day"})
+    return alerts
+
+
+def outliers(category_ids, spend, elapsed, first, names):
+    """Days of the month's first elapsed days whose spend is unusually high"""
+    z = rolling_zscores(spend)[:, WINDOW:WINDOW + elapsed]
+    with np.errstate(invalid="ignore"):
+        rows, days = np.nonzero(z >= Z_THRESHOLD)
+    order = np.argsort(-z[rows, days], kind="stable")
+    
+    alerts = []
+    for row, day in zip(rows[order], days[order]):
+        name = names[category_ids[row]]
+        amount = spend[row, WINDOW + day]
+        usual = spend[row, day:WINDOW + day].mean()
+        on = date.fromordinal(first.toordinal() + int(day))
+        alerts.append({"kind": "unusual day", "category": name, "date": on.isoformat(), "amount": float(amount),
+                       "message": f"{name}: ${amount:,.2f} on the {ordinal(on.day)}, "
+                                  f"{z[row, day]:.1f} standard deviations above the usual ${usual:,.2f} a day"})
+    return alerts
+
+
+def duplicates(conn, start, end, names):
+    """Charges repeated with the same category, amount and description within DUPLICATE_DAYS"""
+    alerts = []
+    for schema in archive.schemas(conn, start, end):
+        # Pairs with the same category and amount on close days come from
+        # the covering date index alone; only their descriptions are read
+        rows = conn.execute(f"""
+            SELECT id, category_id, amount, CAST(julianday(date) AS INTEGER)
+            FROM {schema}.expenses
+            WHERE date >= ? AND date < ?
+        """, (start, end)).fetchall()
+        if len(rows) < 2:
+            continue
+        ids, category_column, amounts, days = (np.asarray(column) for column in zip(*rows))
+        order = np.lexsort((days, amounts, category_column))
+        ids, category_column, amounts, days = ids[order], category_column[order], amounts[order], days[order]
+        close = np.flatnonzero((category_column[1:] == category_column[:-1]) & (amounts[1:] == amounts[:-1])
+                               & (days[1:] - days[:-1] <= DUPLICATE_DAYS))
+        if not len(close):
+            continue
+        
+        details = dict((row[0], row[1:]) for row in conn.execute(f"""
+            SELECT id, date, description FROM {schema}.expenses
+            WHERE id IN (SELECT value FROM json_each(?))
+        """, (json.dumps(np.union1d(ids[close], ids[close + 1]).tolist()),)))
+        for index in close:
+            (first_date, description), (second_date, other) = details[ids[index]], details[ids[index + 1]]
+            if description != other:
+                continue
+            name, amount = names.get(category_column[index], categories.UNKNOWN), float(amounts[index])
+            first_day, second_day = int(first_date[8:]), int(second_date[8:])
+            when = (f"twice on the {ordinal(first_day)}" if first_day == second_day
+                    else f"on the {ordinal(first_day)} and the {ordinal(second_day)}")
+            label = f' "{description}"' if description else ""
+            alerts.append({"kind": "duplicate", "category": name, "date": second_date, "amount": amount,
+                           "message": f"Possible duplicate: {name} ${amount:,.2f}{label} {when}"})
+    alerts.sort(key=lambda alert: alert["date"])
+    return alerts
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Show the budget, unusual spending and duplicate alerts of a month")
+    parser.add_argument("month", metavar="YYYY-MM")
+    parser.add_argument("--today", metavar="YYYY-MM-DD", help="day the month is checked on (default: today)")
+    parser.add_argument("--db", default=database.DB_PATH, help="path to the SQLite database")
+    args = parser.parse_args(argv)
+    
+    try:
+        year, month_num = (int(part) for part in args.month.split("-"))
+        today = date.fromisoformat(args.today) if args.today else None
+        date(year, month_num, 1)
+    except ValueError:
+        parser.error(f"invalid month or day: {args.month} {args.today or ''}")
+    
+    conn = database.connect(args.db)
+    try:
+        alerts = month_alerts(conn, year, month_num, today)
+    finally:
+        conn.close()
+    for alert in alerts:
+        print(alert["message"])
+    if not alerts:
+        print("No alerts")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
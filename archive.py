@@ -0,0 +1,392 @@
+"""Closed years moved out of the expenses table into read-only archive files
+
+Usage:
+    python archive.py list
+    python archive.py archive 2022 [--vacuum]
+    python archive.py restore 2021
+    python archive.py vacuum
+with --db PATH.
+
+"archive YEAR" moves every expense up to the end of YEAR into one file per
+year, data/archive/expenses_YEAR.db, with the same columns, indexes and
+search index as the expenses table. Years are archived oldest first and
+restored newest first, so the expenses table always holds one run of recent
+years and its indexes stay the size of the years still being edited.
+monthly_category_totals keeps the archived months, so summaries, budgets and
+trends never open an archive. "vacuum" returns the space the moved rows
+leave in the main file to the file system.
+
+Queries get the tables covering a date range from schemas(): an archive is
+attached read-only with ATTACH DATABASE the first time one of its years is
+read, and at most MAX_ATTACHED stay attached to a connection. Archived
+expenses cannot be added, edited or deleted until their year is restored.
+"""
+import os
+import sqlite3
+import argparse
+import threading
+from datetime import date
+from pathlib import Path
+from weakref import WeakKeyDictionary
+from collections import OrderedDict
+
+import database
+
+ARCHIVE_DIRECTORY = "archive"
+
+# Page cache while rows are moved. Deleting a year touches pages all over
+# the expenses table and its indexes; with the default 2 MiB cache a year of
+# a million row database takes 5s to delete instead of 3s.
+CACHE_KIB = 64 * 1024
+
+# SQLite allows 10 attached databases unless compiled otherwise
+MAX_ATTACHED = 8
+
+# Cached partitions by connection, kept the same way as categories keeps
+# its dictionaries
+_caches = WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+class Partitions:
+    """The archived years of one connection and the archives attached to it"""
+    
+    def __init__(self, conn):
+        self.version = None
+        self.directory = os.path.dirname(database_path(conn))
+        # year -> (path relative to the main database, rows)
+        self.years = {}
+        # year -> schema name, least recently used first. Archives attached
+        # before this cache entry was made are found by name.
+        self.attached = OrderedDict(
+            (int(name[len("archive_"):]), name)
+            for _, name, _ in conn.execute("PRAGMA database_list")
+            if name.startswith("archive_") and name[len("archive_"):].isdigit()
+        )
+    
+    def refresh(self, conn):
+        """Reload the archived years if another commit may have changed them"""
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self.version:
+            self.years = {}
+            if database.archived_through(conn) is not None:
+                self.years = {year: (path, rows) for year, path, rows in
+                              conn.execute("SELECT year, path, rows FROM archives")}
+            # Restored years are detached
+            for year in [year for year in self.attached if year not in self.years]:
+                conn.execute(f"DETACH DATABASE {self.attached.pop(year)}")
+            self.version = version
+        return self
+    
+    @property
+    def last_year(self):
+        return max(self.years) if self.years else None
+    
+    def attach(self, conn, year):
+        """Return the schema name of a year's archive, attaching it if needed"""
+        schema = self.attached.get(year)
+        if schema is not None:
+            self.attached.move_to_end(year)
+            return schema
+        while len(self.attached) >= MAX_ATTACHED:
+            _, oldest = self.attached.popitem(last=False)
+            conn.execute(f"DETACH DATABASE {oldest}")
+        
+        path = os.path.join(self.directory, self.years[year][0])
+        # A missing file would be attached as a new, empty database
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Archive of {year} not found: {path}")
+        schema = f"archive_{year}"
+        try:
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (Path(path).resolve().as_uri() + "?mode=ro",))
+        except sqlite3.OperationalError:
+            # SQLite built without URI file names
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+        self.attached[year] = schema
+        return schema
+    
+    def schemas(self, conn, start=None, end=None, newest_first=False):
+        """Yield the schemas holding expenses in [start, end), oldest first
+        
+        Archives are attached as they are reached, so a caller that stops
+        early never attaches the rest.
+        """
+        first = int(start[:4]) if start else None
+        last = None
+        if end:
+            last = int(end[:4]) - (1 if end[4:] <= "-01-01" else 0)
+        years = [year for year in sorted(self.years)
+                 if (first is None or year >= first) and (last is None or year <= last)]
+        # None stands for the expenses table, which holds the years after the archives
+        order = years + ([None] if last is None or self.last_year is None or last > self.last_year else [])
+        if newest_first:
+            order.reverse()
+        for year in order:
+            yield "main" if year is None else self.attach(conn, year)
+    
+    def size(self, conn, schema):
+        """Number of expenses in a schema"""
+        if schema == "main":
+            # The rollup still counts the archived months; ids are no guide
+            # once the oldest years have moved out
+            first_month = "" if self.last_year is None else f"{self.last_year + 1}"
+            return conn.execute("SELECT IFNULL(SUM(count), 0) FROM monthly_category_totals WHERE month >= ?",
+                                (first_month,)).fetchone()[0]
+        return self.years[int(schema[len("archive_"):])][1]
+
+
+def partitions(conn):
+    """Return the up to date Partitions of a connection opened with database.Connection"""
+    with _caches_lock:
+        entry = _caches.get(conn)
+        if entry is None:
+            entry = _caches[conn] = Partitions(conn)
+    return entry.refresh(conn)
+
+
+def invalidate(conn):
+    """Reload the archived years of a connection on its next query"""
+    with _caches_lock:
+        entry = _caches.get(conn)
+    if entry is not None:
+        entry.version = None
+
+
+def schemas(conn, start=None, end=None, newest_first=False):
+    """Yield "main" and the archive schemas holding expenses in [start, end)
+    
+    Either bound may be None for an open range. Schemas come in date order,
+    oldest first unless newest_first, and never overlap.
+    """
+    return partitions(conn).schemas(conn, start, end, newest_first)
+
+
+def database_path(conn):
+    """Return the file of a connection's main database"""
+    for _, name, path in conn.execute("PRAGMA database_list"):
+        if name == "main":
+            return path
+
+
+def check_open(conn, day):
+    """Raise ValueError if an expense dated day would be in an archived year"""
+    last_year = database.archived_through(conn)
+    if last_year is not None and day < f"{last_year + 1}":
+        raise ValueError(f"Expenses up to {last_year} are archived and read-only; "
+                         f"restore the year to change them")
+
+
+# SQL expression for the next expense id, for use inside an INSERT so the id
+# is read under the statement's write lock
+NEXT_ID = """
+    MAX((SELECT IFNULL(MAX(id), 0) FROM expenses),
+        (SELECT IFNULL(MAX(max_id), 0) FROM archives)) + 1
+"""
+
+
+def next_id(conn):
+    """Return an id for a new expense that no archived expense uses"""
+    return conn.execute(f"SELECT {NEXT_ID}").fetchone()[0]
+
+
+def create_archive_tables(conn, schema):
+    """Create the expenses table and its search index in an attached database"""
+    conn.execute(f"""
+        CREATE TABLE {schema}.expenses (
+            id INTEGER PRIMARY KEY,
+            amount REAL,
+            category_id INTEGER,
+            date TEXT,
+            description TEXT,
+            import_hash BLOB
+        )
+    """)
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE {schema}.expenses_search USING fts5 (
+            description,
+            content = 'expenses', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+    """)
+
+
+def index_archive(conn, schema):
+    """Index an archive's expenses like the expenses table, once they are all in"""
+    conn.execute(f"CREATE INDEX {schema}.idx_expenses_date ON expenses (date)")
+    conn.execute(f"CREATE INDEX {schema}.idx_expenses_date_category_amount ON expenses (date, category_id, amount)")
+    conn.execute(f"CREATE INDEX {schema}.idx_expenses_category_date ON expenses (category_id, date)")
+    conn.execute(f"CREATE INDEX {schema}.idx_expenses_amount ON expenses (amount)")
+    conn.execute(f"INSERT INTO {schema}.expenses_search (expenses_search) VALUES ('rebuild')")
+
+
+def archive_year(conn, year):
+    """Move the expenses of one year into its archive file and return how many moved
+    
+    The archive is written and committed before the rows are deleted from
+    the expenses table, and the year's rollup rows are kept.
+    """
+    start, end = f"{year}-01-01", f"{year + 1}-01-01"
+    rows, max_id = conn.execute("SELECT COUNT(*), MAX(id) FROM expenses WHERE date >= ? AND date < ?",
+                                (start, end)).fetchone()
+    if not rows:
+        return 0
+    
+    relative = os.path.join(ARCHIVE_DIRECTORY, f"expenses_{year}.db")
+    path = os.path.join(os.path.dirname(database_path(conn)), relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Left behind by an archive run that failed before it was recorded
+    if os.path.exists(path):
+        os.remove(path)
+    
+    conn.execute("ATTACH DATABASE ? AS archive_new", (path,))
+    try:
+        create_archive_tables(conn, "archive_new")
+        copied = conn.execute("""
+            INSERT INTO archive_new.expenses (id, amount, category_id, date, description, import_hash)
+            SELECT id, amount, category_id, date, description, import_hash
+            FROM main.expenses WHERE date >= ? AND date < ? ORDER BY id
+        """, (start, end)).rowcount
+        if copied != rows:
+            raise sqlite3.DatabaseError(f"Copied {copied} of the {rows} expenses of {year}")
+        index_archive(conn, "archive_new")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        conn.execute("DETACH DATABASE archive_new")
+        os.remove(path)
+        raise
+    conn.execute("DETACH DATABASE archive_new")
+    
+    with conn:
+        months = (f"{year}-01", f"{year + 1}-01")
+        totals = conn.execute("""
+            SELECT month, category_id, total, count FROM monthly_category_totals
+            WHERE month >= ? AND month < ?
+        """, months).fetchall()
+        conn.execute("DELETE FROM expenses WHERE date >= ? AND date < ?", (start, end))
+        # The rollup triggers took the year's rows out of the totals
+        conn.executemany("""
+            INSERT OR REPLACE INTO monthly_category_totals (month, category_id, total, count)
+            VALUES (?, ?, ?, ?)
+        """, totals)
+        conn.execute("INSERT INTO archives (year, path, rows, max_id) VALUES (?, ?, ?, ?)",
+                     (year, relative, rows, max_id))
+    invalidate(conn)
+    return rows
+
+
+def archive_through(conn, year, current_year):
+    """Archive every year up to and including year, oldest first
+    
+    Only years before current_year are closed. Returns {year: rows moved}
+    for the years that had expenses.
+    """
+    if year >= current_year:
+        raise ValueError(f"{year} is not over yet")
+    last_year = database.archived_through(conn)
+    if last_year is not None and year <= last_year:
+        raise ValueError(f"Expenses up to {last_year} are already archived")
+    
+    first_day = conn.execute("SELECT MIN(date) FROM expenses").fetchone()[0]
+    moved = {}
+    if first_day is None:
+        return moved
+    conn.execute(f"PRAGMA cache_size = -{CACHE_KIB}")
+    for each in range(int(first_day[:4]), year + 1):
+        rows = archive_year(conn, each)
+        if rows:
+            moved[each] = rows
+    return moved
+
+
+def restore_year(conn, year):
+    """Move the expenses of the newest archived year back into the expenses table"""
+    path, rows = partitions(conn).years[year]
+    path = os.path.join(os.path.dirname(database_path(conn)), path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Archive of {year} not found: {path}")
+    
+    conn.execute("ATTACH DATABASE ? AS archive_restore", (path,))
+    try:
+        with conn:
+            # The rollup triggers add the rows back into the totals
+            conn.execute("DELETE FROM monthly_category_totals WHERE month >= ? AND month < ?",
+                         (f"{year}-01", f"{year + 1}-01"))
+            conn.execute("""
+                INSERT INTO main.expenses (id, amount, category_id, date, description, import_hash)
+                SELECT id, amount, category_id, date, description, import_hash
+                FROM archive_restore.expenses ORDER BY id
+            """)
+            conn.execute("DELETE FROM archives WHERE year = ?", (year,))
+    finally:
+        conn.execute("DETACH DATABASE archive_restore")
+    # Detaches the archive if this connection had it attached
+    invalidate(conn)
+    partitions(conn)
+    os.remove(path)
+    return rows
+
+
+def restore_from(conn, year):
+    """Restore year and every later archived year, newest first
+    
+    Returns {year: rows restored}.
+    """
+    years = sorted((each for each in partitions(conn).years if each >= year), reverse=True)
+    conn.execute(f"PRAGMA cache_size = -{CACHE_KIB}")
+    return {each: restore_year(conn, each) for each in years}
+
+
+def vacuum(conn):
+    """Rebuild the main database file without its free pages and return (bytes before, after)"""
+    path = database_path(conn)
+    before = os.path.getsize(path)
+    conn.execute("VACUUM main")
+    # The rebuilt pages pass through the WAL on their way into the file
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return before, os.path.getsize(path)
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Archive closed years of expenses into read-only files")
+    parser.add_argument("--db", default=database.DB_PATH, help="path to the SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list the archived years")
+    archive = commands.add_parser("archive", help="archive every year up to YEAR")
+    archive.add_argument("year", type=int)
+    archive.add_argument("--vacuum", action="store_true", help="reclaim the freed space afterwards")
+    restore = commands.add_parser("restore", help="move YEAR and every later archived year back")
+    restore.add_argument("year", type=int)
+    commands.add_parser("vacuum", help="reclaim the space left by archived years")
+    args = parser.parse_args(argv)
+    
+    conn = database.connect(args.db)
+    try:
+        if args.command == "list":
+            directory = os.path.dirname(database_path(conn))
+            for year, (path, rows) in sorted(partitions(conn).years.items()):
+                size = os.path.getsize(os.path.join(directory, path)) / 1e6
+                print(f"{year}  {rows:>10,} expenses  {size:>8.1f} MB  {path}")
+        elif args.command == "archive":
+            try:
+                moved = archive_through(conn, args.year, date.today().year)
+            except ValueError as e:
+                parser.error(str(e))
+            for year, rows in moved.items():
+                print(f"Archived {rows:,} expenses of {year}")
+            if not moved:
+                print(f"No expenses up to {args.year} to archive")
+        elif args.command == "restore":
+            for year, rows in restore_from(conn, args.year).items():
+                print(f"Restored {rows:,} expenses of {year}")
+        if args.command == "vacuum" or args.command == "archive" and args.vacuum:
+            before, after = vacuum(conn)
+            print(f"{os.path.basename(database_path(conn))}: {before / 1e6:,.1f} MB -> {after / 1e6:,.1f} MB")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
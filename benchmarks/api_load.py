@@ -0,0 +1,120 @@
+"""Load test server.py with concurrent clients reading and writing
+
+Usage: python benchmarks/api_load.py [--size 100k] [--clients 8] [--seconds 10] [--writes 0.2]
+
+A copy of a generated database (see generate.py) is served by server.py in
+its own process. Each client thread repeatedly adds an expense, with
+probability --writes, or opens a random month of the last year, alternating
+between the full month view and its summary. The sustained requests per
+second, their latency and the number of expenses committed per write batch
+are reported, and the rollup is checked against the expenses at the end.
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+from datetime import date
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+import database
+import generate
+from client import ApiClient
+
+
+def start_server(path, readers):
+    """Run server.py on a free port and return (process, url)"""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(BENCHMARKS), "server.py"),
+         "--db", path, "--port", "0", "--readers", str(readers)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    # "Serving PATH on http://HOST:PORT"
+    url = process.stdout.readline().split()[-1]
+    return process, url
+
+
+def client_loop(url, seconds, write_share, seed, latencies):
+    """Send requests until the time is up, recording (kind, ms) into latencies"""
+    api = ApiClient(url)
+    rng = random.Random(seed)
+    year = date.today().year
+    stop = time.perf_counter() + seconds
+    while time.perf_counter() < stop:
+        month_num = rng.randint(1, 12)
+        start = time.perf_counter()
+        if rng.random() < write_share:
+            kind = "write"
+            api.request("POST", "/expenses", body={
+                "amount": f"{rng.uniform(1, 80):.2f}", "category": "Food",
+                "date": f"{year}-{month_num:02d}-{rng.randint(1, 28):02d}", "description": "load test"})
+        elif rng.random() < 0.5:
+            kind = "month"
+            api.request("GET", f"/months/{year}/{month_num}")
+        else:
+            kind = "summary"
+            api.request("GET", f"/months/{year}/{month_num}/summary")
+        latencies.append((kind, (time.perf_counter() - start) * 1000))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="100k", help="database size: " + ", ".join(generate.SIZES))
+    parser.add_argument("--data-dir", default=os.path.join(BENCHMARKS, "data"), help="where generated databases are kept")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent client threads")
+    parser.add_argument("--readers", type=int, default=4, help="server reader connections")
+    parser.add_argument("--seconds", type=float, default=10, help="duration of the test")
+    parser.add_argument("--writes", type=float, default=0.2, help="share of requests adding an expense")
+    args = parser.parse_args(argv)
+    
+    source = os.path.join(args.data_dir, f"expenses_{args.size}.db")
+    if not os.path.exists(source):
+        generate.generate(source, generate.SIZES[args.size])
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "expenses.db")
+        shutil.copy(source, path)
+        process, url = start_server(path, args.readers)
+        try:
+            first_version = ApiClient(url).request("GET", "/version")["version"]
+            latencies = []
+            threads = [threading.Thread(target=client_loop, args=(url, args.seconds, args.writes, i, latencies))
+                       for i in range(args.clients)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            batches = ApiClient(url).request("GET", "/version")["version"] - first_version
+        finally:
+            process.terminate()
+            process.wait()
+        
+        conn = database.connect(path)
+        mismatches = database.rollup_mismatches(conn)
+        conn.close()
+    
+    print(f"{args.size} expenses, {args.clients} clients, {args.readers} readers, {elapsed:.1f}s")
+    print(f"{'request':<10}{'count':>8}{'per s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for kind in ("write", "month", "summary"):
+        times = sorted(ms for request, ms in latencies if request == kind)
+        if times:
+            p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+            print(f"{kind:<10}{len(times):>8}{len(times) / elapsed:>10.0f}{statistics.median(times):>10.2f}{p95:>10.2f}")
+    writes = sum(1 for request, ms in latencies if request == "write")
+    if batches:
+        print(f"{batches} write batches, {writes / batches:.1f} expenses per commit")
+    print("rollup matches the expenses" if not mismatches else f"rollup mismatches: {mismatches}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,97 @@
+"""Time the app's queries before and after closed years are archived
+
+Usage: python benchmarks/archive.py [--size 1m] [--keep 2]
+
+A copy of a generated database (see generate.py) is queried, every year but
+the last --keep is moved to archive files with archive.py and the main file
+vacuumed, then the same queries run again. Each query is run a few times and
+the median is printed, so the times are for a warm cache; the main file's
+size shows how much smaller the working set became.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+from datetime import date
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+import archive
+import database
+import generate
+import queries
+import reports
+
+REPEAT = 5
+
+
+def median_ms(function, *args):
+    """Median time of REPEAT calls in milliseconds"""
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        function(*args)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def workload(conn, year):
+    """The timed queries: name -> (function, args)"""
+    old = year - 4
+    return {
+        f"month {year}-03": (queries.load_month, conn, year, 3),
+        f"month {old}-03": (queries.load_month, conn, old, 3),
+        "search page": (queries.search_expenses, conn, {"min_amount": 199.0}),
+        "search page before": (queries.search_expenses, conn, {"min_amount": 199.0}, (f"{old}-06-01", 0), True),
+        f"report {old}-01-15..{year}-02-15": (reports.spent_by_category, conn, f"{old}-01-15", f"{year}-02-15"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="1m", help="database size: " + ", ".join(generate.SIZES))
+    parser.add_argument("--data-dir", default=os.path.join(BENCHMARKS, "data"), help="where generated databases are kept")
+    parser.add_argument("--work-dir", help="where the copy is archived (default: a temporary directory)")
+    parser.add_argument("--keep", type=int, default=2, help="recent years left in the expenses table")
+    args = parser.parse_args(argv)
+    
+    source = os.path.join(args.data_dir, f"expenses_{args.size}.db")
+    if not os.path.exists(source):
+        generate.generate(source, generate.SIZES[args.size])
+    year = date.today().year
+    
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as tmp:
+        path = os.path.join(tmp, "expenses.db")
+        shutil.copy(source, path)
+        conn = database.connect(path)
+        size_before = os.path.getsize(path)
+        before = {name: median_ms(*call) for name, call in workload(conn, year).items()}
+        
+        start = time.perf_counter()
+        moved = archive.archive_through(conn, year - args.keep, year)
+        archive_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        archive.vacuum(conn)
+        vacuum_seconds = time.perf_counter() - start
+        size_after = os.path.getsize(path)
+        
+        after = {name: median_ms(*call) for name, call in workload(conn, year).items()}
+        mismatches = database.rollup_mismatches(conn)
+        conn.close()
+    
+    print(f"{args.size} expenses, {sum(moved.values()):,} archived from {', '.join(map(str, moved))} "
+          f"in {archive_seconds:.1f}s, vacuum {vacuum_seconds:.1f}s")
+    print(f"main file {size_before / 1e6:,.0f} MB -> {size_after / 1e6:,.0f} MB")
+    print(f"{'query':<32}{'before ms':>12}{'after ms':>12}")
+    for name in before:
+        print(f"{name:<32}{before[name]:>12.2f}{after[name]:>12.2f}")
+    print("rollup matches the expenses" if not mismatches else f"rollup mismatches: {mismatches}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,438 @@
+"""Time the ExpenseTracker data paths on synthetic databases
+
+Usage: python benchmarks/data_paths.py [--sizes 10k,100k,1m,10m] [--output FILE]
+       python benchmarks/data_paths.py --compare OLD.json NEW.json
+
+For each size a database is generated once into --data-dir by generate.py and
+reused by later runs. The methods behind refresh_expense_list, update_stats,
+update_chart, show_alerts, sort_by, save_expense and save_budgets run on a real ExpenseTracker with
+mocked Tk widgets, a synchronous executor in place of the database thread and
+an offscreen Agg canvas for the chart, so no display is needed. The numbers
+include the SQL and the Python work of each path but not Tk's own drawing.
+
+Results are written as JSON keyed by size and path; --compare prints the
+ratio between two result files to spot regressions across commits.
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import calendar
+import platform
+import argparse
+import statistics
+import subprocess
+from datetime import datetime
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import charts
+import budgets
+import analytics
+import demo
+import queries
+import reports
+import database
+import generate
+
+
+class Widget:
+    """Stand-in for a label, dialog or other widget that is only configured"""
+    
+    def __init__(self, **options):
+        self.options = options
+    
+    def configure(self, **options):
+        self.options.update(options)
+    
+    def destroy(self):
+        pass
+    
+    def pack(self, **options):
+        pass
+
+
+class Variable:
+    """Stand-in for a tk.StringVar / tk.IntVar"""
+    
+    def __init__(self, value):
+        self.value = value
+    
+    def get(self):
+        return self.value
+    
+    def set(self, value):
+        self.value = value
+
+
+class Tree:
+    """Stand-in for the ttk.Treeview keeping items in display order"""
+    
+    def __init__(self):
+        self.items = []
+        self.values = {}
+    
+    def insert(self, parent, index, iid, values, tags=()):
+        if index == "end":
+            self.items.append(iid)
+        else:
+            self.items.insert(index, iid)
+        self.values[iid] = values
+        return iid
+    
+    def delete(self, *items):
+        dropped = set(items)
+        self.items = [iid for iid in self.items if iid not in dropped]
+        for iid in items:
+            del self.values[iid]
+    
+    def get_children(self, item=""):
+        return tuple(self.items)
+    
+    def yview_moveto(self, fraction):
+        pass
+    
+    def yview_scroll(self, number, what):
+        pass
+    
+    def winfo_ismapped(self):
+        return True
+    
+    def heading(self, column, **options):
+        pass
+
+
+class Messages:
+    """Stand-in for tkinter.messagebox that records what would be shown"""
+    
+    def __init__(self):
+        self.shown = []
+    
+    def showinfo(self, title, message):
+        self.shown.append((title, message))
+    
+    showerror = showwarning = showinfo
+
+
+class SyncExecutor:
+    """Runs QueryExecutor jobs immediately on the calling thread
+    
+    Background jobs are kept in `background` instead, since the app runs them
+    while idle; run_background() runs them when a benchmark needs them done.
+    """
+    
+    busy = 0
+    
+    def __init__(self, conn):
+        self.conn = conn
+        self.background = []
+    
+    def submit(self, key, job, callback, *args, errback=None, background=False):
+        if background:
+            self.background.append((job, callback, args))
+        else:
+            callback(job(self.conn, *args))
+    
+    def run_background(self):
+        jobs, self.background = self.background, []
+        for job, callback, args in jobs:
+            callback(job(self.conn, *args))
+    
+    def cancel(self, key):
+        pass
+    
+    def close(self):
+        pass
+
+
+class OffscreenCanvas(FigureCanvasAgg):
+    """Agg canvas with the FigureCanvasTkAgg calls CategoryChart makes"""
+    
+    def __init__(self, figure, parent):
+        super().__init__(figure)
+    
+    def get_tk_widget(self):
+        return Widget()
+    
+    def draw_idle(self, *args, **kwargs):
+        # Tk would draw on the next idle callback; draw now so it is timed
+        self.draw()
+
+
+def headless_tracker(conn, month, year):
+    """Build an ExpenseTracker on conn with mocked widgets and no Tk root"""
+    tracker = demo.ExpenseTracker.__new__(demo.ExpenseTracker)
+    tracker.root = None
+    tracker.timer = demo.StartupTimer()
+    tracker.startup_report = False
+    tracker.conn = conn
+    tracker.cursor = conn.cursor()
+    tracker.executor = SyncExecutor(conn)
+    tracker.client = None
+    tracker.cached_version = None
+    tracker.month_cache = demo.MonthCache()
+    tracker.recurring_through = None
+    tracker.selected_month = Variable(month)
+    tracker.selected_year = Variable(year)
+    tracker.expense_id = None
+    tracker.list_filters = None
+    tracker.search_filters = None
+    tracker.list_label = Widget()
+    tracker.row_keys = {}
+    tracker.more_above = False
+    tracker.more_below = False
+    tracker.page_pending = False
+    tracker.sort_column = None
+    tracker.sort_descending = False
+    tracker.column_filters = {}
+    tracker.model = None
+    tracker.model_key = None
+    tracker.model_start = 0
+    tracker.showing_model = False
+    tracker.loading_label = Widget()
+    tracker.perf_label = None
+    tracker.expense_tree = Tree()
+    tracker.expense_scrollbar = Widget()
+    tracker.total_label = Widget()
+    tracker.budget_label = Widget()
+    tracker.remaining_label = Widget()
+    tracker.alerts_label = Widget()
+    tracker.chart_frame = Widget()
+    tracker.chart = None
+    tracker.pending_chart = None
+    return tracker
+
+
+def timed(run, repeat, setup=None):
+    """Return timing statistics in milliseconds for calling run() repeat times"""
+    samples = []
+    for i in range(repeat):
+        if setup:
+            setup(i)
+        start = time.perf_counter()
+        run(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "min_ms": round(samples[0], 3),
+        "p90_ms": round(samples[int(0.9 * (len(samples) - 1))], 3),
+        "runs": len(samples),
+    }
+
+
+def bench_paths(path, repeat):
+    """Time every data path against the database at path"""
+    conn = database.connect(path)
+    year = conn.execute("SELECT CAST(substr(MAX(date), 1, 4) AS INTEGER) FROM expenses").fetchone()[0] - 1
+    months = list(calendar.month_name[1:])
+    tracker = headless_tracker(conn, "June", year)
+    month_of = lambda i: months[i % 12]
+    
+    def select(i):
+        tracker.selected_month.set(month_of(i))
+    
+    def refresh_expense_list(i):
+        start_date, end_date = reports.month_range(*tracker.selected_period())
+        tracker.list_filters = {"start_date": start_date, "end_date": end_date}
+        tracker.refresh_expense_list(queries.search_expenses(conn, tracker.list_filters))
+    
+    def next_page(i):
+        items = tracker.expense_tree.get_children()
+        tracker.show_next_page(queries.search_expenses(conn, tracker.list_filters, tracker.row_keys[items[-1]]))
+    
+    def search(filters):
+        def run(i):
+            tracker.list_filters = filters
+            tracker.refresh_expense_list(queries.search_expenses(conn, filters))
+        return run
+    
+    def update_stats(i):
+        tracker.update_stats(queries.load_summary(conn, *tracker.selected_period()))
+    
+    results = {}
+    results["refresh_expense_list"] = timed(refresh_expense_list, repeat, select)
+    tracker.selected_month.set("June")
+    refresh_expense_list(0)
+    results["refresh_expense_list next page"] = timed(next_page, repeat)
+    results["update_stats"] = timed(update_stats, repeat, select)
+    results["month_alerts"] = timed(lambda i: tracker.show_alerts(analytics.month_alerts(conn, *tracker.selected_period())),
+                                    repeat, select)
+    
+    # Search: a rare and a common word, then words combined with filters
+    results["search rare word"] = timed(search({"text": "dentist"}), repeat)
+    results["search common word"] = timed(search({"text": "groceries"}), repeat)
+    results["search filtered"] = timed(search({"text": "uber", "min_amount": 20, "start_date": f"{year}-01-01",
+                                               "end_date": f"{year + 1}-01-01"}), repeat)
+    results["search category and amount"] = timed(search({"category": "Healthcare", "min_amount": 250}), repeat)
+    
+    # Chart: a first render of each month, then revisits served from the cache
+    charts.FigureCanvasTkAgg = OffscreenCanvas
+    tracker.chart = charts.CategoryChart(tracker.chart_frame)
+    chart_data = {}
+    for month in months:
+        tracker.selected_month.set(month)
+        summary = queries.load_summary(conn, *tracker.selected_period())
+        chart_data[month] = [(row["category"], row["spent"]) for row in summary["categories"] if row["count"]]
+    
+    def update_chart(i):
+        tracker.update_chart(chart_data[month_of(i)])
+    
+    results["update_chart"] = timed(update_chart, min(repeat, 12), select)
+    results["update_chart cached"] = timed(update_chart, repeat, select)
+    
+    # Whole month refresh: list, summary and chart together, loaded from the
+    # database and then from the month cache after the prefetch of the
+    # adjacent month has run
+    def select_uncached(i):
+        select(i)
+        tracker.month_cache.clear()
+    
+    def select_prefetched(i):
+        tracker.executor.run_background()
+        select(i)
+    
+    results["refresh_data"] = timed(lambda i: tracker.refresh_data(), repeat, select_uncached)
+    tracker.refresh_data()
+    results["refresh_data next month"] = timed(lambda i: tracker.refresh_data(), repeat, select_prefetched)
+    tracker.executor.background.clear()
+    
+    # Sorting and filtering the month in memory: the first sort reads the
+    # month into a model, later ones only sort it and redraw the first page
+    tracker.selected_month.set("June")
+    
+    def read_model(i):
+        tracker.model = None
+        tracker.sort_by("Amount")
+    
+    def filter_amount(i):
+        tracker.column_filters = {"Amount": ">50" if i % 2 else ">10"}
+        tracker.show_view()
+    
+    results["sort_by read month"] = timed(read_model, min(repeat, 5))
+    results["sort_by"] = timed(lambda i: tracker.sort_by(("Amount", "Category", "Description", "Date")[i % 4]), repeat)
+    results["sort_by next page"] = timed(lambda i: tracker.load_next_page(), repeat)
+    results["filter column"] = timed(filter_amount, repeat)
+    tracker.sort_column = tracker.model = None
+    tracker.column_filters = {}
+    
+    # Writes; added rows are removed again so the database can be reused
+    messages = demo.messagebox = Messages()
+    first_id = conn.execute("SELECT MAX(id) FROM expenses").fetchone()[0]
+    tracker.selected_month.set("June")
+    
+    def add_expense(i):
+        tracker.save_expense(None, "12.34", "Food", f"{year}-06-15", "benchmark", Widget())
+    
+    def edit_expense(i):
+        tracker.save_expense(first_id + 1, f"{20 + i}.00", "Shopping", f"{year}-06-16", "benchmark", Widget())
+    
+    results["save_expense add"] = timed(add_expense, repeat)
+    results["save_expense edit"] = timed(edit_expense, repeat)
+    conn.execute("DELETE FROM expenses WHERE id > ?", (first_id,))
+    conn.commit()
+    
+    results["load budgets"] = timed(lambda i: budgets.load(conn, "June", year), repeat)
+    budget_vars = {category: Variable(str(amount)) for category, amount in budgets.load(conn, "June", year).items()}
+    
+    def save_budgets(i):
+        tracker.save_budgets(budget_vars, "June", year, Widget())
+    
+    # Generated budgets are the same every month, so a year of copies
+    # leaves the database as it was
+    def save_budgets_year(i):
+        tracker.save_budgets(budget_vars, "January", year, Widget(), 12)
+    
+    results["save_budgets"] = timed(save_budgets, repeat)
+    results["save_budgets 12 months"] = timed(save_budgets_year, repeat)
+    errors = [message for message in messages.shown if message[0] != "Success"]
+    if errors:
+        raise RuntimeError(f"unexpected dialog: {errors[0]}")
+    
+    conn.close()
+    return results
+
+
+def current_commit():
+    """Return the checked out commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path):
+    """Print new/old median ratios for every path in two result files"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    print(f"{'size':<6}{'path':<34}{'old (ms)':>10}{'new (ms)':>10}{'ratio':>8}")
+    for size, result in new["sizes"].items():
+        for name, stats in result["paths"].items():
+            before = old["sizes"].get(size, {}).get("paths", {}).get(name)
+            if before is None:
+                continue
+            ratio = stats["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+            flag = "  slower" if ratio > 1.2 else ""
+            print(f"{size:<6}{name:<34}{before['median_ms']:>10.2f}{stats['median_ms']:>10.2f}{ratio:>7.2f}x{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the ExpenseTracker data paths")
+    parser.add_argument("--sizes", default="10k,100k,1m", help="comma separated sizes: " + ", ".join(generate.SIZES))
+    parser.add_argument("--repeat", type=int, default=20, help="runs per path")
+    parser.add_argument("--data-dir", default=os.path.join(BENCHMARKS, "data"), help="where generated databases are kept")
+    parser.add_argument("--regenerate", action="store_true", help="generate the databases even if they exist")
+    parser.add_argument("--output", help="result file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args(argv)
+    
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    
+    commit = current_commit()
+    report = {
+        "commit": commit,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "sizes": {},
+    }
+    
+    for size in args.sizes.lower().split(","):
+        rows = generate.SIZES[size]
+        path = os.path.join(args.data_dir, f"expenses_{size}.db")
+        if args.regenerate or not os.path.exists(path):
+            start = time.perf_counter()
+            generate.generate(path, rows)
+            print(f"Generated {rows:,} expenses in {time.perf_counter() - start:.1f}s")
+        
+        paths = bench_paths(path, args.repeat)
+        report["sizes"][size] = {"rows": rows, "paths": paths}
+        for name, stats in paths.items():
+            print(f"{size:<6}{name:<34}{stats['median_ms']:>10.2f} ms")
+    
+    output = args.output or os.path.join(BENCHMARKS, "results", f"{commit or 'results'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+    print(f"Wrote {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,65 @@
+"""Time exporter.py on synthetic databases and check its memory stays flat
+
+Usage: python benchmarks/export.py [--sizes 100k,1m,10m] [--formats csv,csv.gz,jsonl,parquet]
+
+Each size is exported once per format into a temporary directory, smallest
+first. The peak resident memory of the process is printed after each export;
+it grows with the chunk size, not with the number of rows, so it should stay
+flat across sizes. Parquet is skipped when pyarrow is not installed.
+"""
+import os
+import sys
+import argparse
+import resource
+import tempfile
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+import database
+import exporter
+import generate
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB elsewhere
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100k,1m", help="comma separated sizes: " + ", ".join(generate.SIZES))
+    parser.add_argument("--formats", default="csv,csv.gz,jsonl,parquet", help="file extensions to export to")
+    parser.add_argument("--data-dir", default=os.path.join(BENCHMARKS, "data"), help="where generated databases are kept")
+    parser.add_argument("--output-dir", help="where exports are written (default: a temporary directory)")
+    args = parser.parse_args(argv)
+    
+    formats = args.formats.split(",")
+    if "parquet" in formats:
+        try:
+            import pyarrow
+        except ImportError:
+            print("pyarrow is not installed, skipping parquet")
+            formats.remove("parquet")
+    
+    print(f"{'size':<6}{'format':<10}{'rows':>12}{'seconds':>10}{'rows/s':>12}{'MB':>10}{'peak RSS MB':>14}")
+    with tempfile.TemporaryDirectory(dir=args.output_dir) as tmp:
+        for size in args.sizes.lower().split(","):
+            path = os.path.join(args.data_dir, f"expenses_{size}.db")
+            if not os.path.exists(path):
+                generate.generate(path, generate.SIZES[size])
+            conn = database.connect(path)
+            for extension in formats:
+                output = os.path.join(tmp, f"expenses.{extension}")
+                stats = exporter.export_file(conn, output)
+                print(f"{size:<6}{extension:<10}{stats.rows:>12,}{stats.seconds:>10.1f}{stats.rows_per_second:>12,.0f}"
+                      f"{stats.bytes / 1e6:>10.1f}{peak_rss_mb():>14.0f}")
+                os.remove(output)
+            conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
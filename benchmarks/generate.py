@@ -0,0 +1,134 @@
+"""Generate synthetic expense databases for benchmarks
+
+Usage: python benchmarks/generate.py 1000000 data/bench_1m.db [--years 5]
+
+Rows are written through the original (version 0) schema and the database is
+then migrated, the same path an old data/expenses.db takes. Amounts follow a
+log-normal distribution per category, everyday categories are far more
+frequent than others, and rent and utilities are paid once a month.
+"""
+import os
+import sys
+import time
+import sqlite3
+import calendar
+import argparse
+from datetime import date
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+# category: (share of day-to-day expenses, median amount, log-normal sigma, descriptions)
+EVERYDAY = {
+    "Food": (0.38, 14.0, 0.6, ["Tesco", "Starbucks", "Lunch", "Pizza Hut", "Groceries", "Bakery"]),
+    "Transportation": (0.20, 11.0, 0.7, ["Uber ride", "Lyft", "Bus pass", "Fuel", "Parking", "Train ticket"]),
+    "Shopping": (0.16, 38.0, 0.9, ["Amazon", "Clothes", "Hardware store", "Books", "Electronics"]),
+    "Entertainment": (0.12, 22.0, 0.8, ["Cinema", "Netflix", "Concert", "Spotify", "Bowling"]),
+    "Healthcare": (0.06, 55.0, 0.9, ["Pharmacy", "Dentist", "Doctor visit", "Optician"]),
+    "Other": (0.08, 27.0, 1.0, ["Gift", "Charity", "Haircut", "Post office", "Misc"]),
+}
+
+# category: (day of month, amount, description) paid every month
+MONTHLY = [
+    ("Housing", 1, 1450.0, "Rent"),
+    ("Utilities", 5, 85.0, "Electricity bill"),
+    ("Utilities", 12, 45.0, "Internet"),
+    ("Utilities", 20, 38.0, "Water bill"),
+]
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+CHUNK = 100_000
+
+
+def generate_rows(rows, start_year, end_year, seed=1):
+    """Yield (amount, category, date, description) tuples in chunks of lists"""
+    rng = np.random.default_rng(seed)
+    first_day = date(start_year, 1, 1).toordinal()
+    last_day = date(end_year, 12, 31).toordinal()
+    
+    # Monthly bills take their fixed share first, the rest is day-to-day spending
+    months = [(year, month) for year in range(start_year, end_year + 1) for month in range(1, 13)]
+    bills = [(amount, category, f"{year}-{month:02d}-{day:02d}", description)
+             for year, month in months
+             for category, day, amount, description in MONTHLY]
+    bills = bills[:rows]
+    if bills:
+        yield bills
+    
+    names = list(EVERYDAY)
+    shares = np.array([EVERYDAY[name][0] for name in names])
+    medians = np.array([EVERYDAY[name][1] for name in names])
+    sigmas = np.array([EVERYDAY[name][2] for name in names])
+    
+    remaining = rows - len(bills)
+    while remaining > 0:
+        count = min(CHUNK, remaining)
+        remaining -= count
+        
+        categories = rng.choice(len(names), size=count, p=shares)
+        amounts = np.round(medians[categories] * rng.lognormal(0.0, sigmas[categories]), 2)
+        amounts = np.maximum(amounts, 0.5)
+        days = rng.integers(first_day, last_day + 1, size=count)
+        picks = rng.random(count)
+        
+        chunk = []
+        for category, amount, day, pick in zip(categories.tolist(), amounts.tolist(), days.tolist(), picks.tolist()):
+            name = names[category]
+            descriptions = EVERYDAY[name][3]
+            chunk.append((amount, name, date.fromordinal(day).isoformat(), descriptions[int(pick * len(descriptions))]))
+        yield chunk
+
+
+def generate(path, rows, years=5, end_year=None, seed=1):
+    """Create a database at path with `rows` synthetic expenses and budgets"""
+    end_year = end_year or date.today().year
+    start_year = end_year - years + 1
+    if os.path.exists(path):
+        os.remove(path)
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    
+    conn = sqlite3.connect(path)
+    database.create_tables(conn)
+    database.create_default_categories(conn)
+    for chunk in generate_rows(rows, start_year, end_year, seed):
+        conn.executemany("INSERT INTO expenses (amount, category, date, description) VALUES (?, ?, ?, ?)", chunk)
+    
+    budget_amounts = {"Food": 450, "Transportation": 200, "Shopping": 300, "Entertainment": 150,
+                      "Healthcare": 100, "Other": 120, "Housing": 1450, "Utilities": 180}
+    conn.executemany(
+        "INSERT INTO budgets (category, amount, month, year) VALUES (?, ?, ?, ?)",
+        [(category, amount, calendar.month_name[month], year)
+         for year in range(start_year, end_year + 1)
+         for month in range(1, 13)
+         for category, amount in budget_amounts.items()]
+    )
+    conn.commit()
+    
+    # Build the indexes and rollup in bulk, like an upgraded old database
+    database.migrate(conn)
+    conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic expense database")
+    parser.add_argument("rows", help="number of expenses, or one of " + ", ".join(SIZES))
+    parser.add_argument("path", help="database file to create (overwritten)")
+    parser.add_argument("--years", type=int, default=5, help="years of history ending this year")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    args = parser.parse_args(argv)
+    
+    rows = SIZES.get(args.rows.lower()) or int(args.rows)
+    start = time.perf_counter()
+    generate(args.path, rows, args.years, seed=args.seed)
+    print(f"Wrote {rows:,} expenses to {args.path} in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
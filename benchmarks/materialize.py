@@ -0,0 +1,90 @@
+"""Time materializing years of recurring expenses for hundreds of rules
+
+Usage: python benchmarks/materialize.py [--size 1m] [--rules 300] [--years 5]
+
+A copy of a generated database (see generate.py) gets --rules rules, mostly
+monthly with some weekly, yearly and last business day ones, all starting
+--years ago. The first materialize run adds every occurrence up to today. A
+second run has nothing due. A third run starts every rule from its first
+day again, and its idempotency keys must add nothing.
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from datetime import date
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+import categories
+import database
+import generate
+import recurring
+
+# (frequency, every, share of the rules)
+MIX = [("monthly", 1, 0.6), ("weekly", 1, 0.15), ("weekly", 2, 0.05), ("yearly", 1, 0.1), ("last_business_day", 1, 0.1)]
+
+
+def add_rules(conn, count, years):
+    """Add count rules starting years ago"""
+    rng = random.Random(1)
+    names = categories.sorted_names(conn)
+    frequencies = [(frequency, every) for frequency, every, share in MIX for _ in range(round(share * 100))]
+    today = date.today()
+    for number in range(count):
+        frequency, every = rng.choice(frequencies)
+        start = date(today.year - years, rng.randint(1, 12), rng.randint(1, 28)).isoformat()
+        recurring.add_rule(conn, f"{rng.uniform(5, 1500):.2f}", rng.choice(names), start,
+                           f"Recurring {number}", frequency, every)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="1m", help="database size: " + ", ".join(generate.SIZES))
+    parser.add_argument("--data-dir", default=os.path.join(BENCHMARKS, "data"), help="where generated databases are kept")
+    parser.add_argument("--work-dir", help="where the copy is written (default: a temporary directory)")
+    parser.add_argument("--rules", type=int, default=300, help="number of rules")
+    parser.add_argument("--years", type=int, default=5, help="years of occurrences")
+    args = parser.parse_args(argv)
+    
+    source = os.path.join(args.data_dir, f"expenses_{args.size}.db")
+    if not os.path.exists(source):
+        generate.generate(source, generate.SIZES[args.size])
+    today = date.today().isoformat()
+    
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as tmp:
+        path = os.path.join(tmp, "expenses.db")
+        shutil.copy(source, path)
+        conn = database.connect(path)
+        add_rules(conn, args.rules, args.years)
+        
+        (added, dates), first = timed(recurring.materialize, conn, today)
+        (again, _), second = timed(recurring.materialize, conn, today)
+        with conn:
+            conn.executemany("UPDATE recurring_rules SET next_date = ? WHERE id = ?", [
+                (recurring.first_occurrence(frequency, date.fromisoformat(start)).isoformat(), rule_id)
+                for rule_id, frequency, start in conn.execute("SELECT id, frequency, start_date FROM recurring_rules")])
+        (repeated, _), third = timed(recurring.materialize, conn, today)
+        mismatches = database.rollup_mismatches(conn)
+        conn.close()
+    
+    print(f"{args.size} expenses, {args.rules} rules over {args.years} years")
+    print(f"first run     {added:>8,} added  {first * 1000:>8.0f} ms  ({len(dates):,} days)")
+    print(f"second run    {again:>8,} added  {second * 1000:>8.1f} ms")
+    print(f"from scratch  {repeated:>8,} added  {third * 1000:>8.0f} ms")
+    print("rollup matches the expenses" if not mismatches else f"rollup mismatches: {mismatches}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
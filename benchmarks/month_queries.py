@@ -0,0 +1,108 @@
+"""Time the month queries on a large database before and after the schema migrations
+
+Usage: python benchmarks/month_queries.py [--rows 1000000]
+
+A throwaway database is filled with synthetic expenses using the original
+(version 0) schema, the queries run by the app when a month is opened are
+timed, then database.migrate() is applied and the same queries are timed again.
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import calendar
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+CATEGORIES = ["Food", "Housing", "Transportation", "Entertainment", "Utilities", "Shopping", "Healthcare", "Other"]
+
+
+def fill(conn, rows, years=5):
+    """Insert synthetic expenses spread evenly over the last few years"""
+    first_year = 2024 - years + 1
+    random.seed(1)
+    
+    def generate():
+        for _ in range(rows):
+            year = random.randint(first_year, 2024)
+            month = random.randint(1, 12)
+            day = random.randint(1, 28)
+            yield (round(random.uniform(1, 200), 2), random.choice(CATEGORIES),
+                   f"{year}-{month:02d}-{day:02d}", "synthetic")
+    
+    conn.executemany("INSERT INTO expenses (amount, category, date, description) VALUES (?, ?, ?, ?)", generate())
+    for year in range(first_year, 2025):
+        for month in calendar.month_name[1:]:
+            conn.executemany("INSERT INTO budgets (category, amount, month, year) VALUES (?, ?, ?, ?)",
+                             [(category, 100.0, month, year) for category in CATEGORIES])
+    conn.commit()
+
+
+def month_queries(year, month, category="category", food="Food"):
+    """The statements run when a month is opened, with their parameters
+    
+    category is the category column and food the value naming Food in it;
+    from schema version 5 on they are category_id and Food's id.
+    """
+    start_date = f"{year}-{month:02d}-01"
+    end_date = f"{year + 1}-01-01" if month == 12 else f"{year}-{month + 1:02d}-01"
+    month_name = calendar.month_name[month]
+    return {
+        "list page": (f"""SELECT id, date, {category}, amount, description FROM expenses
+                         WHERE date >= ? AND date < ? ORDER BY date DESC, id DESC LIMIT 200""",
+                      (start_date, end_date)),
+        "total spent": ("SELECT SUM(amount) FROM expenses WHERE date >= ? AND date < ?",
+                        (start_date, end_date)),
+        "by category": (f"SELECT {category}, SUM(amount) FROM expenses WHERE date >= ? AND date < ? GROUP BY {category}",
+                        (start_date, end_date)),
+        "budget total": ("SELECT SUM(amount) FROM budgets WHERE month = ? AND year = ?",
+                         (month_name, year)),
+        "budget lookup": (f"SELECT amount FROM budgets WHERE {category} = ? AND month = ? AND year = ?",
+                          (food, month_name, year)),
+    }
+
+
+def time_queries(conn, queries, repeat=5):
+    """Return the best time in milliseconds for each of the month queries"""
+    results = {}
+    for name, (sql, params) in queries.items():
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            best = min(best, time.perf_counter() - start)
+        results[name] = best * 1000
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="number of synthetic expenses")
+    args = parser.parse_args(argv)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+        database.create_tables(conn)
+        fill(conn, args.rows)
+        
+        before = time_queries(conn, month_queries(2023, 6))
+        start = time.perf_counter()
+        database.migrate(conn)
+        migrate_seconds = time.perf_counter() - start
+        food = conn.execute("SELECT id FROM categories WHERE name = 'Food'").fetchone()[0]
+        after = time_queries(conn, month_queries(2023, 6, "category_id", food))
+        conn.close()
+    
+    print(f"{args.rows:,} expenses, migration took {migrate_seconds:.1f}s")
+    print(f"{'query':<15}{'before (ms)':>14}{'after (ms)':>14}{'speedup':>10}")
+    for name in before:
+        print(f"{name:<15}{before[name]:>14.2f}{after[name]:>14.2f}{before[name] / after[name]:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
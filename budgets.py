@@ -0,0 +1,128 @@
+"""Monthly budgets: loading, saving and bulk copies
+
+Usage:
+    python budgets.py show 2024-03
+    python budgets.py copy 2024-03 [--months 12]
+    python budgets.py set-all 2024-03 AMOUNT [--months N]
+with --db PATH.
+
+budgets has one row per (year, month, category_id), so every write is an
+INSERT ... ON CONFLICT DO UPDATE and a whole dialog, or a year of copies, is
+one batch in one transaction. Months are stored by name ("March") like the
+month selector of the main window.
+"""
+import calendar
+import argparse
+
+import categories
+import database
+from reports import MONTH_NUMBERS
+
+UPSERT = """
+    INSERT INTO budgets (category_id, amount, month, year) VALUES (?, ?, ?, ?)
+    ON CONFLICT (year, month, category_id) DO UPDATE SET amount = excluded.amount
+"""
+
+
+def following_months(month, year, count):
+    """Return (month name, year) for month/year and the count - 1 months after it"""
+    ordinal = year * 12 + MONTH_NUMBERS[month] - 1
+    return [(calendar.month_name[i % 12 + 1], i // 12) for i in range(ordinal, ordinal + count)]
+
+
+def load(conn, month, year):
+    """Return {category: amount} for a month, 0 for categories without a budget"""
+    amounts = dict.fromkeys(categories.sorted_names(conn), 0)
+    names = categories.names(conn)
+    for category_id, amount in conn.execute(
+        "SELECT category_id, amount FROM budgets WHERE year = ? AND month = ?", (year, month)
+    ):
+        # A budget left without a category cannot be shown or edited
+        if category_id in names:
+            amounts[names[category_id]] = amount
+    return amounts
+
+
+def save(conn, month, year, amounts, months=1):
+    """Store {category: amount} for a month and the months - 1 months after it
+    
+    Raises ValueError for a negative amount or an unknown category before
+    anything is written.
+    """
+    category_ids = categories.ids(conn)
+    for category, amount in amounts.items():
+        if category not in category_ids:
+            raise ValueError(f"No category named {category}")
+        if amount < 0:
+            raise ValueError(f"Budget for {category} cannot be negative")
+    
+    with conn:
+        conn.executemany(UPSERT, [
+            (category_ids[category], amount, target_month, target_year)
+            for target_month, target_year in following_months(month, year, months)
+            for category, amount in amounts.items()
+        ])
+
+
+def copy_forward(conn, month, year, months=12):
+    """Apply the budgets of a month to the next months, replacing theirs"""
+    with conn:
+        conn.executemany("""
+            INSERT INTO budgets (category_id, amount, month, year)
+            SELECT category_id, amount, ?, ? FROM budgets WHERE year = ? AND month = ?
+            ON CONFLICT (year, month, category_id) DO UPDATE SET amount = excluded.amount
+        """, [(target_month, target_year, year, month)
+              for target_month, target_year in following_months(month, year, months + 1)[1:]])
+
+
+def set_all(conn, amount, month, year, months=1):
+    """Give every category the same budget for a month and the months - 1 after it"""
+    save(conn, month, year, dict.fromkeys(categories.ids(conn), amount), months)
+
+
+def parse_month(value):
+    """Turn YYYY-MM into (month name, year)"""
+    year, month_num = (int(part) for part in value.split("-"))
+    if not 1 <= month_num <= 12:
+        raise ValueError(f"{value} is not a month")
+    return calendar.month_name[month_num], year
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Show, copy or bulk set monthly budgets")
+    parser.add_argument("--db", default=database.DB_PATH, help="path to the SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("show", help="list the budgets of a month").add_argument("month", metavar="YYYY-MM")
+    copy_parser = commands.add_parser("copy", help="apply a month's budgets to the following months")
+    copy_parser.add_argument("month", metavar="YYYY-MM")
+    copy_parser.add_argument("--months", type=int, default=12, help="number of months to fill")
+    set_parser = commands.add_parser("set-all", help="give every category the same budget")
+    set_parser.add_argument("month", metavar="YYYY-MM")
+    set_parser.add_argument("amount", type=float)
+    set_parser.add_argument("--months", type=int, default=1, help="number of months starting with MONTH")
+    args = parser.parse_args(argv)
+    
+    try:
+        month, year = parse_month(args.month)
+    except ValueError as e:
+        parser.error(f"invalid month: {e}")
+    
+    conn = database.connect(args.db)
+    try:
+        if args.command == "show":
+            for category, amount in load(conn, month, year).items():
+                print(f"{category:<20}{amount:>10.2f}")
+        elif args.command == "copy":
+            copy_forward(conn, month, year, args.months)
+        else:
+            set_all(conn, args.amount, month, year, args.months)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
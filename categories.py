@@ -0,0 +1,175 @@
+"""Expense categories: the id <-> name dictionary, rename and merge
+
+Usage:
+    python categories.py list
+    python categories.py add NAME
+    python categories.py rename OLD NEW
+    python categories.py merge SOURCE TARGET
+with --db PATH.
+
+Expenses, budgets and the monthly rollup refer to categories by id, so
+renaming a category is one row and names are looked up in a small dictionary
+kept per connection instead of being joined or grouped as text. The
+dictionary is reloaded after a change made through this module and whenever
+PRAGMA data_version shows that another connection has committed.
+"""
+import sqlite3
+import argparse
+import threading
+from weakref import WeakKeyDictionary
+
+import database
+
+# Name given to expenses whose category id matches no category. Migration 5
+# leaves a NULL id for rows that had no category; imports file unknown
+# categories under the same name.
+UNKNOWN = "Other"
+
+# Cached dictionaries by connection, dropped when the connection is. The
+# server's threads share this, so it is only touched under the lock.
+_caches = WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+class CategoryCache:
+    """id -> name and name -> id dictionaries for one connection"""
+    
+    def __init__(self):
+        self.version = None
+        self.names = {}
+        self.ids = {}
+    
+    def refresh(self, conn):
+        """Reload the dictionaries if the categories may have changed"""
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self.version:
+            self.names = dict(conn.execute("SELECT id, name FROM categories"))
+            self.ids = {name: category_id for category_id, name in self.names.items()}
+            self.version = version
+        return self
+
+
+def cache(conn):
+    """Return the up to date CategoryCache of a connection opened with database.Connection"""
+    with _caches_lock:
+        entry = _caches.get(conn)
+        if entry is None:
+            entry = _caches[conn] = CategoryCache()
+    return entry.refresh(conn)
+
+
+def invalidate(conn):
+    """Forget the cached dictionary after this connection changed categories"""
+    with _caches_lock:
+        _caches.pop(conn, None)
+
+
+def names(conn):
+    """Return {id: name} for every category"""
+    return cache(conn).names
+
+
+def ids(conn):
+    """Return {name: id} for every category"""
+    return cache(conn).ids
+
+
+def sorted_names(conn):
+    """Return the category names in alphabetical order, as listed in dialogs"""
+    return sorted(cache(conn).ids)
+
+
+def add(conn, name):
+    """Create a category if it does not exist and return its id"""
+    category_id = ids(conn).get(name)
+    if category_id is None:
+        category_id = conn.execute("INSERT INTO categories (name) VALUES (?)", (name,)).lastrowid
+        invalidate(conn)
+    return category_id
+
+
+def rename(conn, old, new):
+    """Rename a category; every expense and budget follows it"""
+    try:
+        with conn:
+            cursor = conn.execute("UPDATE categories SET name = ? WHERE name = ?", (new, old))
+    except sqlite3.IntegrityError:
+        raise ValueError(f"Category {new} already exists")
+    finally:
+        invalidate(conn)
+    if cursor.rowcount == 0:
+        raise ValueError(f"No category named {old}")
+
+
+def merge(conn, source, target):
+    """Move every expense, budget and recurring rule of category source into target and delete source
+    
+    Budgets set for the same month in both categories are added together.
+    Archived expenses are read-only, so a category they use cannot be merged.
+    """
+    category_ids = ids(conn)
+    for name in (source, target):
+        if name not in category_ids:
+            raise ValueError(f"No category named {name}")
+    source_id, target_id = category_ids[source], category_ids[target]
+    if source_id == target_id:
+        return
+    last_year = database.archived_through(conn)
+    if last_year is not None and conn.execute(
+            "SELECT 1 FROM monthly_category_totals WHERE category_id = ? AND month < ? LIMIT 1",
+            (source_id, f"{last_year + 1}")).fetchone():
+        raise ValueError(f"{source} has expenses in archived years; restore them before merging")
+    
+    try:
+        with conn:
+            # The rollup triggers move the monthly totals along with the rows
+            conn.execute("UPDATE expenses SET category_id = ? WHERE category_id = ?", (target_id, source_id))
+            conn.execute("""
+                INSERT INTO budgets (category_id, amount, month, year)
+                SELECT ?, amount, month, year FROM budgets WHERE category_id = ?
+                ON CONFLICT (year, month, category_id) DO UPDATE SET amount = amount + excluded.amount
+            """, (target_id, source_id))
+            conn.execute("DELETE FROM budgets WHERE category_id = ?", (source_id,))
+            conn.execute("UPDATE recurring_rules SET category_id = ? WHERE category_id = ?", (target_id, source_id))
+            conn.execute("DELETE FROM categories WHERE id = ?", (source_id,))
+    finally:
+        invalidate(conn)
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="List, add, rename or merge expense categories")
+    parser.add_argument("--db", default=database.DB_PATH, help="path to the SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list categories with their number of expenses")
+    commands.add_parser("add", help="add a category").add_argument("name")
+    rename_parser = commands.add_parser("rename", help="rename a category")
+    rename_parser.add_argument("old")
+    rename_parser.add_argument("new")
+    merge_parser = commands.add_parser("merge", help="move everything in SOURCE into TARGET")
+    merge_parser.add_argument("source")
+    merge_parser.add_argument("target")
+    args = parser.parse_args(argv)
+    
+    conn = database.connect(args.db)
+    try:
+        if args.command == "list":
+            counts = dict(conn.execute("SELECT category_id, SUM(count) FROM monthly_category_totals GROUP BY category_id"))
+            for category_id, name in sorted(names(conn).items(), key=lambda item: item[1]):
+                print(f"{name:<20}{counts.get(category_id, 0):>10}")
+        elif args.command == "add":
+            add(conn, args.name)
+            conn.commit()
+        elif args.command == "rename":
+            rename(conn, args.old, args.new)
+        else:
+            merge(conn, args.source, args.target)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
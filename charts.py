@@ -0,0 +1,142 @@
+"""Matplotlib charts for the expense tracker
+
+CategoryChart is the spending by category donut in the main window.
+Rendering the pie is the slow part of a refresh, so every rendered chart is
+kept as a pixel snapshot keyed by month, year, category totals and canvas
+size. Showing a month again restores its snapshot with a blit instead of
+rasterizing the figure, and a refresh with unchanged totals does nothing.
+
+TrendChart plots the multi-year series computed by trends.load_trends.
+"""
+from collections import OrderedDict
+
+import numpy as np
+import tkinter as tk
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+import perf
+
+
+class CategoryChart:
+    """Donut chart of category totals drawn into a Tk container"""
+    # Snapshots kept, least recently shown are evicted first (~800 KB each)
+    MAX_CACHED = 24
+    
+    def __init__(self, parent):
+        self.figure = Figure(figsize=(5, 4), dpi=100)
+        self.subplot = self.figure.add_subplot(111)
+        self.canvas = FigureCanvasTkAgg(self.figure, parent)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        if perf.enabled:
+            # Full renders happen in Tk's idle loop, so time them there
+            self.canvas.draw = perf.timed("chart draw", self.canvas.draw)
+        
+        self.snapshots = OrderedDict()
+        self.shown = None
+        # Every full draw (first render of a chart, window resize) is captured
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+    
+    def cache_key(self, chart):
+        """Key a chart by its content and the current canvas size"""
+        return chart + (tuple(self.figure.bbox.bounds),)
+    
+    def show(self, month, year, category_data):
+        """Display the chart for a month, reusing a cached render if possible"""
+        chart = (month, year, tuple(category_data))
+        if chart == self.shown:
+            return
+        
+        self.shown = chart
+        with perf.span("chart plot"):
+            self.plot(month, year, category_data)
+        
+        # The artists are always rebuilt so a later full redraw shows the
+        # right chart, but a cached snapshot saves rasterizing them now
+        snapshot = self.snapshots.get(self.cache_key(chart))
+        if snapshot is not None:
+            self.snapshots.move_to_end(self.cache_key(chart))
+            with perf.span("chart blit"):
+                self.canvas.restore_region(snapshot)
+                self.canvas.blit(self.figure.bbox)
+        else:
+            self.canvas.draw_idle()
+    
+    def plot(self, month, year, category_data):
+        """Build the pie artists for a month without drawing them"""
+        self.subplot.clear()
+        
+        if not category_data:
+            self.subplot.text(0.5, 0.5, "No data for selected period",
+                              horizontalalignment='center', verticalalignment='center')
+            return
+        
+        categories = [item[0] for item in category_data]
+        amounts = [item[1] for item in category_data]
+        
+        # Create pie chart
+        wedges, texts, autotexts = self.subplot.pie(
+            amounts,
+            labels=categories,
+            autopct='%1.1f%%',
+            startangle=90,
+            wedgeprops={'width': 0.5}  # For a donut chart effect
+        )
+        
+        # Make the labels more readable
+        for text in texts:
+            text.set_fontsize(8)
+        for autotext in autotexts:
+            autotext.set_fontsize(8)
+            autotext.set_color('white')
+        
+        self.subplot.set_title(f"Spending by Category ({month} {year})")
+        self.subplot.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle
+    
+    def on_draw(self, event):
+        """Store a snapshot of the chart that was just rendered"""
+        if self.shown is None:
+            return
+        
+        key = self.cache_key(self.shown)
+        self.snapshots[key] = self.canvas.copy_from_bbox(self.figure.bbox)
+        self.snapshots.move_to_end(key)
+        while len(self.snapshots) > self.MAX_CACHED:
+            self.snapshots.popitem(last=False)
+
+
+class TrendChart:
+    """Stacked monthly spending per category with average and budget lines"""
+    
+    def __init__(self, parent):
+        self.figure = Figure(figsize=(8, 4.5), dpi=100)
+        self.subplot = self.figure.add_subplot(111)
+        self.canvas = FigureCanvasTkAgg(self.figure, parent)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+    
+    def show(self, trends, window):
+        """Plot a result of trends.load_trends"""
+        self.subplot.clear()
+        months = trends["months"]
+        x = np.arange(len(months))
+        
+        # One filled polygon per category keeps ten years of months cheap to
+        # draw compared to thousands of individual bars
+        if trends["categories"]:
+            self.subplot.stackplot(x, trends["spend"], labels=trends["categories"], alpha=0.85)
+        self.subplot.plot(x, trends["moving_average"], color="black", linewidth=1.5,
+                          label=f"{window}-month average")
+        if trends["budget"].any():
+            self.subplot.step(x, trends["budget"], where="mid", color="red", linestyle="--",
+                              linewidth=1, label="Budget")
+        
+        # One tick per year
+        ticks = x[::12]
+        self.subplot.set_xticks(ticks)
+        self.subplot.set_xticklabels([months[i][:4] for i in ticks], fontsize=8)
+        self.subplot.set_xlim(x[0], x[-1])
+        self.subplot.set_ylabel("Spent ($)")
+        self.subplot.set_title(f"Monthly Spending ({months[0][:4]}-{months[-1][:4]})")
+        self.subplot.legend(fontsize=7, loc="upper left", ncol=2)
+        
+        self.canvas.draw_idle()
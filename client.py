@@ -0,0 +1,178 @@
+"""Client for server.py, standing in for a local connection in the GUI
+
+ApiClient.call(function, *args) runs the server's equivalent of
+function(conn, *args) for the query and write functions the GUI uses, so
+ExpenseTracker and QueryExecutor treat both modes alike. Results have the
+same shape as the local functions return. Each thread keeps its own
+keep-alive HTTP connection.
+"""
+import json
+import threading
+import http.client
+from urllib.parse import urlencode, urlsplit
+
+import queries
+from reports import MONTH_NUMBERS
+
+
+class ServerError(Exception):
+    """The server failed or could not be reached"""
+
+
+class ApiClient:
+    """Calls the expense functions on a server.py instance"""
+    TIMEOUT = 30
+    
+    def __init__(self, url, token=None, timeout=TIMEOUT):
+        parts = urlsplit(url if "//" in url else f"http://{url}")
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.headers = {"Content-Type": "application/json"}
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
+        self.timeout = timeout
+        self.local = threading.local()
+        # X-Ledger-Version of the latest response
+        self.version = None
+    
+    def request(self, method, path, params=None, body=None):
+        """Send a request and return the decoded JSON answer
+        
+        Raises ValueError for rejected input (400), KeyError for a missing
+        expense (404) and ServerError for anything else that went wrong.
+        """
+        if params:
+            path += "?" + urlencode({name: value for name, value in params.items() if value is not None})
+        data = json.dumps(body).encode() if body is not None else None
+        
+        # A keep-alive connection the server closed is retried once for reads
+        for attempt in range(2):
+            conn = getattr(self.local, "conn", None)
+            if conn is None:
+                conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                conn.request(method, path, body=data, headers=self.headers)
+                response = conn.getresponse()
+                payload = json.loads(response.read() or b"null")
+                break
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                self.local.conn = None
+                if attempt or method != "GET":
+                    raise ServerError(f"{self.host}:{self.port}: {e}")
+        
+        version = response.getheader("X-Ledger-Version")
+        if version is not None:
+            self.version = int(version)
+        if response.status == 400:
+            raise ValueError(payload["error"])
+        if response.status == 404:
+            raise KeyError(payload["error"])
+        if response.status != 200:
+            raise ServerError(f"{response.status}: {payload.get('error') if isinstance(payload, dict) else payload}")
+        return payload
+    
+    def call(self, function, *args):
+        """Run the server's version of function(conn, *args)"""
+        return getattr(self, self.CALLS[f"{function.__module__}.{function.__name__}"])(*args)
+    
+    # queries
+    
+    def load_month(self, year, month_num):
+        data = self.request("GET", f"/months/{year}/{month_num}")
+        data["rows"] = [tuple(row) for row in data["rows"]]
+        return data
+    
+    def load_summary(self, year, month_num):
+        return self.request("GET", f"/months/{year}/{month_num}/summary")
+    
+    def month_alerts(self, year, month_num):
+        return self.request("GET", f"/months/{year}/{month_num}/alerts")
+    
+    def load_expense_model(self, year, month_num):
+        from expense_model import ExpenseModel
+        return ExpenseModel(**self.request("GET", f"/months/{year}/{month_num}/expenses"))
+    
+    def search_expenses(self, filters, key=None, before=False, limit=queries.PAGE_SIZE):
+        params = dict(filters or {}, limit=limit)
+        if key is not None:
+            params["after_date"], params["after_id"] = key
+        if before:
+            params["before"] = 1
+        return [tuple(row) for row in self.request("GET", "/expenses", params)]
+    
+    # expenses
+    
+    def get_expense(self, expense_id):
+        try:
+            expense = self.request("GET", f"/expenses/{expense_id}")
+        except KeyError:
+            return None
+        return tuple(expense[name] for name in ("id", "amount", "category", "date", "description"))
+    
+    def save_expense(self, expense_id, amount_str, category, date_str, description):
+        body = {"amount": amount_str, "category": category, "date": date_str, "description": description}
+        if expense_id:
+            result = self.request("PUT", f"/expenses/{expense_id}", body=body)
+        else:
+            result = self.request("POST", "/expenses", body=body)
+        return result["id"], result["dates"]
+    
+    def delete_expense(self, expense_id):
+        try:
+            return self.request("DELETE", f"/expenses/{expense_id}")["date"]
+        except KeyError:
+            return None
+    
+    # categories and budgets
+    
+    def sorted_names(self):
+        return self.request("GET", "/categories")
+    
+    def load_budgets(self, month, year):
+        return self.request("GET", f"/budgets/{year}/{MONTH_NUMBERS[month]}")
+    
+    def save_budgets(self, month, year, amounts, months=1):
+        self.request("PUT", f"/budgets/{year}/{MONTH_NUMBERS[month]}",
+                     body={"amounts": amounts, "months": months})
+    
+    # recurring expenses
+    
+    def add_rule(self, amount_str, category, start_str, description, frequency, every=1, until=None):
+        return self.request("POST", "/recurring", body={
+            "amount": amount_str, "category": category, "date": start_str, "description": description,
+            "frequency": frequency, "every": every, "until": until})["id"]
+    
+    def materialize(self, through, rule_id=None):
+        result = self.request("POST", "/recurring/materialize", body={"through": through, "rule_id": rule_id})
+        return result["added"], result["dates"]
+    
+    # trends
+    
+    def load_trends(self, start_year, end_year, window=3):
+        import numpy as np
+        data = self.request("GET", "/trends", {"start_year": start_year, "end_year": end_year, "window": window})
+        # null is NaN again, and a range without expenses keeps its (0, months) shape
+        data["spend"] = np.array(data["spend"], dtype=float).reshape(len(data["categories"]), len(data["months"]))
+        for name in ("total", "moving_average", "budget", "variance"):
+            data[name] = np.array(data[name], dtype=float)
+        return data
+    
+    # Local function -> method running it on the server. Keyed by name so the
+    # modules behind optional windows, like trends, are not imported here.
+    CALLS = {
+        "queries.load_month": "load_month",
+        "queries.load_summary": "load_summary",
+        "queries.search_expenses": "search_expenses",
+        "expenses.get_expense": "get_expense",
+        "expenses.save_expense": "save_expense",
+        "expenses.delete_expense": "delete_expense",
+        "categories.sorted_names": "sorted_names",
+        "budgets.load": "load_budgets",
+        "budgets.save": "save_budgets",
+        "recurring.add_rule": "add_rule",
+        "recurring.materialize": "materialize",
+        "trends.load_trends": "load_trends",
+        "analytics.month_alerts": "month_alerts",
+        "expense_model.load_month": "load_expense_model",
+    }
@@ -0,0 +1,489 @@
+"""Database connection and versioned schema migrations for the expense tracker
+
+The schema version is stored in SQLite's PRAGMA user_version. Each entry in
+MIGRATIONS upgrades the database by one version and runs in its own
+transaction, so existing data/expenses.db files are upgraded in place the
+next time they are opened.
+"""
+import os
+import sqlite3
+import argparse
+
+DB_PATH = os.path.join('data', 'expenses.db')
+
+
+class Connection(sqlite3.Connection):
+    """A sqlite3 connection that the per-connection caches can reference weakly
+    
+    Opened by open_connection; sqlite3.Connection itself does not support
+    weak references.
+    """
+
+
+def open_connection(path=DB_PATH, **kwargs):
+    """Open another connection to an existing database, with foreign keys enforced
+    
+    kwargs go to sqlite3.connect. Every connection is opened here or by
+    connect, which also sets up the schema.
+    """
+    conn = sqlite3.connect(path, factory=Connection, **kwargs)
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+
+def connect(path=DB_PATH):
+    """Open the expenses database, creating and upgrading the schema as needed"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    
+    conn = open_connection(path)
+    # WAL lets the background reader run while the main thread writes
+    conn.execute("PRAGMA journal_mode = WAL")
+    create_tables(conn)
+    migrate(conn)
+    create_default_categories(conn)
+    return conn
+
+
+DEFAULT_CATEGORIES = ["Food", "Housing", "Transportation", "Entertainment", "Utilities", "Shopping", "Healthcare", "Other"]
+
+
+def create_default_categories(conn):
+    """Create default expense categories if none exist"""
+    count = conn.execute("SELECT COUNT(*) FROM categories").fetchone()[0]
+    if count == 0:
+        conn.executemany("INSERT INTO categories (name) VALUES (?)", [(name,) for name in DEFAULT_CATEGORIES])
+        conn.commit()
+
+
+def create_tables(conn):
+    """Create the original (version 0) tables if they don't exist"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE
+    )
+    ''')
+    
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS expenses (
+        id INTEGER PRIMARY KEY,
+        amount REAL,
+        category TEXT,
+        date TEXT,
+        description TEXT
+    )
+    ''')
+    
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS budgets (
+        id INTEGER PRIMARY KEY,
+        category TEXT,
+        amount REAL,
+        month TEXT,
+        year INTEGER
+    )
+    ''')
+    
+    conn.commit()
+
+
+def add_query_indexes(conn):
+    """Index expenses by date and make (category, month, year) unique in budgets"""
+    # Month list pages walk this index in (date, id) order
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date)")
+    # Covers the month totals and per-category sums without touching the table
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_expenses_date_category_amount ON expenses (date, category, amount)")
+    
+    # Older versions could store the same budget twice, which inflated the
+    # monthly total. Keep the row save_budgets used to update (the first one).
+    conn.execute("""
+        DELETE FROM budgets
+        WHERE id NOT IN (SELECT MIN(id) FROM budgets GROUP BY category, month, year)
+    """)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_budgets_year_month_category ON budgets (year, month, category)")
+
+
+# Trigger bodies that keep monthly_category_totals in step with expenses.
+# {row} is NEW or OLD depending on which side of the change is applied and
+# {category} the category column, named the same in both tables.
+ROLLUP_ADD = """
+    INSERT INTO monthly_category_totals (month, {category}, total, count)
+    VALUES (substr({row}.date, 1, 7), {row}.{category}, {row}.amount, 1)
+    ON CONFLICT (month, {category}) DO UPDATE
+    SET total = total + excluded.total, count = count + 1;
+"""
+
+ROLLUP_REMOVE = """
+    UPDATE monthly_category_totals
+    SET total = total - {row}.amount, count = count - 1
+    WHERE month = substr({row}.date, 1, 7) AND {category} = {row}.{category};
+    DELETE FROM monthly_category_totals
+    WHERE month = substr({row}.date, 1, 7) AND {category} = {row}.{category} AND count <= 0;
+"""
+
+
+def create_rollup_triggers(conn, category):
+    """Create the triggers maintaining monthly_category_totals, keyed by the category column"""
+    conn.execute(f"""
+        CREATE TRIGGER expenses_rollup_insert AFTER INSERT ON expenses
+        BEGIN {ROLLUP_ADD.format(row="NEW", category=category)} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER expenses_rollup_delete AFTER DELETE ON expenses
+        BEGIN {ROLLUP_REMOVE.format(row="OLD", category=category)} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER expenses_rollup_update AFTER UPDATE OF amount, {category}, date ON expenses
+        BEGIN {ROLLUP_REMOVE.format(row="OLD", category=category)} {ROLLUP_ADD.format(row="NEW", category=category)} END
+    """)
+
+
+def add_monthly_category_totals(conn):
+    """Add the per month and category rollup of expenses, maintained by triggers"""
+    conn.execute("""
+        CREATE TABLE monthly_category_totals (
+            month TEXT NOT NULL,
+            category TEXT NOT NULL,
+            total REAL NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (month, category)
+        ) WITHOUT ROWID
+    """)
+    create_rollup_triggers(conn, "category")
+    rebuild_rollup(conn, "category")
+
+
+def add_import_hash(conn):
+    """Add a content hash column used to skip rows that were already imported"""
+    conn.execute("ALTER TABLE expenses ADD COLUMN import_hash BLOB")
+    # Rows entered by hand have no hash; NULLs never conflict
+    conn.execute("CREATE UNIQUE INDEX idx_expenses_import_hash ON expenses (import_hash)")
+
+
+def create_search_triggers(conn, columns):
+    """Create the triggers keeping expenses_search in step with the indexed columns
+    
+    It is an external content table, so removing a row needs the values that
+    were indexed for it.
+    """
+    names = ", ".join(columns)
+    values = lambda row: ", ".join(f"{row}.{column}" for column in columns)
+    add = lambda row: f"INSERT INTO expenses_search (rowid, {names}) VALUES ({row}.id, {values(row)});"
+    remove = lambda row: (f"INSERT INTO expenses_search (expenses_search, rowid, {names}) "
+                          f"VALUES ('delete', {row}.id, {values(row)});")
+    
+    conn.execute(f"CREATE TRIGGER expenses_search_insert AFTER INSERT ON expenses BEGIN {add('NEW')} END")
+    conn.execute(f"CREATE TRIGGER expenses_search_delete AFTER DELETE ON expenses BEGIN {remove('OLD')} END")
+    conn.execute(f"""
+        CREATE TRIGGER expenses_search_update AFTER UPDATE OF {names} ON expenses
+        BEGIN {remove('OLD')} {add('NEW')} END
+    """)
+
+
+def add_expense_search(conn):
+    """Add an FTS5 index over descriptions and category names plus indexes for search filters"""
+    # Prefix indexes make "ub*" style searches as fast as whole words
+    conn.execute("""
+        CREATE VIRTUAL TABLE expenses_search USING fts5 (
+            description, category,
+            content = 'expenses', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+    """)
+    create_search_triggers(conn, ["description", "category"])
+    rebuild_search(conn)
+    
+    # Searches by category or amount start from these when they narrow the
+    # results down more than the text does
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_expenses_category_date ON expenses (category, date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_expenses_amount ON expenses (amount)")
+
+
+def use_category_ids(conn):
+    """Refer to categories by id in expenses, budgets and the rollup
+    
+    expenses and budgets are rebuilt with a category_id column instead of the
+    name. The search index keeps only descriptions, so renaming a category
+    changes a single row; queries.search_expenses matches names separately.
+    """
+    # Names in use that were never added to categories become categories
+    conn.execute("""
+        INSERT OR IGNORE INTO categories (name)
+        SELECT category FROM expenses WHERE category IS NOT NULL
+        UNION SELECT category FROM budgets WHERE category IS NOT NULL
+    """)
+    
+    # Everything derived from the name column is recreated below
+    for trigger in ("expenses_rollup_insert", "expenses_rollup_delete", "expenses_rollup_update",
+                    "expenses_search_insert", "expenses_search_delete", "expenses_search_update"):
+        conn.execute(f"DROP TRIGGER {trigger}")
+    conn.execute("DROP TABLE expenses_search")
+    conn.execute("DROP TABLE monthly_category_totals")
+    
+    conn.execute("""
+        CREATE TABLE expenses_new (
+            id INTEGER PRIMARY KEY,
+            amount REAL,
+            category_id INTEGER REFERENCES categories (id),
+            date TEXT,
+            description TEXT,
+            import_hash BLOB
+        )
+    """)
+    conn.execute("""
+        INSERT INTO expenses_new (id, amount, category_id, date, description, import_hash)
+        SELECT e.id, e.amount, c.id, e.date, e.description, e.import_hash
+        FROM expenses e LEFT JOIN categories c ON c.name = e.category
+        ORDER BY e.id
+    """)
+    conn.execute("DROP TABLE expenses")
+    conn.execute("ALTER TABLE expenses_new RENAME TO expenses")
+    conn.execute("CREATE INDEX idx_expenses_date ON expenses (date)")
+    conn.execute("CREATE INDEX idx_expenses_date_category_amount ON expenses (date, category_id, amount)")
+    conn.execute("CREATE INDEX idx_expenses_category_date ON expenses (category_id, date)")
+    conn.execute("CREATE INDEX idx_expenses_amount ON expenses (amount)")
+    conn.execute("CREATE UNIQUE INDEX idx_expenses_import_hash ON expenses (import_hash)")
+    
+    conn.execute("""
+        CREATE TABLE budgets_new (
+            id INTEGER PRIMARY KEY,
+            category_id INTEGER REFERENCES categories (id),
+            amount REAL,
+            month TEXT,
+            year INTEGER
+        )
+    """)
+    conn.execute("""
+        INSERT INTO budgets_new (id, category_id, amount, month, year)
+        SELECT b.id, c.id, b.amount, b.month, b.year
+        FROM budgets b LEFT JOIN categories c ON c.name = b.category
+        ORDER BY b.id
+    """)
+    conn.execute("DROP TABLE budgets")
+    conn.execute("ALTER TABLE budgets_new RENAME TO budgets")
+    conn.execute("CREATE UNIQUE INDEX idx_budgets_year_month_category ON budgets (year, month, category_id)")
+    
+    conn.execute("""
+        CREATE TABLE monthly_category_totals (
+            month TEXT NOT NULL,
+            category_id INTEGER NOT NULL,
+            total REAL NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (month, category_id)
+        ) WITHOUT ROWID
+    """)
+    create_rollup_triggers(conn, "category_id")
+    rebuild_rollup(conn)
+    
+    conn.execute("""
+        CREATE VIRTUAL TABLE expenses_search USING fts5 (
+            description,
+            content = 'expenses', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+    """)
+    create_search_triggers(conn, ["description"])
+    rebuild_search(conn)
+
+
+def add_archives(conn):
+    """Add the list of years moved out of expenses into archive files by archive.py
+    
+    path is relative to the directory of the main database.
+    """
+    conn.execute("""
+        CREATE TABLE archives (
+            year INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            max_id INTEGER NOT NULL
+        )
+    """)
+
+
+def add_recurring_rules(conn):
+    """Add the rules recurring.py turns into expenses every week, month or year
+    
+    next_date is the first occurrence not added yet, NULL once a rule has
+    ended. until_date is the last day an occurrence may fall on. Ids are
+    never reused, since the occurrences' idempotency keys include them.
+    """
+    conn.execute("""
+        CREATE TABLE recurring_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            amount REAL NOT NULL,
+            category_id INTEGER NOT NULL REFERENCES categories (id),
+            description TEXT NOT NULL,
+            frequency TEXT NOT NULL,
+            every INTEGER NOT NULL,
+            start_date TEXT NOT NULL,
+            until_date TEXT,
+            next_date TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX idx_recurring_rules_next_date ON recurring_rules (next_date)")
+
+
+# Schema migrations in order. The database's user_version is the number of
+# entries already applied, so only append to this list.
+MIGRATIONS = [
+    add_query_indexes,
+    add_monthly_category_totals,
+    add_import_hash,
+    add_expense_search,
+    use_category_ids,
+    add_archives,
+    add_recurring_rules,
+]
+
+# Migrations that rewrite whole tables; the space they free is returned to
+# the file system with a VACUUM once they are applied
+REWRITES = {use_category_ids}
+
+
+def schema_version(conn):
+    """Return the schema version stored in the database"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply all pending migrations, each in its own transaction"""
+    version = schema_version(conn)
+    pending = MIGRATIONS[version:]
+    for number, migration in enumerate(pending, start=version + 1):
+        conn.execute("BEGIN")
+        try:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+    
+    if REWRITES.intersection(pending):
+        conn.execute("VACUUM")
+    return schema_version(conn)
+
+
+def archived_through(conn):
+    """Return the newest year moved to an archive file, or None
+    
+    Every expense up to the end of that year is archived and read-only.
+    """
+    if schema_version(conn) <= MIGRATIONS.index(add_archives):
+        return None
+    return conn.execute("SELECT MAX(year) FROM archives").fetchone()[0]
+
+
+def rollup_mismatches(conn, tolerance=0.005):
+    """Compare monthly_category_totals with the expenses table and its archives
+    
+    Returns (month, category name, stored total, actual total) for every row
+    that differs; a missing row on either side counts as a total of zero.
+    """
+    # archive imports this module
+    import archive
+    
+    actual = {}
+    for schema in archive.schemas(conn):
+        for month, category_id, total, count in conn.execute(f"""
+            SELECT substr(date, 1, 7), category_id, SUM(amount), COUNT(*)
+            FROM {schema}.expenses
+            GROUP BY 1, 2
+        """):
+            actual[month, category_id] = (total, count)
+    stored = {
+        (month, category_id): (total, count)
+        for month, category_id, total, count in conn.execute(
+            "SELECT month, category_id, total, count FROM monthly_category_totals"
+        )
+    }
+    names = dict(conn.execute("SELECT id, name FROM categories"))
+    
+    mismatches = []
+    for key in sorted(actual.keys() | stored.keys()):
+        stored_total, stored_count = stored.get(key, (0, 0))
+        actual_total, actual_count = actual.get(key, (0, 0))
+        if stored_count != actual_count or abs(stored_total - actual_total) > tolerance:
+            mismatches.append((key[0], names.get(key[1], key[1]), stored_total, actual_total))
+    return mismatches
+
+
+def rebuild_rollup(conn, category="category_id"):
+    """Recompute monthly_category_totals from scratch
+    
+    category is the category column, "category" before schema version 5.
+    Archived months cannot change and keep their totals.
+    """
+    last_year = archived_through(conn)
+    since = "" if last_year is None else f"{last_year + 1}-01"
+    conn.execute("DELETE FROM monthly_category_totals WHERE month >= ?", (since,))
+    conn.execute(f"""
+        INSERT INTO monthly_category_totals (month, {category}, total, count)
+        SELECT substr(date, 1, 7), {category}, SUM(amount), COUNT(*)
+        FROM expenses
+        GROUP BY 1, 2
+    """)
+
+
+def search_index_ok(conn):
+    """Return True if the full-text index matches the expenses table"""
+    # The check is written as an INSERT, so end the transaction it opens
+    try:
+        conn.execute("INSERT INTO expenses_search (expenses_search, rank) VALUES ('integrity-check', 1)")
+    except sqlite3.DatabaseError:
+        return False
+    finally:
+        conn.rollback()
+    return True
+
+
+def rebuild_search(conn):
+    """Reindex every expense in expenses_search"""
+    conn.execute("INSERT INTO expenses_search (expenses_search) VALUES ('rebuild')")
+
+
+def main(argv=None):
+    """Command line entry point: upgrade a database and check or rebuild derived tables"""
+    parser = argparse.ArgumentParser(description="Upgrade the expense database schema")
+    parser.add_argument("--db", default=DB_PATH, help="path to the SQLite database")
+    parser.add_argument("--check-rollup", action="store_true", help="compare the monthly rollup with the expenses")
+    parser.add_argument("--rebuild-rollup", action="store_true", help="recompute the monthly rollup from the expenses")
+    parser.add_argument("--check-search", action="store_true", help="verify the full-text search index")
+    parser.add_argument("--rebuild-search", action="store_true", help="reindex all expenses for search")
+    args = parser.parse_args(argv)
+    
+    conn = connect(args.db)
+    print(f"{args.db}: schema version {schema_version(conn)} of {len(MIGRATIONS)}")
+    
+    if args.rebuild_rollup:
+        with conn:
+            rebuild_rollup(conn)
+        print("Rebuilt monthly_category_totals")
+    
+    if args.rebuild_search:
+        with conn:
+            rebuild_search(conn)
+        print("Rebuilt expenses_search")
+    
+    status = 0
+    if args.check_rollup:
+        mismatches = rollup_mismatches(conn)
+        for month, category, stored, actual in mismatches:
+            print(f"{month} {category}: rollup {stored:.2f}, expenses {actual:.2f}")
+        print(f"{len(mismatches)} mismatched rollup rows")
+        status = 1 if mismatches else 0
+    
+    if args.check_search:
+        ok = search_index_ok(conn)
+        print("Search index ok" if ok else "Search index is out of date, run --rebuild-search")
+        status = status or (0 if ok else 1)
+    
+    conn.close()
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
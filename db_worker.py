@@ -0,0 +1,131 @@
+"""Background database thread for the expense tracker
+
+Queries run on a dedicated thread with its own SQLite connection so the Tk
+mainloop never waits on the disk. Results are handed back to the Tk thread by
+polling a queue with root.after.
+"""
+import queue
+import threading
+from tkinter import messagebox
+
+import database
+import perf
+
+
+class QueryExecutor:
+    """Run jobs on a worker thread and deliver their results on the Tk thread
+    
+    Each job is submitted under a key such as "month". Submitting a new job
+    under the same key supersedes the older one: if the old job has not
+    started yet it is skipped, and if it has, its result is dropped, so only
+    the latest request for a view is ever rendered.
+    
+    Background jobs, such as prefetches, run the same way but do not turn on
+    the busy indicator.
+    
+    With a client.ApiClient, jobs run on the server instead of a local
+    connection: client.call(job, *args) replaces job(conn, *args).
+    """
+    POLL_MS = 20
+    
+    def __init__(self, root, path=database.DB_PATH, on_busy=None, client=None):
+        self.root = root
+        self.path = path
+        self.on_busy = on_busy
+        self.client = client
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.latest = {}
+        self.pending = 0
+        self.busy = 0
+        self.poll_id = None
+        
+        self.thread = threading.Thread(target=self.run, name="db-worker", daemon=True)
+        self.thread.start()
+    
+    def submit(self, key, job, callback, *args, errback=None, background=False):
+        """Queue job(conn, *args) and call callback(result) when it finishes
+        
+        If the job raises, errback(error) is called instead, or an error box
+        is shown when no errback is given.
+        """
+        generation = self.latest.get(key, 0) + 1
+        self.latest[key] = generation
+        self.requests.put((key, generation, job, args, (callback, errback, background)))
+        
+        self.pending += 1
+        if not background:
+            self.busy += 1
+            if self.busy == 1 and self.on_busy:
+                self.on_busy(True)
+        if self.poll_id is None:
+            self.poll_id = self.root.after(self.POLL_MS, self.poll)
+    
+    def cancel(self, key):
+        """Drop any queued or running job submitted under key"""
+        if key in self.latest:
+            self.latest[key] += 1
+    
+    def is_current(self, key, generation):
+        """Whether a job is still the latest one for its key"""
+        return self.latest.get(key) == generation
+    
+    def run(self):
+        """Worker thread: execute queued jobs on the thread's own connection"""
+        conn = perf.trace(database.open_connection(self.path)) if self.client is None else None
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            
+            key, generation, job, args, callback = request
+            if not self.is_current(key, generation):
+                self.results.put((key, generation, callback, None, None))
+                continue
+            
+            try:
+                with perf.span(f"db {key}"):
+                    if self.client is not None:
+                        result = self.client.call(job, *args)
+                    else:
+                        result = job(conn, *args)
+                self.results.put((key, generation, callback, result, None))
+            except Exception as e:
+                self.results.put((key, generation, callback, None, e))
+        if conn is not None:
+            conn.close()
+    
+    def poll(self):
+        """Tk thread: hand finished results to their callbacks"""
+        self.poll_id = None
+        while True:
+            try:
+                key, generation, callback, result, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            
+            self.pending -= 1
+            callback, errback, background = callback
+            if not background:
+                self.busy -= 1
+                if self.busy == 0 and self.on_busy:
+                    self.on_busy(False)
+            if not self.is_current(key, generation):
+                continue
+            if error is None:
+                callback(result)
+            elif errback is not None:
+                errback(error)
+            else:
+                messagebox.showerror("Database Error", str(error))
+        
+        if self.pending and self.poll_id is None:
+            self.poll_id = self.root.after(self.POLL_MS, self.poll)
+    
+    def close(self):
+        """Stop the worker thread and close its connection"""
+        if self.poll_id is not None:
+            self.root.after_cancel(self.poll_id)
+            self.poll_id = None
+        self.requests.put(None)
+        self.thread.join(timeout=1)
@@ -1,527 +1,1187 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
-import sqlite3
-import os
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from datetime import datetime
-import calendar
-
-class ExpenseTracker:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Simple Expense Tracker")
-        self.root.geometry("800x600")
-        self.root.minsize(800, 600)
-        
-        # Set up database
-        self.setup_database()
-        
-        # Create default categories if none exist
-        self.create_default_categories()
-        
-        # Variables
-        self.selected_month = tk.StringVar(value=datetime.now().strftime("%B"))
-        self.selected_year = tk.IntVar(value=datetime.now().year)
-        self.expense_id = None
-        
-        # Create the main UI
-        self.create_ui()
-        
-        # Populate initial data
-        self.refresh_expense_list()
-        self.update_stats()
-    
-    def setup_database(self):
-        """Set up the SQLite database and tables"""
-        if not os.path.exists('data'):
-            os.makedirs('data')
-            
-        self.conn = sqlite3.connect('data/expenses.db')
-        self.cursor = self.conn.cursor()
-        
-        # Create tables if they don't exist
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS categories (
-            id INTEGER PRIMARY KEY,
-            name TEXT UNIQUE
-        )
-        ''')
-        
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS expenses (
-            id INTEGER PRIMARY KEY,
-            amount REAL,
-            category TEXT,
-            date TEXT,
-            description TEXT
-        )
-        ''')
-        
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS budgets (
-            id INTEGER PRIMARY KEY,
-            category TEXT,
-            amount REAL,
-            month TEXT,
-            year INTEGER
-        )
-        ''')
-        
-        self.conn.commit()
-    
-    def create_default_categories(self):
-        """Create default expense categories if none exist"""
-        self.cursor.execute("SELECT COUNT(*) FROM categories")
-        count = self.cursor.fetchone()[0]
-        
-        if count == 0:
-            default_categories = ["Food", "Housing", "Transportation", "Entertainment", "Utilities", "Shopping", "Healthcare", "Other"]
-            for category in default_categories:
-                self.cursor.execute("INSERT INTO categories (name) VALUES (?)", (category,))
-            self.conn.commit()
-    
-    def create_ui(self):
-        """Create the user interface"""
-        # Main frame
-        main_frame = ttk.Frame(self.root, padding=10)
-        main_frame.pack(fill=tk.BOTH, expand=True)
-        
-        # Top frame for controls
-        control_frame = ttk.Frame(main_frame)
-        control_frame.pack(fill=tk.X, pady=(0, 10))
-        
-        # Month and year selection
-        ttk.Label(control_frame, text="Month:").pack(side=tk.LEFT, padx=(0, 5))
-        months = list(calendar.month_name)[1:]
-        month_dropdown = ttk.Combobox(control_frame, textvariable=self.selected_month, values=months, width=10, state="readonly")
-        month_dropdown.pack(side=tk.LEFT, padx=(0, 10))
-        month_dropdown.bind("<<ComboboxSelected>>", lambda e: self.refresh_data())
-        
-        ttk.Label(control_frame, text="Year:").pack(side=tk.LEFT, padx=(0, 5))
-        current_year = datetime.now().year
-        years = list(range(current_year - 5, current_year + 2))
-        year_dropdown = ttk.Combobox(control_frame, textvariable=self.selected_year, values=years, width=6, state="readonly")
-        year_dropdown.pack(side=tk.LEFT)
-        year_dropdown.bind("<<ComboboxSelected>>", lambda e: self.refresh_data())
-        
-        # Buttons for actions
-        add_btn = ttk.Button(control_frame, text="Add Expense", command=self.add_expense)
-        add_btn.pack(side=tk.RIGHT, padx=(5, 0))
-        
-        add_budget_btn = ttk.Button(control_frame, text="Set Budget", command=self.set_budget)
-        add_budget_btn.pack(side=tk.RIGHT, padx=(5, 0))
-        
-        # Left panel for expense list
-        left_frame = ttk.Frame(main_frame)
-        left_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        
-        # Expense list
-        ttk.Label(left_frame, text="Expenses:", font=("", 12, "bold")).pack(anchor=tk.W, pady=(0, 5))
-        
-        # Treeview for expenses
-        columns = ("Date", "Category", "Amount", "Description")
-        self.expense_tree = ttk.Treeview(left_frame, columns=columns, show="headings", height=15)
-        
-        # Define headings
-        for col in columns:
-            self.expense_tree.heading(col, text=col)
-            width = 100 if col != "Description" else 150
-            self.expense_tree.column(col, width=width)
-        
-        self.expense_tree.pack(fill=tk.BOTH, expand=True)
-        self.expense_tree.bind("<Double-1>", self.edit_expense)
-        self.expense_tree.bind("<Delete>", self.delete_selected_expense)
-        
-        # Add scrollbar
-        scrollbar = ttk.Scrollbar(left_frame, orient=tk.VERTICAL, command=self.expense_tree.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.expense_tree.configure(yscrollcommand=scrollbar.set)
-        
-        # Right panel for summary and charts
-        right_frame = ttk.Frame(main_frame)
-        right_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=(10, 0))
-        
-        # Summary section
-        summary_frame = ttk.LabelFrame(right_frame, text="Monthly Summary")
-        summary_frame.pack(fill=tk.X, pady=(0, 10))
-        
-        self.total_label = ttk.Label(summary_frame, text="Total Spent: $0.00")
-        self.total_label.pack(anchor=tk.W, pady=2)
-        
-        self.budget_label = ttk.Label(summary_frame, text="Monthly Budget: $0.00")
-        self.budget_label.pack(anchor=tk.W, pady=2)
-        
-        self.remaining_label = ttk.Label(summary_frame, text="Remaining: $0.00")
-        self.remaining_label.pack(anchor=tk.W, pady=2)
-        
-        # Chart frame
-        chart_frame = ttk.LabelFrame(right_frame, text="Spending by Category")
-        chart_frame.pack(fill=tk.BOTH, expand=True)
-        
-        self.chart_canvas = None
-        self.figure = plt.Figure(figsize=(5, 4), dpi=100)
-        self.chart_subplot = self.figure.add_subplot(111)
-        self.chart_canvas = FigureCanvasTkAgg(self.figure, chart_frame)
-        self.chart_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-    
-    def refresh_data(self):
-        """Refresh all data based on selected month/year"""
-        self.refresh_expense_list()
-        self.update_stats()
-    
-    def refresh_expense_list(self):
-        """Refresh the expense list based on selected month and year"""
-        # Clear current items
-        for item in self.expense_tree.get_children():
-            self.expense_tree.delete(item)
-        
-        # Get month number from name
-        month_num = list(calendar.month_name).index(self.selected_month.get())
-        year = self.selected_year.get()
-        
-        # Format dates for filtering
-        start_date = f"{year}-{month_num:02d}-01"
-        if month_num == 12:
-            end_date = f"{year+1}-01-01"
-        else:
-            end_date = f"{year}-{month_num+1:02d}-01"
-        
-        # Get expenses for the selected month
-        self.cursor.execute("""
-            SELECT id, date, category, amount, description 
-            FROM expenses 
-            WHERE date >= ? AND date < ?
-            ORDER BY date DESC
-        """, (start_date, end_date))
-        
-        expenses = self.cursor.fetchall()
-        
-        # Add to treeview
-        for expense in expenses:
-            id, date, category, amount, description = expense
-            # Format date for display (YYYY-MM-DD to DD/MM/YYYY)
-            display_date = datetime.strptime(date, "%Y-%m-%d").strftime("%d/%m/%Y")
-            self.expense_tree.insert("", "end", values=(display_date, category, f"${amount:.2f}", description), tags=(id,))
-    
-    def update_stats(self):
-        """Update statistics and chart"""
-        month_num = list(calendar.month_name).index(self.selected_month.get())
-        year = self.selected_year.get()
-        
-        # Format dates for filtering
-        start_date = f"{year}-{month_num:02d}-01"
-        if month_num == 12:
-            end_date = f"{year+1}-01-01"
-        else:
-            end_date = f"{year}-{month_num+1:02d}-01"
-        
-        # Calculate total spent
-        self.cursor.execute("""
-            SELECT SUM(amount) FROM expenses 
-            WHERE date >= ? AND date < ?
-        """, (start_date, end_date))
-        
-        total_spent = self.cursor.fetchone()[0] or 0
-        
-        # Get monthly budget
-        self.cursor.execute("""
-            SELECT SUM(amount) FROM budgets 
-            WHERE month = ? AND year = ?
-        """, (self.selected_month.get(), year))
-        
-        monthly_budget = self.cursor.fetchone()[0] or 0
-        remaining = monthly_budget - total_spent
-        
-        # Update labels
-        self.total_label.configure(text=f"Total Spent: ${total_spent:.2f}")
-        self.budget_label.configure(text=f"Monthly Budget: ${monthly_budget:.2f}")
-        self.remaining_label.configure(text=f"Remaining: ${remaining:.2f}")
-        
-        # Set label color based on budget status
-        if remaining < 0:
-            self.remaining_label.configure(foreground="red")
-        else:
-            self.remaining_label.configure(foreground="green")
-        
-        # Update chart
-        self.update_chart(start_date, end_date)
-    
-    def update_chart(self, start_date, end_date):
-        """Update the pie chart showing expenses by category"""
-        self.chart_subplot.clear()
-        
-        # Get expenses by category
-        self.cursor.execute("""
-            SELECT category, SUM(amount) 
-            FROM expenses 
-            WHERE date >= ? AND date < ?
-            GROUP BY category
-        """, (start_date, end_date))
-        
-        category_data = self.cursor.fetchall()
-        
-        if not category_data:
-            self.chart_subplot.text(0.5, 0.5, "No data for selected period", 
-                                 horizontalalignment='center', verticalalignment='center')
-        else:
-            categories = [item[0] for item in category_data]
-            amounts = [item[1] for item in category_data]
-            
-            # Create pie chart
-            wedges, texts, autotexts = self.chart_subplot.pie(
-                amounts, 
-                labels=categories, 
-                autopct='%1.1f%%',
-                startangle=90,
-                wedgeprops={'width': 0.5}  # For a donut chart effect
-            )
-            
-            # Make the labels more readable
-            for text in texts:
-                text.set_fontsize(8)
-            for autotext in autotexts:
-                autotext.set_fontsize(8)
-                autotext.set_color('white')
-            
-            self.chart_subplot.set_title(f"Spending by Category ({self.selected_month.get()} {self.selected_year.get()})")
-            self.chart_subplot.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle
-        
-        # Redraw the canvas
-        self.chart_canvas.draw()
-    
-    def add_expense(self):
-        """Open a dialog to add a new expense"""
-        self.open_expense_dialog()
-    
-    def edit_expense(self, event):
-        """Open a dialog to edit the selected expense"""
-        selected_item = self.expense_tree.selection()
-        if not selected_item:
-            return
-        
-        item_id = self.expense_tree.item(selected_item)['tags'][0]
-        self.cursor.execute("SELECT * FROM expenses WHERE id = ?", (item_id,))
-        expense = self.cursor.fetchone()
-        
-        if expense:
-            self.expense_id = expense[0]
-            self.open_expense_dialog(expense)
-    
-    def delete_selected_expense(self, event):
-        """Delete the selected expense"""
-        selected_item = self.expense_tree.selection()
-        if not selected_item:
-            return
-        
-        item_id = self.expense_tree.item(selected_item)['tags'][0]
-        
-        if messagebox.askyesno("Delete Expense", "Are you sure you want to delete this expense?"):
-            self.cursor.execute("DELETE FROM expenses WHERE id = ?", (item_id,))
-            self.conn.commit()
-            self.refresh_data()
-    
-    def open_expense_dialog(self, expense=None):
-        """Open dialog to add or edit an expense"""
-        dialog = tk.Toplevel(self.root)
-        dialog.title("Add Expense" if not expense else "Edit Expense")
-        dialog.geometry("400x300")
-        dialog.transient(self.root)
-        dialog.grab_set()
-        
-        dialog_frame = ttk.Frame(dialog, padding=20)
-        dialog_frame.pack(fill=tk.BOTH, expand=True)
-        
-        # Get categories for dropdown
-        self.cursor.execute("SELECT name FROM categories ORDER BY name")
-        categories = [row[0] for row in self.cursor.fetchall()]
-        
-        # Amount
-        ttk.Label(dialog_frame, text="Amount ($):").grid(row=0, column=0, sticky=tk.W, pady=5)
-        amount_var = tk.StringVar(value=str(expense[1]) if expense else "")
-        amount_entry = ttk.Entry(dialog_frame, textvariable=amount_var, width=15)
-        amount_entry.grid(row=0, column=1, sticky=tk.W, pady=5)
-        
-        # Category
-        ttk.Label(dialog_frame, text="Category:").grid(row=1, column=0, sticky=tk.W, pady=5)
-        category_var = tk.StringVar(value=expense[2] if expense else categories[0])
-        category_dropdown = ttk.Combobox(dialog_frame, textvariable=category_var, values=categories, state="readonly", width=15)
-        category_dropdown.grid(row=1, column=1, sticky=tk.W, pady=5)
-        
-        # Date
-        ttk.Label(dialog_frame, text="Date (YYYY-MM-DD):").grid(row=2, column=0, sticky=tk.W, pady=5)
-        if expense:
-            default_date = expense[3]
-        else:
-            default_date = datetime.now().strftime("%Y-%m-%d")
-        date_var = tk.StringVar(value=default_date)
-        date_entry = ttk.Entry(dialog_frame, textvariable=date_var, width=15)
-        date_entry.grid(row=2, column=1, sticky=tk.W, pady=5)
-        
-        # Description
-        ttk.Label(dialog_frame, text="Description:").grid(row=3, column=0, sticky=tk.W, pady=5)
-        description_var = tk.StringVar(value=expense[4] if expense else "")
-        description_entry = ttk.Entry(dialog_frame, textvariable=description_var, width=30)
-        description_entry.grid(row=3, column=1, sticky=tk.W, pady=5)
-        
-        # Buttons
-        button_frame = ttk.Frame(dialog_frame)
-        button_frame.grid(row=4, column=0, columnspan=2, pady=20)
-        
-        ttk.Button(
-            button_frame, 
-            text="Save", 
-            command=lambda: self.save_expense(
-                expense[0] if expense else None,
-                amount_var.get(),
-                category_var.get(),
-                date_var.get(),
-                description_var.get(),
-                dialog
-            )
-        ).pack(side=tk.LEFT, padx=5)
-        
-        ttk.Button(
-            button_frame,
-            text="Cancel",
-            command=dialog.destroy
-        ).pack(side=tk.LEFT, padx=5)
-        
-        # Focus on amount entry
-        amount_entry.focus_set()
-    
-    def save_expense(self, id, amount_str, category, date_str, description, dialog):
-        """Save the expense to database"""
-        # Validate input
-        try:
-            amount = float(amount_str)
-            if amount <= 0:
-                raise ValueError("Amount must be positive")
-                
-            # Validate date format
-            datetime.strptime(date_str, "%Y-%m-%d")
-            
-        except ValueError as e:
-            messagebox.showerror("Invalid Input", str(e))
-            return
-        
-        # Save to database
-        if id:  # Update existing
-            self.cursor.execute(
-                "UPDATE expenses SET amount = ?, category = ?, date = ?, description = ? WHERE id = ?",
-                (amount, category, date_str, description, id)
-            )
-        else:  # Add new
-            self.cursor.execute(
-                "INSERT INTO expenses (amount, category, date, description) VALUES (?, ?, ?, ?)",
-                (amount, category, date_str, description)
-            )
-        
-        self.conn.commit()
-        dialog.destroy()
-        self.refresh_data()
-    
-    def set_budget(self):
-        """Set budget for categories"""
-        budget_dialog = tk.Toplevel(self.root)
-        budget_dialog.title("Set Budget")
-        budget_dialog.geometry("400x400")
-        budget_dialog.transient(self.root)
-        budget_dialog.grab_set()
-        
-        dialog_frame = ttk.Frame(budget_dialog, padding=20)
-        dialog_frame.pack(fill=tk.BOTH, expand=True)
-        
-        # Month and year selection (same as current view)
-        month = self.selected_month.get()
-        year = self.selected_year.get()
-        
-        ttk.Label(dialog_frame, text=f"Setting Budget for {month} {year}", font=("", 12, "bold")).pack(anchor=tk.W, pady=(0, 15))
-        
-        # Get categories
-        self.cursor.execute("SELECT name FROM categories ORDER BY name")
-        categories = self.cursor.fetchall()
-        
-        # Create input fields for each category
-        budget_vars = {}
-        
-        for i, (category,) in enumerate(categories):
-            frame = ttk.Frame(dialog_frame)
-            frame.pack(fill=tk.X, pady=2)
-            
-            ttk.Label(frame, text=category, width=15).pack(side=tk.LEFT)
-            
-            # Get existing budget if any
-            self.cursor.execute(
-                "SELECT amount FROM budgets WHERE category = ? AND month = ? AND year = ?",
-                (category, month, year)
-            )
-            existing = self.cursor.fetchone()
-            default_amount = existing[0] if existing else 0
-            
-            var = tk.StringVar(value=str(default_amount))
-            budget_vars[category] = var
-            
-            ttk.Entry(frame, textvariable=var, width=10).pack(side=tk.LEFT, padx=5)
-            ttk.Label(frame, text="$").pack(side=tk.LEFT)
-        
-        # Buttons
-        button_frame = ttk.Frame(dialog_frame)
-        button_frame.pack(pady=20)
-        
-        ttk.Button(
-            button_frame,
-            text="Save All",
-            command=lambda: self.save_budgets(budget_vars, month, year, budget_dialog)
-        ).pack(side=tk.LEFT, padx=5)
-        
-        ttk.Button(
-            button_frame,
-            text="Cancel",
-            command=budget_dialog.destroy
-        ).pack(side=tk.LEFT, padx=5)
-    
-    def save_budgets(self, budget_vars, month, year, dialog):
-        """Save budgets for all categories"""
-        try:
-            for category, var in budget_vars.items():
-                amount = float(var.get())
-                if amount < 0:
-                    raise ValueError(f"Budget for {category} cannot be negative")
-                
-                # Check if budget exists
-                self.cursor.execute(
-                    "SELECT id FROM budgets WHERE category = ? AND month = ? AND year = ?",
-                    (category, month, year)
-                )
-                existing = self.cursor.fetchone()
-                
-                if existing:
-                    self.cursor.execute(
-                        "UPDATE budgets SET amount = ? WHERE id = ?",
-                        (amount, existing[0])
-                    )
-                else:
-                    self.cursor.execute(
-                        "INSERT INTO budgets (category, amount, month, year) VALUES (?, ?, ?, ?)",
-                        (category, amount, month, year)
-                    )
-            
-            self.conn.commit()
-            dialog.destroy()
-            self.update_stats()
-            messagebox.showinfo("Success", "Budgets saved successfully!")
-            
-        except ValueError as e:
-            messagebox.showerror("Invalid Input", str(e))
-    
-    def __del__(self):
-        """Clean up database connection when app closes"""
-        if hasattr(self, 'conn'):
-            self.conn.close()
-
-if __name__ == "__main__":
-    root = tk.Tk()
-    app = ExpenseTracker(root)
-    root.mainloop()
+import time
+STARTED = time.perf_counter()
+
+import tkinter as tk
+from tkinter import ttk, messagebox, simpledialog, filedialog
+import sqlite3
+import os
+import sys
+from datetime import date, datetime, timedelta
+import calendar
+
+import budgets
+import categories
+import database
+import expenses
+import exporter
+import importer
+import perf
+import queries
+import recurring
+from month_cache import MonthCache, adjacent_months, month_of
+import reports
+from db_worker import QueryExecutor
+
+# Errors a write can meet: a locked or failing database, or in client mode
+# the server; client is only imported with --server
+WRITE_ERRORS = (sqlite3.Error,)
+
+class StartupTimer:
+    """Record how long each startup phase takes"""
+    def __init__(self, started=STARTED):
+        self.last = self.started = started
+        self.phases = {}
+    
+    def mark(self, phase):
+        """End the current phase, naming it"""
+        now = time.perf_counter()
+        self.phases[phase] = now - self.last
+        self.last = now
+    
+    def report(self):
+        """Return the phases and the total as printable lines"""
+        lines = [f"{phase:<14}{seconds * 1000:8.1f} ms" for phase, seconds in self.phases.items()]
+        lines.append(f"{'total':<14}{(self.last - self.started) * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+class ExpenseTracker:
+    # Rows fetched per keyset page, and how many pages the expense list keeps
+    # loaded at once. Rows further away are dropped and re-fetched on demand.
+    PAGE_SIZE = queries.PAGE_SIZE
+    MAX_PAGES = 3
+    COLUMNS = ("Date", "Category", "Amount", "Description")
+    # Alerts listed in the summary panel; the rest are counted
+    MAX_ALERTS = 4
+    
+    def __init__(self, root, timer=None, startup_report=False, client=None):
+        self.root = root
+        self.timer = timer or StartupTimer()
+        self.startup_report = startup_report
+        # A client.ApiClient when the ledger is shared through server.py
+        self.client = client
+        self.root.title("Simple Expense Tracker")
+        self.root.geometry("800x600")
+        self.root.minsize(800, 600)
+        
+        # Set up database
+        self.setup_database()
+        self.executor = QueryExecutor(self.root, on_busy=self.show_loading, client=client)
+        # Months viewed or prefetched recently, shown without querying, and
+        # the server's ledger version they were loaded at in client mode
+        self.month_cache = MonthCache()
+        self.cached_version = None
+        # Last day recurring expenses were added through in this session
+        self.recurring_through = None
+        self.timer.mark("database")
+        
+        # Variables
+        self.selected_month = tk.StringVar(value=datetime.now().strftime("%B"))
+        self.selected_year = tk.IntVar(value=datetime.now().year)
+        self.expense_id = None
+        
+        # Paging state for the expense list; list_filters are the
+        # queries.search_expenses filters of the rows being shown
+        self.list_filters = None
+        self.search_filters = None
+        self.row_keys = {}
+        self.more_above = False
+        self.more_below = False
+        self.page_pending = False
+        
+        # Sort column and {column: filter text} of the month's expense list.
+        # While either is set the list shows an expense_model.ExpenseModel of
+        # the month, read once and then sorted and filtered in memory;
+        # model_key is the (year, month, cache version) it was read at and
+        # model_start the view row at the top of the list.
+        self.sort_column = None
+        self.sort_descending = False
+        self.column_filters = {}
+        self.model = None
+        self.model_key = None
+        self.model_start = 0
+        self.showing_model = False
+        
+        # Create the main UI
+        self.create_ui()
+        self.timer.mark("ui")
+        
+        # matplotlib is the slowest import by far, so the chart is only
+        # created once the window and expense list have been painted
+        self.chart = None
+        self.pending_chart = None
+        self.root.after(0, self.finish_startup)
+        
+        # Populate initial data in the background
+        self.refresh_data()
+    
+    def setup_database(self):
+        """Set up the SQLite database and tables"""
+        # Creates data/expenses.db and the default categories if needed and
+        # applies pending migrations; a client has no local database
+        if self.client is not None:
+            self.conn = self.cursor = None
+            return
+        self.conn = perf.trace(database.connect())
+        self.cursor = self.conn.cursor()
+    
+    def call(self, function, *args):
+        """Run function(conn, *args) on the local database or through the server"""
+        if self.client is not None:
+            return self.client.call(function, *args)
+        return function(self.conn, *args)
+    
+    def create_ui(self):
+        """Create the user interface"""
+        # Breakdown of the last refresh, only when started with --perf
+        self.perf_label = None
+        if perf.enabled:
+            self.perf_label = ttk.Label(self.root, text="", foreground="gray", padding=(10, 0, 10, 5))
+            self.perf_label.pack(side=tk.BOTTOM, fill=tk.X)
+        
+        # Main frame
+        main_frame = ttk.Frame(self.root, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Top frame for controls
+        control_frame = ttk.Frame(main_frame)
+        control_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        # Month and year selection
+        ttk.Label(control_frame, text="Month:").pack(side=tk.LEFT, padx=(0, 5))
+        months = list(calendar.month_name)[1:]
+        month_dropdown = ttk.Combobox(control_frame, textvariable=self.selected_month, values=months, width=10, state="readonly")
+        month_dropdown.pack(side=tk.LEFT, padx=(0, 10))
+        month_dropdown.bind("<<ComboboxSelected>>", lambda e: self.refresh_data())
+        
+        ttk.Label(control_frame, text="Year:").pack(side=tk.LEFT, padx=(0, 5))
+        current_year = datetime.now().year
+        years = list(range(current_year - 5, current_year + 2))
+        year_dropdown = ttk.Combobox(control_frame, textvariable=self.selected_year, values=years, width=6, state="readonly")
+        year_dropdown.pack(side=tk.LEFT)
+        year_dropdown.bind("<<ComboboxSelected>>", lambda e: self.refresh_data())
+        
+        # Shown while the database thread is working
+        self.loading_label = ttk.Label(control_frame, text="", foreground="gray")
+        self.loading_label.pack(side=tk.LEFT, padx=(10, 0))
+        
+        # Buttons for actions
+        add_btn = ttk.Button(control_frame, text="Add Expense", command=self.add_expense)
+        add_btn.pack(side=tk.RIGHT, padx=(5, 0))
+        
+        add_budget_btn = ttk.Button(control_frame, text="Set Budget", command=self.set_budget)
+        add_budget_btn.pack(side=tk.RIGHT, padx=(5, 0))
+        
+        import_btn = ttk.Button(control_frame, text="Import...", command=self.import_expenses)
+        import_btn.pack(side=tk.RIGHT, padx=(5, 0))
+        
+        export_btn = ttk.Button(control_frame, text="Export...", command=self.export_expenses)
+        export_btn.pack(side=tk.RIGHT, padx=(5, 0))
+        if self.client is not None:
+            # Imports and exports stream between a local file and the local database
+            import_btn.state(["disabled"])
+            export_btn.state(["disabled"])
+        
+        trends_btn = ttk.Button(control_frame, text="Trends...", command=self.open_trends)
+        trends_btn.pack(side=tk.RIGHT, padx=(5, 0))
+        
+        self.create_search_bar(main_frame)
+        
+        # Left panel for expense list
+        left_frame = ttk.Frame(main_frame)
+        left_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        # Expense list
+        self.list_label = ttk.Label(left_frame, text="Expenses:", font=("", 12, "bold"))
+        self.list_label.pack(anchor=tk.W, pady=(0, 5))
+        
+        # Treeview for expenses
+        self.expense_tree = ttk.Treeview(left_frame, columns=self.COLUMNS, show="headings", height=15)
+        
+        # Define headings; a click sorts by the column, a right click filters it
+        for col in self.COLUMNS:
+            self.expense_tree.heading(col, text=col, command=lambda column=col: self.sort_by(column))
+            width = 100 if col != "Description" else 150
+            self.expense_tree.column(col, width=width)
+        
+        self.expense_tree.pack(fill=tk.BOTH, expand=True)
+        self.expense_tree.bind("<Double-1>", self.edit_expense)
+        self.expense_tree.bind("<Delete>", self.delete_selected_expense)
+        self.expense_tree.bind("<Button-3>", self.filter_column)
+        
+        # Add scrollbar
+        self.expense_scrollbar = ttk.Scrollbar(left_frame, orient=tk.VERTICAL, command=self.expense_tree.yview)
+        self.expense_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.expense_tree.configure(yscrollcommand=self.on_expense_scroll)
+        
+        # Right panel for summary and charts
+        right_frame = ttk.Frame(main_frame)
+        right_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=(10, 0))
+        
+        # Summary section
+        summary_frame = ttk.LabelFrame(right_frame, text="Monthly Summary")
+        summary_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        self.total_label = ttk.Label(summary_frame, text="Total Spent: $0.00")
+        self.total_label.pack(anchor=tk.W, pady=2)
+        
+        self.budget_label = ttk.Label(summary_frame, text="Monthly Budget: $0.00")
+        self.budget_label.pack(anchor=tk.W, pady=2)
+        
+        self.remaining_label = ttk.Label(summary_frame, text="Remaining: $0.00")
+        self.remaining_label.pack(anchor=tk.W, pady=2)
+        
+        # Overruns, unusual days and duplicate charges found by analytics.py
+        self.alerts_label = ttk.Label(summary_frame, text="", wraplength=360, justify=tk.LEFT)
+        self.alerts_label.pack(anchor=tk.W, pady=2)
+        
+        # Chart frame
+        self.chart_frame = ttk.LabelFrame(right_frame, text="Spending by Category")
+        self.chart_frame.pack(fill=tk.BOTH, expand=True)
+        
+        self.chart_placeholder = ttk.Label(self.chart_frame, text="Loading chart...", foreground="gray")
+        self.chart_placeholder.pack(expand=True)
+    
+    def create_search_bar(self, parent):
+        """Create the search and filter controls above the expense list"""
+        search_frame = ttk.Frame(parent)
+        search_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        self.search_text = tk.StringVar()
+        self.search_category = tk.StringVar(value="All")
+        self.search_min = tk.StringVar()
+        self.search_max = tk.StringVar()
+        self.search_from = tk.StringVar()
+        self.search_to = tk.StringVar()
+        
+        ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT, padx=(0, 5))
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_text, width=18)
+        search_entry.pack(side=tk.LEFT, padx=(0, 10))
+        
+        ttk.Label(search_frame, text="Category:").pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Combobox(search_frame, textvariable=self.search_category, values=["All"] + self.call(categories.sorted_names),
+                     width=12, state="readonly").pack(side=tk.LEFT, padx=(0, 10))
+        
+        ttk.Label(search_frame, text="Amount:").pack(side=tk.LEFT, padx=(0, 5))
+        min_entry = ttk.Entry(search_frame, textvariable=self.search_min, width=7)
+        min_entry.pack(side=tk.LEFT)
+        ttk.Label(search_frame, text="to").pack(side=tk.LEFT, padx=3)
+        max_entry = ttk.Entry(search_frame, textvariable=self.search_max, width=7)
+        max_entry.pack(side=tk.LEFT, padx=(0, 10))
+        
+        ttk.Label(search_frame, text="Dates:").pack(side=tk.LEFT, padx=(0, 5))
+        from_entry = ttk.Entry(search_frame, textvariable=self.search_from, width=10)
+        from_entry.pack(side=tk.LEFT)
+        ttk.Label(search_frame, text="to").pack(side=tk.LEFT, padx=3)
+        to_entry = ttk.Entry(search_frame, textvariable=self.search_to, width=10)
+        to_entry.pack(side=tk.LEFT)
+        
+        for entry in (search_entry, min_entry, max_entry, from_entry, to_entry):
+            entry.bind("<Return>", lambda e: self.run_search())
+        
+        ttk.Button(search_frame, text="Clear", command=self.clear_search).pack(side=tk.RIGHT, padx=(5, 0))
+        ttk.Button(search_frame, text="Search", command=self.run_search).pack(side=tk.RIGHT, padx=(5, 0))
+    
+    def finish_startup(self):
+        """Paint the window, then import matplotlib and create the chart"""
+        self.root.update_idletasks()
+        self.timer.mark("first paint")
+        
+        from charts import CategoryChart
+        self.timer.mark("chart import")
+        
+        self.chart_placeholder.destroy()
+        self.chart = CategoryChart(self.chart_frame)
+        if self.pending_chart is not None:
+            self.update_chart(self.pending_chart)
+        self.timer.mark("chart")
+        self.check_startup_done()
+        self.refresh_alerts()
+    
+    def check_startup_done(self):
+        """Print the startup report once the chart and first month are shown"""
+        phases = self.timer.phases
+        if self.startup_report and "chart" in phases and "first data" in phases:
+            print(self.timer.report())
+            self.startup_report = False
+    
+    def refresh_data(self):
+        """Refresh all data based on selected month/year"""
+        year, month_num = self.selected_period()
+        perf.begin(f"{self.selected_month.get()} {year}" if self.search_filters is None else "Search")
+        self.materialize_recurring(recurring.due_through(year, month_num))
+        
+        # Queries run on the database thread; a newer selection supersedes
+        # this one, and any list page still loading belongs to the old list
+        self.page_pending = False
+        self.executor.cancel("page")
+        self.executor.cancel("summary")
+        self.executor.cancel("search")
+        self.executor.cancel("model")
+        
+        if self.client is not None and self.client.version != self.cached_version:
+            # Another client wrote since the cached months were loaded
+            self.month_cache.clear()
+            self.cached_version = self.client.version
+        
+        cached = self.month_cache.get(year, month_num)
+        if cached is not None:
+            self.executor.cancel("month")
+        
+        if self.search_filters is None:
+            start_date, end_date = reports.month_range(year, month_num)
+            self.list_filters = {"start_date": start_date, "end_date": end_date}
+            self.list_label.configure(text="Expenses:")
+            if self.sort_column is not None or self.column_filters:
+                self.show_view()
+                if cached is not None:
+                    self.show_summary(cached["summary"])
+                else:
+                    self.executor.submit("month", queries.load_summary, self.show_summary, year, month_num)
+            elif cached is not None:
+                self.show_month(cached)
+            else:
+                self.executor.submit("month", queries.load_month, self.cache_month(year, month_num, self.show_month),
+                                     year, month_num)
+        else:
+            # The summary panel keeps showing the selected month
+            self.list_filters = self.search_filters
+            self.list_label.configure(text="Search results:")
+            self.update_headings()
+            self.executor.submit("search", queries.search_expenses, self.refresh_expense_list, self.list_filters)
+            if cached is not None:
+                self.show_summary(cached["summary"])
+            else:
+                self.executor.submit("month", queries.load_summary, self.show_summary, year, month_num)
+        
+        self.prefetch_adjacent(year, month_num)
+        self.refresh_alerts()
+    
+    def materialize_recurring(self, through, rule_id=None):
+        """Add the recurring expenses due up to through on the database thread
+        
+        Queued ahead of the month that is about to load, so that month is read
+        with them. Months cached before are forgotten when the occurrences
+        arrive, and the shown month is loaded again if it came from the cache
+        and gained any.
+        """
+        if rule_id is None and self.recurring_through is not None and through <= self.recurring_through:
+            return
+        previous = self.recurring_through
+        if rule_id is None:
+            # Not asked again while this run is queued
+            self.recurring_through = through
+        
+        def added(result):
+            count, dates = result
+            shown = self.selected_period()
+            stale = shown in self.month_cache and shown in {month_of(day) for day in dates}
+            self.month_cache.invalidate_dates(*dates)
+            if stale:
+                self.refresh_data()
+        
+        def failed(error):
+            if rule_id is None:
+                self.recurring_through = previous
+            messagebox.showerror("Recurring Expenses", f"Could not add the recurring expenses: {error}")
+        
+        self.executor.submit("recurring" if rule_id is None else "recurring rule", recurring.materialize, added,
+                             through, rule_id, errback=failed)
+    
+    def cache_month(self, year, month_num, then=None):
+        """Return a load_month callback that caches the month, then calls then"""
+        version = self.month_cache.version(year, month_num)
+        
+        def store(data):
+            self.month_cache.put(year, month_num, data, version)
+            if then is not None:
+                then(data)
+        return store
+    
+    def prefetch_adjacent(self, year, month_num):
+        """Load the months before and after into the cache in the background"""
+        # Queued behind the selected month, and replaced by the next selection
+        for key, (other_year, other_month) in zip(("prefetch previous", "prefetch next"), adjacent_months(year, month_num)):
+            if (other_year, other_month) in self.month_cache:
+                self.executor.cancel(key)
+                continue
+            self.executor.submit(key, queries.load_month, self.cache_month(other_year, other_month),
+                                 other_year, other_month, errback=lambda error: None, background=True)
+    
+    def selected_period(self):
+        """Return (year, month number) of the month/year dropdowns"""
+        return self.selected_year.get(), reports.MONTH_NUMBERS[self.selected_month.get()]
+    
+    def run_search(self):
+        """List the expenses matching the search bar, or the month if it is empty"""
+        try:
+            self.search_filters = self.read_search_filters()
+        except ValueError as e:
+            messagebox.showerror("Invalid Search", str(e))
+            return
+        self.refresh_data()
+    
+    def clear_search(self):
+        """Empty the search bar and go back to the selected month"""
+        for var in (self.search_text, self.search_min, self.search_max, self.search_from, self.search_to):
+            var.set("")
+        self.search_category.set("All")
+        self.search_filters = None
+        self.refresh_data()
+    
+    def read_search_filters(self):
+        """Return the search bar as queries.search_expenses filters, or None if empty
+        
+        Raises ValueError with a message suitable for showing to the user.
+        """
+        filters = {}
+        text = self.search_text.get().strip()
+        if text:
+            filters["text"] = text
+        if self.search_category.get() != "All":
+            filters["category"] = self.search_category.get()
+        
+        for name, var in (("min_amount", self.search_min), ("max_amount", self.search_max)):
+            value = var.get().strip()
+            if value:
+                try:
+                    filters[name] = float(value)
+                except ValueError:
+                    raise ValueError("Amounts must be numbers")
+        
+        # The last day is included, search_expenses takes the day after it
+        for name, var, days in (("start_date", self.search_from, 0), ("end_date", self.search_to, 1)):
+            value = var.get().strip()
+            if value:
+                try:
+                    filters[name] = (date.fromisoformat(value) + timedelta(days=days)).isoformat()
+                except ValueError:
+                    raise ValueError("Dates must be in YYYY-MM-DD format")
+        
+        return filters or None
+    
+    def refresh_stats(self):
+        """Reload only the summary and chart for the selected month/year"""
+        year, month_num = self.selected_period()
+        self.executor.submit("summary", queries.load_summary, self.show_summary, year, month_num)
+        self.refresh_alerts()
+    
+    def refresh_alerts(self):
+        """Check the selected month for budget overruns, unusual days and duplicates"""
+        if self.chart is None:
+            # NumPy comes with matplotlib; finish_startup checks once it is loaded
+            return
+        import analytics
+        year, month_num = self.selected_period()
+        self.executor.submit("alerts", analytics.month_alerts, self.show_alerts, year, month_num, background=True)
+    
+    def show_alerts(self, alerts):
+        """Show the first MAX_ALERTS alerts under the budget figures"""
+        lines = [alert["message"] for alert in alerts[:self.MAX_ALERTS]]
+        if len(alerts) > self.MAX_ALERTS:
+            lines.append(f"and {len(alerts) - self.MAX_ALERTS} more")
+        overrun = any(alert["kind"] == "over budget" for alert in alerts)
+        self.alerts_label.configure(text="\n".join(lines), foreground="red" if overrun else "darkorange")
+    
+    def show_loading(self, busy):
+        """Show or hide the loading indicator"""
+        self.loading_label.configure(text="Loading..." if busy else "")
+    
+    def show_month(self, data):
+        """Render a month loaded by queries.load_month"""
+        if self.sort_column is None and not self.column_filters:
+            # A sorted or filtered list comes from the month's model instead
+            self.refresh_expense_list(data["rows"])
+        self.show_summary(data["summary"])
+        if "first data" not in self.timer.phases:
+            self.timer.mark("first data")
+            self.check_startup_done()
+    
+    def show_summary(self, summary):
+        """Render the summary loaded by queries.load_summary"""
+        self.update_stats(summary)
+        self.refresh_shown()
+    
+    def refresh_shown(self):
+        """Report the refresh breakdown once nothing it requested is pending"""
+        if perf.enabled and not self.executor.busy:
+            # Idle callbacks run in order, so this follows the chart's draw
+            self.root.after_idle(self.show_perf)
+    
+    def show_perf(self):
+        """Close the open refresh and show its breakdown"""
+        result = perf.finish()
+        if result is not None and self.perf_label is not None:
+            self.perf_label.configure(text=perf.describe(result))
+    
+    def refresh_expense_list(self, rows):
+        """Refresh the expense list with the first page of the month or search results"""
+        with perf.span("list"):
+            # Clear current items
+            self.expense_tree.delete(*self.expense_tree.get_children())
+            self.row_keys.clear()
+            self.showing_model = False
+            
+            # Only the first page is loaded here, the rest follows on scroll
+            self.more_above = False
+            self.more_below = len(rows) == self.PAGE_SIZE
+            self.insert_expense_rows(rows, "end")
+            self.expense_tree.yview_moveto(0)
+        self.refresh_shown()
+    
+    def sort_by(self, column):
+        """Sort the month's expenses by a column, or reverse the sort on a second click"""
+        if self.search_filters is not None:
+            # Search results are paged from the database newest first
+            return
+        if self.sort_column == column:
+            self.sort_descending = not self.sort_descending
+        else:
+            # Dates and amounts start with the largest, names with A
+            self.sort_column, self.sort_descending = column, column in ("Date", "Amount")
+        self.show_view()
+    
+    def filter_column(self, event):
+        """Ask for a filter on the column whose heading was right-clicked"""
+        if self.search_filters is not None or self.expense_tree.identify_region(event.x, event.y) != "heading":
+            return
+        import expense_model
+        column = self.COLUMNS[int(self.expense_tree.identify_column(event.x)[1:]) - 1]
+        text = simpledialog.askstring(
+            f"Filter {column}", f"{expense_model.FILTER_HELP[column]}\nLeave empty to show every row.",
+            initialvalue=self.column_filters.get(column, ""), parent=self.root)
+        if text is None:
+            return
+        text = text.strip()
+        if text:
+            try:
+                expense_model.check_filter(column, text)
+            except ValueError as e:
+                messagebox.showerror("Invalid Filter", str(e))
+                return
+            self.column_filters[column] = text
+        else:
+            self.column_filters.pop(column, None)
+        self.show_view()
+    
+    def update_headings(self):
+        """Mark the sort column and filtered columns in the list headings"""
+        searching = self.search_filters is not None
+        for column in self.COLUMNS:
+            text = column
+            if not searching and column == self.sort_column:
+                text += " \u25bc" if self.sort_descending else " \u25b2"
+            if not searching and column in self.column_filters:
+                text += f" [{self.column_filters[column]}]"
+            self.expense_tree.heading(column, text=text)
+    
+    def show_view(self):
+        """Show the month sorted and filtered from its model, reading the model if needed"""
+        self.update_headings()
+        if self.sort_column is None and not self.column_filters:
+            self.model = self.model_key = None
+            self.refresh_data()
+            return
+        
+        year, month_num = self.selected_period()
+        key = (year, month_num, self.month_cache.version(year, month_num))
+        if self.model is not None and self.model_key == key:
+            self.show_model()
+            return
+        
+        import expense_model
+        
+        def loaded(model):
+            self.model, self.model_key = model, key
+            self.show_model()
+        # A write to the month changes its cache version, so the model is
+        # read again the next time it is shown
+        self.executor.submit("model", expense_model.load_month, loaded, year, month_num)
+    
+    def show_model(self):
+        """Show the first page of the model's sorted and filtered rows"""
+        with perf.span("list"):
+            shown = self.model.view(self.sort_column, self.sort_descending, self.column_filters)
+            self.expense_tree.delete(*self.expense_tree.get_children())
+            self.row_keys.clear()
+            self.showing_model = True
+            self.model_start = 0
+            
+            # Only the rows in the list are formatted; more follow on scroll
+            rows = self.model.rows(0, self.PAGE_SIZE)
+            self.more_above = False
+            self.more_below = shown > len(rows)
+            self.insert_expense_rows(rows, "end")
+            self.expense_tree.yview_moveto(0)
+            self.list_label.configure(text=f"Expenses ({shown:,} of {len(self.model):,}):"
+                                      if self.column_filters else "Expenses:")
+        self.refresh_shown()
+    
+    def insert_expense_rows(self, rows, position):
+        """Insert fetched rows into the expense list at the given position"""
+        insert = self.expense_tree.insert
+        for offset, (id, date, category, amount, description) in enumerate(rows):
+            # Format date for display (YYYY-MM-DD to DD/MM/YYYY)
+            display_date = f"{date[8:10]}/{date[5:7]}/{date[:4]}"
+            index = position if position == "end" else position + offset
+            iid = insert("", index, iid=str(id), values=(display_date, category, f"${amount:.2f}", description), tags=(id,))
+            self.row_keys[iid] = (date, id)
+    
+    def on_expense_scroll(self, first, last):
+        """Keep the scrollbar in sync and page rows in or out near either edge"""
+        self.expense_scrollbar.set(first, last)
+        if self.page_pending or not self.expense_tree.winfo_ismapped():
+            return
+        
+        if float(last) >= 0.95 and self.more_below:
+            self.load_next_page()
+        elif float(first) <= 0.05 and self.more_above:
+            self.load_previous_page()
+    
+    def load_next_page(self):
+        """Request the page below the loaded rows"""
+        items = self.expense_tree.get_children()
+        if not items:
+            return
+        if self.showing_model:
+            stop = self.model_start + len(items)
+            rows = self.model.rows(stop, stop + self.PAGE_SIZE)
+            self.show_next_page(rows)
+            self.more_below = stop + len(rows) < len(self.model.order)
+            return
+        
+        self.page_pending = True
+        self.executor.submit("page", queries.search_expenses, self.show_next_page,
+                             self.list_filters, self.row_keys[items[-1]])
+    
+    def show_next_page(self, rows):
+        """Append a page below the loaded rows and drop rows far above"""
+        with perf.span("list page"):
+            self.page_pending = False
+            self.more_below = len(rows) == self.PAGE_SIZE
+            self.insert_expense_rows(rows, "end")
+            
+            items = self.expense_tree.get_children()
+            excess = len(items) - self.PAGE_SIZE * self.MAX_PAGES
+            if excess > 0:
+                self.drop_expense_rows(items[:excess])
+                self.more_above = True
+                self.model_start += excess
+                # Rows above the view shifted it down; move back to the same rows
+                self.expense_tree.yview_scroll(-excess, "units")
+    
+    def load_previous_page(self):
+        """Request the page above the loaded rows"""
+        items = self.expense_tree.get_children()
+        if not items:
+            return
+        if self.showing_model:
+            start = max(0, self.model_start - self.PAGE_SIZE)
+            rows = self.model.rows(start, self.model_start)
+            self.model_start = start
+            self.show_previous_page(rows)
+            self.more_above = start > 0
+            return
+        
+        self.page_pending = True
+        self.executor.submit("page", queries.search_expenses, self.show_previous_page,
+                             self.list_filters, self.row_keys[items[0]], True)
+    
+    def show_previous_page(self, rows):
+        """Prepend a page above the loaded rows and drop rows far below"""
+        with perf.span("list page"):
+            self.page_pending = False
+            self.more_above = len(rows) == self.PAGE_SIZE
+            self.insert_expense_rows(rows, 0)
+            self.expense_tree.yview_scroll(len(rows), "units")
+            
+            items = self.expense_tree.get_children()
+            excess = len(items) - self.PAGE_SIZE * self.MAX_PAGES
+            if excess > 0:
+                self.drop_expense_rows(items[-excess:])
+                self.more_below = True
+    
+    def drop_expense_rows(self, items):
+        """Remove rows from the expense list together with their paging keys"""
+        self.expense_tree.delete(*items)
+        for iid in items:
+            del self.row_keys[iid]
+    
+    def update_stats(self, summary):
+        """Update statistics and chart from a reports.summarize result"""
+        total_spent = summary["total"]
+        monthly_budget = summary["budget"]
+        remaining = summary["remaining"]
+        
+        with perf.span("stats"):
+            # Update labels
+            self.total_label.configure(text=f"Total Spent: ${total_spent:.2f}")
+            self.budget_label.configure(text=f"Monthly Budget: ${monthly_budget:.2f}")
+            self.remaining_label.configure(text=f"Remaining: ${remaining:.2f}")
+            
+            # Set label color based on budget status
+            if remaining < 0:
+                self.remaining_label.configure(foreground="red")
+            else:
+                self.remaining_label.configure(foreground="green")
+        
+        # Update chart with the categories that have spending
+        category_data = [(row["category"], row["spent"]) for row in summary["categories"] if row["count"]]
+        self.update_chart(category_data)
+    
+    def update_chart(self, category_data):
+        """Update the pie chart showing expenses by category"""
+        if self.chart is None:
+            # Still starting up; finish_startup renders this once it can
+            self.pending_chart = category_data
+            return
+        
+        # Unchanged totals are skipped and months shown before come from the
+        # chart's render cache
+        self.chart.show(self.selected_month.get(), self.selected_year.get(), category_data)
+    
+    def add_expense(self):
+        """Open a dialog to add a new expense"""
+        self.open_expense_dialog()
+    
+    def edit_expense(self, event):
+        """Open a dialog to edit the selected expense"""
+        selected_item = self.expense_tree.selection()
+        if not selected_item:
+            return
+        
+        item_id = self.expense_tree.item(selected_item)['tags'][0]
+        expense = self.call(expenses.get_expense, item_id)
+        
+        if expense:
+            self.expense_id = expense[0]
+            self.open_expense_dialog(expense)
+        else:
+            # Rows of archived years are listed but cannot be changed
+            messagebox.showinfo("Edit Expense", "This expense was deleted or its year is archived.")
+    
+    def delete_selected_expense(self, event):
+        """Delete the selected expense"""
+        selected_item = self.expense_tree.selection()
+        if not selected_item:
+            return
+        
+        item_id = self.expense_tree.item(selected_item)['tags'][0]
+        
+        if messagebox.askyesno("Delete Expense", "Are you sure you want to delete this expense?"):
+            try:
+                with perf.span("delete expense"):
+                    deleted_date = self.call(expenses.delete_expense, item_id)
+            except WRITE_ERRORS as e:
+                messagebox.showerror("Database Error", str(e))
+                return
+            if deleted_date is None:
+                messagebox.showinfo("Delete Expense", "This expense was deleted or its year is archived.")
+            self.month_cache.invalidate_dates(deleted_date)
+            self.refresh_data()
+    
+    def open_expense_dialog(self, expense=None):
+        """Open dialog to add or edit an expense"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Add Expense" if not expense else "Edit Expense")
+        dialog.geometry("400x340")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        dialog_frame = ttk.Frame(dialog, padding=20)
+        dialog_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Get categories for dropdown
+        category_names = self.call(categories.sorted_names)
+        
+        # Amount
+        ttk.Label(dialog_frame, text="Amount ($):").grid(row=0, column=0, sticky=tk.W, pady=5)
+        amount_var = tk.StringVar(value=str(expense[1]) if expense else "")
+        amount_entry = ttk.Entry(dialog_frame, textvariable=amount_var, width=15)
+        amount_entry.grid(row=0, column=1, sticky=tk.W, pady=5)
+        
+        # Category
+        ttk.Label(dialog_frame, text="Category:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        category_var = tk.StringVar(value=expense[2] if expense else category_names[0])
+        category_dropdown = ttk.Combobox(dialog_frame, textvariable=category_var, values=category_names, state="readonly", width=15)
+        category_dropdown.grid(row=1, column=1, sticky=tk.W, pady=5)
+        
+        # Date
+        ttk.Label(dialog_frame, text="Date (YYYY-MM-DD):").grid(row=2, column=0, sticky=tk.W, pady=5)
+        if expense:
+            default_date = expense[3]
+        else:
+            default_date = datetime.now().strftime("%Y-%m-%d")
+        date_var = tk.StringVar(value=default_date)
+        date_entry = ttk.Entry(dialog_frame, textvariable=date_var, width=15)
+        date_entry.grid(row=2, column=1, sticky=tk.W, pady=5)
+        
+        # Description
+        ttk.Label(dialog_frame, text="Description:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        description_var = tk.StringVar(value=expense[4] if expense else "")
+        description_entry = ttk.Entry(dialog_frame, textvariable=description_var, width=30)
+        description_entry.grid(row=3, column=1, sticky=tk.W, pady=5)
+        
+        # Repeats, for new expenses only: a recurring rule is added instead
+        repeat_var = tk.StringVar(value="Never")
+        if not expense:
+            ttk.Label(dialog_frame, text="Repeats:").grid(row=4, column=0, sticky=tk.W, pady=5)
+            ttk.Combobox(dialog_frame, textvariable=repeat_var, values=["Never"] + list(recurring.REPEATS),
+                         state="readonly", width=28).grid(row=4, column=1, sticky=tk.W, pady=5)
+        
+        # Buttons
+        button_frame = ttk.Frame(dialog_frame)
+        button_frame.grid(row=5, column=0, columnspan=2, pady=20)
+        
+        ttk.Button(
+            button_frame, 
+            text="Save", 
+            command=lambda: self.save_expense(
+                expense[0] if expense else None,
+                amount_var.get(),
+                category_var.get(),
+                date_var.get(),
+                description_var.get(),
+                dialog,
+                repeat_var.get()
+            )
+        ).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(
+            button_frame,
+            text="Cancel",
+            command=dialog.destroy
+        ).pack(side=tk.LEFT, padx=5)
+        
+        # Focus on amount entry
+        amount_entry.focus_set()
+    
+    def save_expense(self, id, amount_str, category, date_str, description, dialog, repeat="Never"):
+        """Save the expense to database"""
+        # Validated and written by expenses.save_expense, here or on the server
+        try:
+            if repeat in recurring.REPEATS:
+                self.add_recurring(amount_str, category, date_str, description, *recurring.REPEATS[repeat])
+                dialog.destroy()
+                self.refresh_data()
+                return
+            with perf.span("save expense"):
+                id, dates = self.call(expenses.save_expense, id, amount_str, category, date_str, description)
+        except ValueError as e:
+            messagebox.showerror("Invalid Input", str(e))
+            return
+        except WRITE_ERRORS as e:
+            # A long import may hold the write lock; the dialog stays open to retry
+            messagebox.showerror("Database Error", str(e), parent=dialog)
+            return
+        
+        # An edit may move the expense to another month; both change
+        self.month_cache.invalidate_dates(*dates)
+        dialog.destroy()
+        self.refresh_data()
+    
+    def add_recurring(self, amount_str, category, date_str, description, frequency, every):
+        """Add a recurring rule whose occurrences replace the expense being added"""
+        rule_id = self.call(recurring.add_rule, amount_str, category, date_str, description, frequency, every)
+        # Its first month is filled in at once, even ahead of time
+        first_month = recurring.last_of_month(int(date_str[:4]), int(date_str[5:7]))
+        self.materialize_recurring(max(first_month, self.recurring_through or first_month), rule_id)
+    
+    def import_expenses(self):
+        """Import a CSV or OFX bank export in the background"""
+        path = filedialog.askopenfilename(
+            parent=self.root,
+            title="Import Expenses",
+            filetypes=[("Bank exports", "*.csv *.ofx *.qfx"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        
+        def finished(stats):
+            messagebox.showinfo("Import Complete", stats.summary())
+            self.month_cache.clear()
+            self.refresh_data()
+        
+        self.run_with_progress(
+            "Importing", f"Reading {os.path.basename(path)}...", importer.import_file,
+            lambda stats: f"{stats.read:,} rows read, {stats.inserted:,} imported ({stats.rows_per_second:,.0f} rows/s)",
+            finished, "Import Failed", path, None, "Other", False, False, importer.BATCH_SIZE)
+    
+    def export_expenses(self):
+        """Export the expenses of a date range to CSV, JSON Lines or Parquet in the background"""
+        export_dialog = tk.Toplevel(self.root)
+        export_dialog.title("Export Expenses")
+        export_dialog.geometry("360x200")
+        export_dialog.transient(self.root)
+        export_dialog.grab_set()
+        
+        form = ttk.Frame(export_dialog, padding=20)
+        form.pack(fill=tk.BOTH, expand=True)
+        
+        # The month shown in the main window by default
+        start, end = reports.month_range(int(self.selected_year.get()), reports.MONTH_NUMBERS[self.selected_month.get()])
+        first_var = tk.StringVar(value=start)
+        last_var = tk.StringVar(value=(date.fromisoformat(end) - timedelta(days=1)).isoformat())
+        formats = {"CSV": ("csv", ".csv"), "JSON Lines": ("jsonl", ".jsonl"), "Parquet": ("parquet", ".parquet")}
+        format_var = tk.StringVar(value="CSV")
+        compression_var = tk.StringVar(value="none")
+        
+        ttk.Label(form, text="First day:").grid(row=0, column=0, sticky=tk.W, pady=3)
+        ttk.Entry(form, textvariable=first_var, width=14).grid(row=0, column=1, sticky=tk.W, pady=3)
+        ttk.Label(form, text="Last day:").grid(row=1, column=0, sticky=tk.W, pady=3)
+        ttk.Entry(form, textvariable=last_var, width=14).grid(row=1, column=1, sticky=tk.W, pady=3)
+        ttk.Label(form, text="Format:").grid(row=2, column=0, sticky=tk.W, pady=3)
+        format_box = ttk.Combobox(form, textvariable=format_var, values=list(formats), width=12, state="readonly")
+        format_box.grid(row=2, column=1, sticky=tk.W, pady=3)
+        ttk.Label(form, text="Compression:").grid(row=3, column=0, sticky=tk.W, pady=3)
+        compression_box = ttk.Combobox(form, textvariable=compression_var, width=12, state="readonly")
+        compression_box.grid(row=3, column=1, sticky=tk.W, pady=3)
+        
+        def update_compression(event=None):
+            if format_var.get() == "Parquet":
+                compression_box.configure(values=exporter.PARQUET_COMPRESSION)
+                compression_var.set("snappy")
+            else:
+                compression_box.configure(values=["none"] + list(exporter.TEXT_COMPRESSION))
+                compression_var.set("none")
+        
+        format_box.bind("<<ComboboxSelected>>", update_compression)
+        update_compression()
+        
+        def export():
+            try:
+                first = date.fromisoformat(first_var.get().strip())
+                last = date.fromisoformat(last_var.get().strip())
+            except ValueError:
+                messagebox.showerror("Invalid Input", "Dates must be in YYYY-MM-DD format", parent=export_dialog)
+                return
+            if first > last:
+                first, last = last, first
+            fmt, extension = formats[format_var.get()]
+            compression = compression_var.get()
+            if compression in exporter.TEXT_COMPRESSION:
+                extension += exporter.TEXT_COMPRESSION[compression][0]
+            
+            path = filedialog.asksaveasfilename(
+                parent=export_dialog,
+                title="Export Expenses",
+                initialfile=f"expenses_{first}_{last}{extension}",
+                filetypes=[(format_var.get(), f"*{extension}"), ("All files", "*.*")]
+            )
+            if not path:
+                return
+            export_dialog.destroy()
+            
+            self.run_with_progress(
+                "Exporting", f"Writing {os.path.basename(path)}...", exporter.export_file,
+                lambda stats: f"{stats.rows:,} rows exported ({stats.rows_per_second:,.0f} rows/s)",
+                lambda stats: messagebox.showinfo("Export Complete", stats.summary()), "Export Failed",
+                path, first.isoformat(), (last + timedelta(days=1)).isoformat(), fmt, compression, exporter.CHUNK_SIZE)
+        
+        ttk.Button(form, text="Export...", command=export).grid(row=4, column=0, columnspan=2, pady=(15, 0))
+    
+    def run_with_progress(self, title, text, job, describe, finished, failure_title, *args):
+        """Run job(conn, *args, progress) behind a progress dialog
+        
+        describe(stats) gives the dialog text for the latest progress and
+        finished(stats) is called once the job succeeded.
+        """
+        progress_dialog = tk.Toplevel(self.root)
+        progress_dialog.title(title)
+        progress_dialog.geometry("400x100")
+        progress_dialog.transient(self.root)
+        progress_dialog.grab_set()
+        progress_dialog.protocol("WM_DELETE_WINDOW", lambda: None)
+        
+        progress_label = ttk.Label(progress_dialog, text=text, padding=20)
+        progress_label.pack(fill=tk.BOTH, expand=True)
+        
+        # The job runs on its own database thread so month queries are not
+        # stuck behind it; progress is copied to the dialog from the Tk thread
+        latest = {}
+        
+        def show_progress():
+            stats = latest.get("stats")
+            if stats is not None:
+                progress_label.configure(text=describe(stats))
+            if progress_dialog.winfo_exists():
+                progress_dialog.after(200, show_progress)
+        
+        def done(stats):
+            progress_dialog.destroy()
+            job_executor.close()
+            finished(stats)
+        
+        def failed(error):
+            progress_dialog.destroy()
+            job_executor.close()
+            messagebox.showerror(failure_title, str(error))
+        
+        job_executor = QueryExecutor(self.root)
+        job_executor.submit(job.__name__, job, done, *args, lambda stats: latest.update(stats=stats), errback=failed)
+        show_progress()
+    
+    def open_trends(self):
+        """Open a window with monthly spending trends over several years"""
+        # Only needed when the window is opened, like the main chart
+        import trends
+        from charts import TrendChart
+        
+        trends_window = tk.Toplevel(self.root)
+        trends_window.title("Spending Trends")
+        trends_window.geometry("900x550")
+        
+        controls = ttk.Frame(trends_window, padding=10)
+        controls.pack(fill=tk.X)
+        
+        current_year = datetime.now().year
+        years = list(range(current_year - 20, current_year + 2))
+        start_var = tk.IntVar(value=current_year - 9)
+        end_var = tk.IntVar(value=current_year)
+        window_var = tk.IntVar(value=3)
+        
+        ttk.Label(controls, text="From:").pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Combobox(controls, textvariable=start_var, values=years, width=6, state="readonly").pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Label(controls, text="To:").pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Combobox(controls, textvariable=end_var, values=years, width=6, state="readonly").pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Label(controls, text="Average (months):").pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Spinbox(controls, textvariable=window_var, from_=1, to=24, width=4).pack(side=tk.LEFT)
+        
+        chart = TrendChart(trends_window)
+        
+        def show():
+            try:
+                start_year, end_year, window = start_var.get(), end_var.get(), window_var.get()
+            except tk.TclError:
+                messagebox.showerror("Invalid Input", "Average must be a whole number of months", parent=trends_window)
+                return
+            if start_year > end_year:
+                start_year, end_year = end_year, start_year
+            
+            def render(data):
+                if trends_window.winfo_exists():
+                    chart.show(data, window)
+            
+            # Loaded and computed on the database thread; a newer request
+            # replaces one still pending
+            self.executor.submit("trends", trends.load_trends, render, start_year, end_year, window)
+        
+        ttk.Button(controls, text="Show", command=show).pack(side=tk.LEFT, padx=(10, 0))
+        show()
+    
+    def set_budget(self):
+        """Set budget for categories"""
+        budget_dialog = tk.Toplevel(self.root)
+        budget_dialog.title("Set Budget")
+        budget_dialog.geometry("400x480")
+        budget_dialog.transient(self.root)
+        budget_dialog.grab_set()
+        
+        dialog_frame = ttk.Frame(budget_dialog, padding=20)
+        dialog_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Month and year selection (same as current view)
+        month = self.selected_month.get()
+        year = self.selected_year.get()
+        
+        ttk.Label(dialog_frame, text=f"Setting Budget for {month} {year}", font=("", 12, "bold")).pack(anchor=tk.W, pady=(0, 15))
+        
+        # Every category with its existing budget, in one query
+        existing = self.call(budgets.load, month, year)
+        
+        # Create input fields for each category
+        budget_vars = {}
+        
+        for category, amount in existing.items():
+            frame = ttk.Frame(dialog_frame)
+            frame.pack(fill=tk.X, pady=2)
+            
+            ttk.Label(frame, text=category, width=15).pack(side=tk.LEFT)
+            
+            var = tk.StringVar(value=str(amount))
+            budget_vars[category] = var
+            
+            ttk.Entry(frame, textvariable=var, width=10).pack(side=tk.LEFT, padx=5)
+            ttk.Label(frame, text="$").pack(side=tk.LEFT)
+        
+        # Fill every field with one amount
+        all_frame = ttk.Frame(dialog_frame)
+        all_frame.pack(fill=tk.X, pady=(10, 2))
+        ttk.Label(all_frame, text="All categories", width=15).pack(side=tk.LEFT)
+        all_var = tk.StringVar()
+        ttk.Entry(all_frame, textvariable=all_var, width=10).pack(side=tk.LEFT, padx=5)
+        
+        def apply_to_all():
+            for var in budget_vars.values():
+                var.set(all_var.get())
+        
+        ttk.Button(all_frame, text="Apply", command=apply_to_all).pack(side=tk.LEFT)
+        
+        # Save the same budgets for the following year as well
+        repeat_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(dialog_frame, text="Also apply to the next 12 months", variable=repeat_var).pack(anchor=tk.W, pady=(5, 0))
+        
+        # Buttons
+        button_frame = ttk.Frame(dialog_frame)
+        button_frame.pack(pady=20)
+        
+        ttk.Button(
+            button_frame,
+            text="Save All",
+            command=lambda: self.save_budgets(budget_vars, month, year, budget_dialog, 13 if repeat_var.get() else 1)
+        ).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(
+            button_frame,
+            text="Cancel",
+            command=budget_dialog.destroy
+        ).pack(side=tk.LEFT, padx=5)
+    
+    def save_budgets(self, budget_vars, month, year, dialog, months=1):
+        """Save budgets for all categories, for months months starting with month"""
+        try:
+            amounts = {category: float(var.get()) for category, var in budget_vars.items()}
+            
+            # One upsert batch in one transaction
+            with perf.span("save budgets"):
+                self.call(budgets.save, month, int(year), amounts, months)
+            for saved_month, saved_year in budgets.following_months(month, int(year), months):
+                self.month_cache.invalidate(saved_year, reports.MONTH_NUMBERS[saved_month])
+            
+            dialog.destroy()
+            self.refresh_stats()
+            messagebox.showinfo("Success", "Budgets saved successfully!")
+            
+        except ValueError as e:
+            messagebox.showerror("Invalid Input", str(e))
+        except WRITE_ERRORS as e:
+            messagebox.showerror("Database Error", str(e), parent=dialog)
+    
+    def __del__(self):
+        """Clean up database connection when app closes"""
+        if hasattr(self, 'executor'):
+            self.executor.close()
+        if getattr(self, 'conn', None) is not None:
+            self.conn.close()
+
+if __name__ == "__main__":
+    # --startup-report prints how long imports, the database and first paint took
+    timer = StartupTimer()
+    timer.mark("imports")
+    # --perf shows a timing breakdown of each refresh, --perf-log FILE also logs it
+    if "--perf-log" in sys.argv[1:-1]:
+        perf.enable(sys.argv[sys.argv.index("--perf-log") + 1])
+    elif "--perf" in sys.argv[1:]:
+        perf.enable()
+    # --server URL [--token TOKEN] uses a ledger shared by server.py
+    client = None
+    if "--server" in sys.argv[1:-1]:
+        from client import ApiClient, ServerError
+        WRITE_ERRORS += (ServerError,)
+        token = sys.argv[sys.argv.index("--token") + 1] if "--token" in sys.argv[1:-1] else None
+        client = ApiClient(sys.argv[sys.argv.index("--server") + 1], token)
+    root = tk.Tk()
+    timer.mark("tk")
+    app = ExpenseTracker(root, timer, startup_report="--startup-report" in sys.argv[1:], client=client)
+    root.mainloop()
+    perf.disable()
 # </lov-write>
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""Typed in-memory model of a month's expenses behind the sortable expense list
+
+A month is read once into NumPy columns: ids, dates as day numbers, amounts
+as floats, and categories and descriptions as codes into their sorted
+distinct values. Sorting is an argsort of one column with date and id to
+break ties, and a filter is a boolean mask built from the same columns, so
+neither goes back to SQLite. Display strings are only made by rows() for the
+rows the list shows, a few pages at a time.
+
+Filters are typed the way the list shows values; FILTER_HELP lists the
+forms each column takes.
+"""
+import re
+from datetime import date, datetime
+
+import numpy as np
+
+import archive
+import categories
+from reports import month_range
+
+# What a filter on each column may be, for the filter prompt
+FILTER_HELP = {
+    "Date": "A day (2024-03-05 or 05/03/2024), >=2024-03-10, or 2024-03-01..2024-03-15",
+    "Category": "Text the category name contains",
+    "Amount": "An amount (12.50), >100, <=20, or 10..50",
+    "Description": "Text the description contains",
+}
+
+# Day numbers count from 1970-01-01 like numpy's datetime64[D]
+EPOCH = date(1970, 1, 1).toordinal()
+
+COMPARISONS = {">=": np.greater_equal, "<=": np.less_equal, ">": np.greater, "<": np.less, "=": np.equal}
+RANGE = re.compile(r"(.+?)\s*\.\.\s*(.+)")
+
+
+def parse_day(text):
+    """Day number of 2024-03-05 or 05/03/2024, as the list shows dates"""
+    text = text.strip()
+    try:
+        day = date.fromisoformat(text) if "-" in text else datetime.strptime(text, "%d/%m/%Y").date()
+    except ValueError:
+        raise ValueError(f"{text} is not a date like 2024-03-05 or 05/03/2024") from None
+    return day.toordinal() - EPOCH
+
+
+def parse_amount(text):
+    """Amount in cents of 12.50 or $12.50"""
+    try:
+        return round(float(text.strip().lstrip("$").replace(",", "")) * 100)
+    except ValueError:
+        raise ValueError(f"{text} is not an amount like 12.50") from None
+
+
+def compare(values, text, parse):
+    """Mask of values matching an exact value, a comparison or a range in text"""
+    match = RANGE.fullmatch(text)
+    if match:
+        low, high = parse(match[1]), parse(match[2])
+        return (values >= low) & (values <= high)
+    for operator in COMPARISONS:
+        if text.startswith(operator):
+            return COMPARISONS[operator](values, parse(text[len(operator):]))
+    return values == parse(text)
+
+
+def containing(values, codes, text):
+    """Mask of codes whose value contains text, ignoring case"""
+    text = text.casefold()
+    matching = [code for code, value in enumerate(values) if text in value.casefold()]
+    return np.isin(codes, matching)
+
+
+class ExpenseModel:
+    """Columns of one month's expenses with a sorted, filtered view over them"""
+    
+    def __init__(self, ids, days, amounts, category_codes, category_names, description_codes, descriptions):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.days = np.asarray(days, dtype=np.int32)
+        self.amounts = np.asarray(amounts, dtype=np.float64)
+        self.category_codes = np.asarray(category_codes, dtype=np.int32)
+        self.category_names = list(category_names)
+        self.description_codes = np.asarray(description_codes, dtype=np.int32)
+        self.descriptions = list(descriptions)
+        # Rows in view order; the sort and the mask are kept for the next view
+        self.order = np.arange(len(self.ids))
+        self.sort_key = self.sorted = None
+        self.filter_key = self.mask = None
+    
+    @classmethod
+    def from_rows(cls, rows, names):
+        """Build a model from (id, date, category_id, amount, description) rows"""
+        if not rows:
+            return cls([], [], [], [], [], [], [])
+        ids, dates, category_ids, amounts, descriptions = zip(*rows)
+        days = np.array(dates, dtype="datetime64[D]").astype(np.int32)
+        
+        # Codes number the distinct values in sorted order, so sorting a
+        # column sorts its codes
+        distinct_ids, category_index = np.unique(np.asarray(category_ids, dtype=np.int64), return_inverse=True)
+        category_names = [names.get(category_id, categories.UNKNOWN) for category_id in distinct_ids.tolist()]
+        by_name = np.argsort(np.array(category_names, dtype=object), kind="stable")
+        rank = np.empty(len(by_name), dtype=np.int32)
+        rank[by_name] = np.arange(len(by_name))
+        
+        descriptions = [description or "" for description in descriptions]
+        distinct = sorted(set(descriptions), key=lambda description: (description.casefold(), description))
+        code_of = {description: code for code, description in enumerate(distinct)}
+        description_codes = np.fromiter(map(code_of.__getitem__, descriptions), dtype=np.int32, count=len(descriptions))
+        
+        return cls(ids, days, amounts, rank[category_index], [category_names[i] for i in by_name],
+                   description_codes, distinct)
+    
+    def columns(self):
+        """The constructor's arguments, for sending the model as JSON"""
+        return {"ids": self.ids, "days": self.days, "amounts": self.amounts,
+                "category_codes": self.category_codes, "category_names": self.category_names,
+                "description_codes": self.description_codes, "descriptions": self.descriptions}
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def sort_order(self, column, descending):
+        """Row numbers sorted by column, ties by date then id; newest first when column is None"""
+        if column is None:
+            return np.lexsort((self.ids, self.days))[::-1]
+        key = {"Date": self.days, "Category": self.category_codes, "Amount": self.amounts,
+               "Description": self.description_codes}[column]
+        order = np.lexsort((self.ids, self.days, key))
+        return order[::-1] if descending else order
+    
+    def filter_mask(self, column, text):
+        """Mask of the rows matching a filter; raises ValueError for one that cannot be read"""
+        text = text.strip()
+        if column == "Date":
+            return compare(self.days, text, parse_day)
+        if column == "Amount":
+            return compare(np.round(self.amounts * 100), text, parse_amount)
+        if column == "Category":
+            return containing(self.category_names, self.category_codes, text)
+        return containing(self.descriptions, self.description_codes, text)
+    
+    def view(self, column=None, descending=False, filters=None):
+        """Sort by column and keep the rows matching every {column: text} filter
+        
+        Returns the number of rows in view. A sort or set of filters used by
+        the previous view is not computed again.
+        """
+        if (column, descending) != self.sort_key:
+            self.sorted = self.sort_order(column, descending)
+            self.sort_key = (column, descending)
+        filter_key = tuple(sorted((filters or {}).items()))
+        if filter_key != self.filter_key:
+            self.mask = None
+            for filter_column, text in filter_key:
+                mask = self.filter_mask(filter_column, text)
+                self.mask = mask if self.mask is None else self.mask & mask
+            self.filter_key = filter_key
+        self.order = self.sorted if self.mask is None else self.sorted[self.mask[self.sorted]]
+        return len(self.order)
+    
+    def rows(self, start, stop):
+        """Return (id, date, category, amount, description) for view rows start to stop"""
+        rows = self.order[start:stop]
+        return [(expense_id, date.fromordinal(EPOCH + day).isoformat(), self.category_names[category],
+                 amount, self.descriptions[description])
+                for expense_id, day, category, amount, description in zip(
+                    self.ids[rows].tolist(), self.days[rows].tolist(), self.category_codes[rows].tolist(),
+                    self.amounts[rows].tolist(), self.description_codes[rows].tolist())]
+
+
+def check_filter(column, text):
+    """Raise ValueError if text is not a filter the column can use"""
+    ExpenseModel([], [], [], [], [], [], []).filter_mask(column, text)
+
+
+def load_month(conn, year, month_num):
+    """Read every expense of a month into an ExpenseModel"""
+    start, end = month_range(year, month_num)
+    rows = []
+    for schema in archive.schemas(conn, start, end):
+        rows += conn.execute(f"""
+            SELECT id, date, category_id, amount, description FROM {schema}.expenses
+            WHERE date >= ? AND date < ?
+        """, (start, end)).fetchall()
+    return ExpenseModel.from_rows(rows, categories.names(conn))
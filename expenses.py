@@ -0,0 +1,80 @@
+"""Validation and write operations for expenses
+
+Shared by the GUI dialogs and the bulk importer so every way of adding an
+expense applies the same rules.
+"""
+import math
+from datetime import date
+
+import archive
+import categories
+
+
+def validate_expense(amount_str, date_str):
+    """Validate an amount and a YYYY-MM-DD date, returning the amount as a float
+    
+    Raises ValueError with a message suitable for showing to the user.
+    """
+    amount = float(amount_str)
+    if not math.isfinite(amount) or amount <= 0:
+        raise ValueError("Amount must be positive")
+    
+    # Stored dates must be zero padded for the month range queries to work
+    if len(date_str) != 10 or date_str[4] != "-" or date_str[7] != "-":
+        raise ValueError("Date must be in YYYY-MM-DD format")
+    date.fromisoformat(date_str)
+    
+    return amount
+
+
+def get_expense(conn, expense_id):
+    """Return (id, amount, category, date, description) of an expense, or None
+    
+    Archived expenses are read-only and not found here.
+    """
+    row = conn.execute("SELECT id, amount, category_id, date, description FROM expenses WHERE id = ?",
+                       (expense_id,)).fetchone()
+    if row is None:
+        return None
+    return row[:2] + (categories.names(conn).get(row[2]),) + row[3:]
+
+
+def save_expense(conn, expense_id, amount_str, category, date_str, description):
+    """Validate and store an expense, adding it when expense_id is None
+    
+    Returns (id, dates): the dates whose months changed, which include the
+    old date when an edit moved the expense. Raises ValueError with a message
+    suitable for showing to the user, also for dates in an archived year.
+    """
+    amount = validate_expense(amount_str, date_str)
+    category_id = categories.ids(conn).get(category)
+    if category_id is None:
+        raise ValueError(f"No category named {category}")
+    archive.check_open(conn, date_str)
+    
+    with conn:
+        if expense_id:
+            previous = conn.execute("SELECT date FROM expenses WHERE id = ?", (expense_id,)).fetchone()
+            if previous is None:
+                raise ValueError("This expense was deleted or its year archived")
+            conn.execute(
+                "UPDATE expenses SET amount = ?, category_id = ?, date = ?, description = ? WHERE id = ?",
+                (amount, category_id, date_str, description, expense_id)
+            )
+            return expense_id, [date_str, previous[0]]
+        
+        # The next rowid could belong to an archived expense. The id is
+        # worked out by the INSERT itself, which holds the write lock.
+        cursor = conn.execute(
+            f"INSERT INTO expenses (id, amount, category_id, date, description) VALUES ({archive.NEXT_ID}, ?, ?, ?, ?)",
+            (amount, category_id, date_str, description)
+        )
+        return cursor.lastrowid, [date_str]
+
+
+def delete_expense(conn, expense_id):
+    """Delete an expense and return its date, or None if it did not exist"""
+    with conn:
+        row = conn.execute("SELECT date FROM expenses WHERE id = ?", (expense_id,)).fetchone()
+        conn.execute("DELETE FROM expenses WHERE id = ?", (expense_id,))
+    return row[0] if row else None
@@ -0,0 +1,263 @@
+"""Bulk import of bank exports (CSV and OFX) into the expenses database
+
+Usage: python importer.py statement.csv [--db data/expenses.db] [--negate]
+
+Files are parsed as a stream, validated with the same rules as the Add
+Expense dialog and inserted with executemany in large batches, each committed
+on its own so the app's other writes wait for one batch rather than the whole
+file. Every imported row stores a content hash in a unique index, so
+importing the same file twice does not create duplicates, and an import that
+fails part way can simply be run again.
+"""
+import re
+import sys
+import csv
+import time
+import hashlib
+import argparse
+
+import archive
+import categories
+import database
+import expenses
+
+BATCH_SIZE = 10000
+CACHE_KIB = 64 * 1024
+
+# Column names looked up (case-insensitively) in the CSV header
+CSV_COLUMNS = {"date": "date", "amount": "amount", "category": "category", "description": "description"}
+
+OFX_TAG = re.compile(r"<(/?)(\w+)>([^<\r\n]*)")
+
+
+class ImportStats:
+    """Counters for one import run"""
+    
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.invalid = 0
+        # Rows dated in an archived year, which is read-only
+        self.archived = 0
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+    
+    @property
+    def rows_per_second(self):
+        elapsed = self.seconds or (time.perf_counter() - self.started)
+        return self.read / elapsed if elapsed else 0.0
+    
+    def summary(self):
+        archived = f", {self.archived:,} in archived years" if self.archived else ""
+        return (f"{self.read:,} rows read, {self.inserted:,} imported, "
+                f"{self.duplicates:,} duplicates, {self.invalid:,} invalid{archived} "
+                f"in {self.seconds:.1f}s ({self.rows_per_second:,.0f} rows/s)")
+
+
+def read_csv(path, columns=CSV_COLUMNS):
+    """Yield (amount, category, date, description, source id) from a CSV file"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = [name.strip().lower() for name in next(reader, [])]
+        try:
+            date_index = header.index(columns["date"].lower())
+            amount_index = header.index(columns["amount"].lower())
+        except ValueError:
+            raise ValueError(f"CSV header must contain '{columns['date']}' and '{columns['amount']}' columns")
+        category_index = header.index(columns["category"].lower()) if columns["category"].lower() in header else None
+        description_index = header.index(columns["description"].lower()) if columns["description"].lower() in header else None
+        
+        for row in reader:
+            if not row:
+                continue
+            yield (
+                row[amount_index] if amount_index < len(row) else "",
+                row[category_index].strip() if category_index is not None and category_index < len(row) else "",
+                row[date_index].strip() if date_index < len(row) else "",
+                row[description_index].strip() if description_index is not None and description_index < len(row) else "",
+                None,
+            )
+
+
+def read_ofx(path):
+    """Yield (amount, category, date, description, source id) from an OFX file
+    
+    Works for both SGML (OFX 1.x, unclosed tags) and XML (OFX 2.x) statements.
+    Debits are negative in OFX and are returned as positive amounts; credits
+    come out negative and are rejected by validation like any other
+    non-expense row.
+    """
+    transaction = None
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            for closing, tag, value in OFX_TAG.findall(line):
+                tag = tag.upper()
+                if tag == "STMTTRN":
+                    if not closing:
+                        transaction = {}
+                    elif transaction is not None:
+                        yield ofx_record(transaction)
+                        transaction = None
+                elif transaction is not None and not closing:
+                    transaction[tag] = value.strip()
+
+
+def ofx_record(transaction):
+    """Convert the fields of one STMTTRN block to an import record"""
+    posted = transaction.get("DTPOSTED", "")
+    amount = transaction.get("TRNAMT", "")
+    if amount.startswith("-"):
+        amount = amount[1:]
+    elif amount:
+        amount = "-" + amount.lstrip("+")
+    description = " ".join(filter(None, (transaction.get("NAME"), transaction.get("MEMO"))))
+    return (amount, "", f"{posted[0:4]}-{posted[4:6]}-{posted[6:8]}", description, transaction.get("FITID"))
+
+
+def detect_format(path):
+    """Guess the file format from its extension"""
+    return "ofx" if path.lower().endswith((".ofx", ".qfx")) else "csv"
+
+
+def import_hash(record, occurrence):
+    """Content hash identifying an imported row
+    
+    OFX transactions carry their own id. For CSV rows the hash covers the
+    row's content plus how many identical rows came before it on the same
+    date, so two genuine identical charges on one day are both kept.
+    """
+    amount, category, date_str, description, source_id = record
+    if source_id:
+        key = f"id|{source_id}"
+    else:
+        key = f"{date_str}|{amount:.2f}|{category}|{description}|{occurrence}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+def import_file(conn, path, fmt=None, unknown_category="Other", create_categories=False,
+                negate=False, batch_size=BATCH_SIZE, progress=None):
+    """Import a CSV or OFX file into the expenses table
+    
+    Rows with a category that does not exist are filed under unknown_category,
+    which must exist, unless create_categories is set. With negate=True amounts are sign
+    flipped first, for CSV exports that list spending as negative numbers.
+    Rows dated in an archived year are counted and skipped. Every batch is
+    its own transaction; batches committed before a failure stay imported.
+    progress(stats) is called after every batch. Returns an ImportStats.
+    """
+    fmt = fmt or detect_format(path)
+    records = read_ofx(path) if fmt == "ofx" else read_csv(path)
+    category_ids = dict(categories.ids(conn))
+    if unknown_category not in category_ids:
+        raise ValueError(f"No category named {unknown_category}")
+    stats = ImportStats()
+    
+    # A bigger page cache keeps the hash and date indexes in memory while
+    # millions of rows go in
+    conn.execute(f"PRAGMA cache_size = -{CACHE_KIB}")
+    
+    # Identical rows are counted among consecutive rows of the same date,
+    # which is how bank exports are ordered, so memory use stays flat
+    current_date = None
+    seen = {}
+    
+    last_year = database.archived_through(conn)
+    first_open_day = "" if last_year is None else f"{last_year + 1}"
+    
+    batch = []
+    for amount_str, category, date_str, description, source_id in records:
+        stats.read += 1
+        try:
+            if negate:
+                amount_str = amount_str.strip()
+                amount_str = amount_str[1:] if amount_str.startswith("-") else "-" + amount_str
+            amount = expenses.validate_expense(amount_str, date_str)
+        except ValueError:
+            stats.invalid += 1
+            continue
+        if date_str < first_open_day:
+            stats.archived += 1
+            continue
+        
+        if category not in category_ids:
+            if category and create_categories:
+                with conn:
+                    category_ids[category] = categories.add(conn, category)
+            else:
+                category = unknown_category
+        
+        record = (amount, category, date_str, description, source_id)
+        if date_str != current_date:
+            current_date = date_str
+            seen.clear()
+        content = record[:4]
+        occurrence = seen.get(content, 0)
+        seen[content] = occurrence + 1
+        
+        batch.append((amount, category_ids[category], date_str, description, import_hash(record, occurrence)))
+        if len(batch) >= batch_size:
+            insert_batch(conn, batch, stats)
+            batch = []
+            if progress:
+                progress(stats)
+    
+    if batch:
+        insert_batch(conn, batch, stats)
+    
+    stats.seconds = time.perf_counter() - stats.started
+    if progress:
+        progress(stats)
+    return stats
+
+
+def insert_batch(conn, batch, stats):
+    """Insert and commit a batch of rows, skipping any whose hash is already present"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Ids are given explicitly so none is taken by an archived expense;
+        # the write lock is held before they are read
+        first_id = archive.next_id(conn)
+        cursor = conn.executemany("""
+            INSERT OR IGNORE INTO expenses (id, amount, category_id, date, description, import_hash)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, ((first_id + offset,) + row for offset, row in enumerate(batch)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    stats.inserted += cursor.rowcount
+    stats.duplicates += len(batch) - cursor.rowcount
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Import a CSV or OFX bank export into the expense tracker")
+    parser.add_argument("path", help="CSV or OFX file to import")
+    parser.add_argument("--db", default=database.DB_PATH, help="path to the SQLite database")
+    parser.add_argument("--format", choices=["csv", "ofx"], help="file format (default: from the extension)")
+    parser.add_argument("--unknown-category", default="Other", help="category for rows with an unknown category")
+    parser.add_argument("--create-categories", action="store_true", help="add unknown categories instead of mapping them")
+    parser.add_argument("--negate", action="store_true", help="flip amount signs (CSV exports listing spending as negative)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="rows per executemany batch")
+    args = parser.parse_args(argv)
+    
+    def report(stats):
+        print(f"\r{stats.read:,} rows read, {stats.inserted:,} imported ({stats.rows_per_second:,.0f} rows/s)",
+              end="", file=sys.stderr, flush=True)
+    
+    conn = database.connect(args.db)
+    try:
+        stats = import_file(conn, args.path, args.format, args.unknown_category, args.create_categories,
+                            args.negate, args.batch_size, report)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        conn.close()
+    print(file=sys.stderr)
+    print(stats.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,76 @@
+"""Cache of the month views shown in the main window
+
+Each entry is a queries.load_month result: the first page of rows and the
+month summary that feeds the totals and the chart. Months are kept least
+recently shown first and evicted past MAX_MONTHS; an entry holds at most one
+page of rows, so the bound on months is also a bound on memory.
+
+Writes invalidate only the months they touch. Loads started before an
+invalidation are not stored when they finish, so a prefetch that raced a
+write cannot bring stale totals back.
+"""
+from collections import OrderedDict
+
+
+def month_of(day):
+    """Return (year, month number) of an ISO date"""
+    return int(day[:4]), int(day[5:7])
+
+
+def adjacent_months(year, month_num):
+    """Return the (year, month number) before and after a month"""
+    ordinal = year * 12 + month_num - 1
+    return [(i // 12, i % 12 + 1) for i in (ordinal - 1, ordinal + 1)]
+
+
+class MonthCache:
+    """load_month results keyed by (year, month number), least recently shown first"""
+    # About 60 KB per month with a full page of rows
+    MAX_MONTHS = 36
+    
+    def __init__(self, max_months=MAX_MONTHS):
+        self.max_months = max_months
+        self.months = OrderedDict()
+        # Bumped when a month, or with clear() every month, is invalidated
+        self.versions = {}
+        self.epoch = 0
+    
+    def __contains__(self, month):
+        return month in self.months
+    
+    def version(self, year, month_num):
+        """Return a token to pass to put() for a load submitted now"""
+        return self.epoch, self.versions.get((year, month_num), 0)
+    
+    def get(self, year, month_num):
+        """Return a cached month and mark it as recently shown, or None"""
+        data = self.months.get((year, month_num))
+        if data is not None:
+            self.months.move_to_end((year, month_num))
+        return data
+    
+    def put(self, year, month_num, data, version=None):
+        """Store a month unless it was invalidated since version() was taken"""
+        if version is not None and version != self.version(year, month_num):
+            return
+        self.months[(year, month_num)] = data
+        self.months.move_to_end((year, month_num))
+        while len(self.months) > self.max_months:
+            self.months.popitem(last=False)
+    
+    def invalidate(self, year, month_num):
+        """Forget a month after its expenses or budgets changed"""
+        self.months.pop((year, month_num), None)
+        self.versions[(year, month_num)] = self.versions.get((year, month_num), 0) + 1
+    
+    def invalidate_dates(self, *days):
+        """Forget the months of the given ISO dates; None is ignored"""
+        for day in days:
+            if day:
+                self.invalidate(*month_of(day))
+    
+    def clear(self):
+        """Forget every month, e.g. after an import"""
+        self.months.clear()
+        self.versions.clear()
+        self.epoch += 1
@@ -0,0 +1,285 @@
+"""Optional timing of the expense tracker's hot paths
+
+Usage:
+    python demo.py --perf                  show a breakdown of the last refresh in the window
+    python demo.py --perf-log perf.jsonl   also append every refresh to a log file
+
+Nothing is collected unless enable() is called before the window is built:
+span() then returns a shared no-op context manager and no SQLite callbacks
+are installed, so instrumented code costs a global lookup and a call.
+
+When enabled:
+  - span(name) times a block, such as a query job or a render phase, on any
+    thread. Spans that end while a refresh is open are added to that
+    refresh's breakdown by name.
+  - trace(conn) records the statements run on a connection inside spans.
+    A statement is timed until the next statement on the same thread starts
+    or the outermost span ends, which matches how the query functions fetch
+    each result before running the next one.
+  - The first run of each distinct statement, and every SAMPLE_EVERY-th run
+    after it, is explained with EXPLAIN QUERY PLAN once the span ends. Plans
+    that read a whole table without an index are flagged as full scans.
+"""
+import re
+import json
+import time
+import threading
+from contextlib import nullcontext
+
+# Explain a statement again after this many runs
+SAMPLE_EVERY = 100
+
+enabled = False
+_recorder = None
+_NOT_TIMED = nullcontext()
+
+# Literals are replaced so runs of the same statement are counted together
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+# "SCAN expenses" or "SCAN TABLE expenses AS e", not subqueries or indexes
+_TABLE_SCAN = re.compile(r"SCAN (TABLE )?\w+( AS \w+)?$")
+
+
+def normalize(sql):
+    """Return a statement with its literal values replaced by ?"""
+    return _SPACES.sub(" ", _LITERALS.sub("?", sql)).strip()
+
+
+def full_scans(plan):
+    """Return the plan steps that read a whole table rather than an index"""
+    return [step for step in plan if _TABLE_SCAN.match(step)]
+
+
+class Span:
+    """Context manager timing one block into the recorder"""
+    
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+    
+    def __enter__(self):
+        local = self.recorder.local
+        local.depth = getattr(local, "depth", 0) + 1
+        if local.depth == 1:
+            # A statement left open outside any span has no known end
+            local.statement = None
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        local = self.recorder.local
+        local.depth -= 1
+        if local.depth == 0:
+            self.recorder.end_statement(end)
+        self.recorder.add_span(self.name, (end - self.start) * 1000)
+        if local.depth == 0:
+            self.recorder.explain_samples()
+        return False
+
+
+class Recorder:
+    """Spans, statements and per-refresh breakdowns collected while enabled"""
+    
+    def __init__(self, log_path=None):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.log = open(log_path, "a", encoding="utf-8") if log_path else None
+        # name: {"count", "ms", "max_ms"} over the whole session
+        self.spans = {}
+        # normalized sql: {"count", "ms", "max_ms", "plan", "full_scan"}
+        self.statements = {}
+        self.refresh = None
+        self.last = None
+    
+    def trace(self, conn):
+        conn.set_trace_callback(lambda sql: self.start_statement(conn, sql))
+    
+    def add_span(self, name, ms):
+        with self.lock:
+            stats = self.spans.get(name)
+            if stats is None:
+                stats = self.spans[name] = {"count": 0, "ms": 0.0, "max_ms": 0.0}
+            stats["count"] += 1
+            stats["ms"] += ms
+            stats["max_ms"] = max(stats["max_ms"], ms)
+            if self.refresh is not None:
+                phases = self.refresh["phases"]
+                phases[name] = phases.get(name, 0.0) + ms
+    
+    def start_statement(self, conn, sql):
+        """Trace callback: a statement started on this thread's connection"""
+        # Outside any span a statement has no known end; it is not recorded
+        if getattr(self.local, "depth", 0) == 0:
+            return
+        now = time.perf_counter()
+        current = getattr(self.local, "statement", None)
+        # Statements run inside another one (FTS5 shadow tables, prefixed
+        # with --) and trigger programs, which report the statement that
+        # fired them again, are part of the statement already open
+        if sql.startswith("--") or (current is not None and current[0] == sql):
+            return
+        self.end_statement(now)
+        self.local.statement = (sql, now, conn)
+    
+    def end_statement(self, now):
+        """Charge the time since the open statement started to it"""
+        current = getattr(self.local, "statement", None)
+        if current is None:
+            return
+        self.local.statement = None
+        sql, start, conn = current
+        key = normalize(sql)
+        ms = (now - start) * 1000
+        with self.lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = {"count": 0, "ms": 0.0, "max_ms": 0.0, "plan": None, "full_scan": False}
+            stats["count"] += 1
+            stats["ms"] += ms
+            stats["max_ms"] = max(stats["max_ms"], ms)
+            if self.refresh is not None:
+                self.refresh["sql_count"] += 1
+                self.refresh["sql_ms"] += ms
+                self.refresh["statements"].append((key, ms))
+            sample = (stats["count"] - 1) % SAMPLE_EVERY == 0
+        if sample and key.upper().startswith(("SELECT", "WITH")):
+            samples = getattr(self.local, "samples", None)
+            if samples is None:
+                samples = self.local.samples = []
+            samples.append((conn, sql, key))
+    
+    def explain_samples(self):
+        """Run EXPLAIN QUERY PLAN for the statements sampled on this thread"""
+        samples = getattr(self.local, "samples", None)
+        if not samples:
+            return
+        self.local.samples = []
+        for conn, sql, key in samples:
+            # Not traced: the callback is off while the plan is read
+            conn.set_trace_callback(None)
+            try:
+                plan = [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+            except Exception:
+                continue
+            finally:
+                self.trace(conn)
+            with self.lock:
+                self.statements[key]["plan"] = plan
+                self.statements[key]["full_scan"] = bool(full_scans(plan))
+    
+    def begin(self, label):
+        with self.lock:
+            self.refresh = {"label": label, "start": time.perf_counter(), "phases": {},
+                            "sql_count": 0, "sql_ms": 0.0, "statements": []}
+    
+    def finish(self):
+        with self.lock:
+            refresh, self.refresh = self.refresh, None
+        if refresh is None:
+            return None
+        
+        slowest = max(refresh["statements"], key=lambda statement: statement[1], default=None)
+        result = {
+            "label": refresh["label"],
+            "total_ms": round((time.perf_counter() - refresh["start"]) * 1000, 3),
+            "phases": {name: round(ms, 3) for name, ms in refresh["phases"].items()},
+            "sql_count": refresh["sql_count"],
+            "sql_ms": round(refresh["sql_ms"], 3),
+            "slowest_sql": {"sql": slowest[0], "ms": round(slowest[1], 3),
+                            "full_scan": self.statements[slowest[0]]["full_scan"]} if slowest else None,
+        }
+        self.last = result
+        if self.log is not None:
+            self.log.write(json.dumps({"time": time.time(), **result}) + "\n")
+            self.log.flush()
+        return result
+    
+    def close(self):
+        """Write the session totals to the log and close it"""
+        if self.log is not None:
+            self.log.write(json.dumps({"time": time.time(), "spans": span_stats(), "statements": statement_stats()}) + "\n")
+            self.log.close()
+            self.log = None
+
+
+def enable(log_path=None):
+    """Start collecting; breakdowns are also appended to log_path if given"""
+    global enabled, _recorder
+    _recorder = Recorder(log_path)
+    enabled = True
+
+
+def disable():
+    """Stop collecting and close the log"""
+    global enabled, _recorder
+    if _recorder is not None:
+        _recorder.close()
+    enabled = False
+    _recorder = None
+
+
+def span(name):
+    """Return a context manager timing a block under name"""
+    if not enabled:
+        return _NOT_TIMED
+    return Span(_recorder, name)
+
+
+def timed(name, function):
+    """Wrap function so every call is timed as span name"""
+    def wrapper(*args, **kwargs):
+        with span(name):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def trace(conn):
+    """Record the statements run on conn, if collection is enabled"""
+    if enabled:
+        _recorder.trace(conn)
+    return conn
+
+
+def begin(label):
+    """Open a refresh; spans and statements until finish() are its breakdown"""
+    if enabled:
+        _recorder.begin(label)
+
+
+def finish():
+    """Close the open refresh and return its breakdown, or None"""
+    if enabled:
+        return _recorder.finish()
+    return None
+
+
+def _totals(field, table):
+    """Return the rows of a recorder table, largest total time first"""
+    if _recorder is None:
+        return []
+    with _recorder.lock:
+        items = [{field: key, **{name: round(value, 3) if isinstance(value, float) else value
+                                 for name, value in stats.items()}}
+                 for key, stats in getattr(_recorder, table).items()]
+    return sorted(items, key=lambda item: item["ms"], reverse=True)
+
+
+def span_stats():
+    """Return the spans timed so far, largest total first"""
+    return _totals("name", "spans")
+
+
+def statement_stats():
+    """Return the recorded statements, slowest total first"""
+    return _totals("sql", "statements")
+
+
+def describe(result):
+    """One line summary of a finish() result for the overlay"""
+    phases = " · ".join(f"{name} {ms:.1f}" for name, ms in sorted(result["phases"].items(), key=lambda item: -item[1]))
+    line = f"{result['label']}: {result['total_ms']:.1f} ms ({phases}; {result['sql_count']} SQL {result['sql_ms']:.1f} ms)"
+    slowest = result["slowest_sql"]
+    if slowest and slowest["full_scan"]:
+        line += " full scan: " + slowest["sql"][:60]
+    return line
@@ -0,0 +1,182 @@
+"""Read queries behind the expense tracker views
+
+These functions only take a connection and plain values, so they can run on
+the background database thread as well as on the main thread.
+"""
+import re
+from datetime import date, timedelta
+
+import archive
+import categories
+import reports
+
+# Rows fetched per page of the expense list
+PAGE_SIZE = 200
+
+
+def match_expression(text):
+    """Turn free text into an FTS5 query matching rows with every word as a prefix
+    
+    Returns None if the text has no searchable words.
+    """
+    words = re.findall(r"\w+", text or "")
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def matching_categories(conn, text):
+    """Return the ids of categories whose name has every word of text as a word prefix"""
+    words = [word.lower() for word in re.findall(r"\w+", text or "")]
+    matches = []
+    for category_id, name in categories.names(conn).items():
+        name_words = re.findall(r"\w+", name.lower())
+        if words and all(any(part.startswith(word) for part in name_words) for word in words):
+            matches.append(category_id)
+    return matches
+
+
+def search_plan(conn, filters, match, limit=PAGE_SIZE, schema="main"):
+    """Choose where search_expenses starts looking for rows matching filters
+    
+    Returns "text" or "amount" to fetch every row matching that filter and
+    sort them by date, or "category" or "date" to walk that index newest
+    first, testing the other filters on the way, until a page is full.
+    Fetching costs time in proportion to the number of matches and walking in
+    proportion to how far apart they are, so a filter matching fewer than
+    sqrt(limit * rows) rows is fetched and commoner ones are walked. schema
+    is "main" or the archive being searched.
+    """
+    rows = archive.partitions(conn).size(conn, schema)
+    cutoff = max(int((limit * rows) ** 0.5), limit)
+    
+    def fewer_than_cutoff(sql, *params):
+        return conn.execute(f"SELECT COUNT(*) FROM ({sql} LIMIT ?)", params + (cutoff,)).fetchone()[0] < cutoff
+    
+    if match and fewer_than_cutoff(f"SELECT 1 FROM {schema}.expenses_search WHERE expenses_search MATCH ?", match):
+        return "text"
+    
+    low, high = filters.get("min_amount"), filters.get("max_amount")
+    if (low is not None or high is not None) and fewer_than_cutoff(
+            f"SELECT 1 FROM {schema}.expenses INDEXED BY idx_expenses_amount WHERE amount >= ? AND amount <= ?",
+            float("-inf") if low is None else low, float("inf") if high is None else high):
+        return "amount"
+    
+    return "category" if filters.get("category") else "date"
+
+
+# How expenses are read for each search_plan start
+START_INDEXES = {
+    "text": "NOT INDEXED",
+    "amount": "INDEXED BY idx_expenses_amount",
+    "category": "INDEXED BY idx_expenses_category_date",
+    "date": "INDEXED BY idx_expenses_date_category_amount",
+}
+
+
+def search_expenses(conn, filters, key=None, before=False, limit=PAGE_SIZE):
+    """Fetch one page of expenses matching filters, newest first
+    
+    filters is a dict with any of:
+        text                    words matched against descriptions and category names
+        category                exact category name
+        min_amount, max_amount  inclusive amount bounds
+        start_date, end_date    ISO dates, [start_date, end_date)
+    key is the (date, id) of the row the page continues from; with before=True
+    the page holds the rows directly above it instead of below.
+    
+    Archived years are searched after the expenses table, one archive at a
+    time, only while the page is not full.
+    """
+    conditions = []
+    params = []
+    
+    def where(condition, *values):
+        conditions.append(condition)
+        params.extend(values)
+    
+    if filters.get("category"):
+        category_id = categories.ids(conn).get(filters["category"])
+        if category_id is None:
+            return []
+        where("category_id = ?", category_id)
+    if filters.get("min_amount") is not None:
+        where("amount >= ?", filters["min_amount"])
+    if filters.get("max_amount") is not None:
+        where("amount <= ?", filters["max_amount"])
+    if filters.get("start_date"):
+        where("date >= ?", filters["start_date"])
+    if filters.get("end_date"):
+        where("date < ?", filters["end_date"])
+    if key is not None:
+        where("(date, id) > (?, ?)" if before else "(date, id) < (?, ?)", *key)
+    
+    # Only the years on the side of key the page is read from are searched
+    start, end = filters.get("start_date"), filters.get("end_date")
+    if key is not None and before:
+        start = max(start, key[0]) if start else key[0]
+    elif key is not None:
+        day_after = (date.fromisoformat(key[0]) + timedelta(days=1)).isoformat()
+        end = min(end, day_after) if end else day_after
+    
+    # A plain date range (the month view) is left to the query planner
+    match = match_expression(filters.get("text"))
+    planned = match or filters.get("category") or filters.get("min_amount") is not None or filters.get("max_amount") is not None
+    # Text naming a category lists all of its expenses too, so only text
+    # that matches descriptions alone can drive the search
+    named = matching_categories(conn, filters.get("text")) if match else []
+    
+    order = "ASC" if before else "DESC"
+    rows = []
+    for schema in archive.schemas(conn, start, end, newest_first=not before):
+        index = ""
+        text_conditions = []
+        if planned:
+            plan = search_plan(conn, filters, None if named else match, limit - len(rows), schema)
+            index = START_INDEXES[plan]
+            if match:
+                # Unless the text drives the search, its matches are collected
+                # once and each walked row is checked against them
+                column = "id" if plan == "text" else "+id"
+                condition = f"{column} IN (SELECT rowid FROM {schema}.expenses_search WHERE expenses_search MATCH ?)"
+                if named:
+                    condition = f"({condition} OR category_id IN ({', '.join(map(str, named))}))"
+                text_conditions.append(condition)
+        rows += conn.execute(f"""
+            SELECT id, date, category_id, amount, description
+            FROM {schema}.expenses {index}
+            WHERE {" AND ".join(conditions + text_conditions) or "1"}
+            ORDER BY date {order}, id {order}
+            LIMIT ?
+        """, params + [match] * len(text_conditions) + [limit - len(rows)]).fetchall()
+        if len(rows) >= limit:
+            break
+    if before:
+        rows.reverse()
+    
+    names = categories.names(conn)
+    return [(id, date, names.get(category_id, categories.UNKNOWN), amount, description)
+            for id, date, category_id, amount, description in rows]
+
+
+def fetch_expense_page(conn, start_date, end_date, key=None, before=False, limit=PAGE_SIZE):
+    """Fetch one page of expenses in [start_date, end_date), newest first"""
+    return search_expenses(conn, {"start_date": start_date, "end_date": end_date}, key, before, limit)
+
+
+def load_summary(conn, year, month_num):
+    """Load the month summary shown in the summary panel and chart"""
+    return reports.summarize(conn, *reports.month_range(year, month_num))
+
+
+def load_month(conn, year, month_num, limit=PAGE_SIZE):
+    """Load everything the main window shows for a month in one call
+    
+    Returns a dict with the first page of rows and the month's summary from
+    reports.summarize.
+    """
+    start_date, end_date = reports.month_range(year, month_num)
+    return {
+        "rows": fetch_expense_page(conn, start_date, end_date, limit=limit),
+        "summary": load_summary(conn, year, month_num),
+    }
@@ -0,0 +1,300 @@
+"""Recurring expenses: rules that add an expense every week, month or year
+
+Usage:
+    python recurring.py list
+    python recurring.py add 1200 Housing monthly --start 2024-01-01 [--every 1] [--until 2025-12-31] [--description Rent]
+    python recurring.py stop ID 2025-06-30
+    python recurring.py remove ID
+    python recurring.py materialize [--through 2026-12-31]
+with --db PATH.
+
+A rule's occurrences become ordinary expenses when they are materialized:
+lazily, when the app opens a month, up to the end of that month but not past
+the current one, or in batch up to any day. Each rule keeps the first
+occurrence not added yet in next_date, so a run only computes the days after
+it, and every occurrence due in a run goes in with one INSERT ... SELECT in
+one transaction. An occurrence deleted by hand stays deleted.
+
+Every occurrence carries an idempotency key, a hash of its rule and day, in
+the unique import_hash column, so two runs racing over the same days, from
+the app and the command line say, add each occurrence once.
+"""
+import hashlib
+import calendar
+import argparse
+from datetime import date
+
+import archive
+import categories
+import database
+import expenses
+
+FREQUENCIES = ["daily", "weekly", "monthly", "yearly", "last_day", "last_business_day"]
+
+# Choices of the Repeats box in the Add Expense dialog: label -> (frequency, every)
+REPEATS = {
+    "Weekly": ("weekly", 1),
+    "Every 2 weeks": ("weekly", 2),
+    "Monthly": ("monthly", 1),
+    "Every 3 months": ("monthly", 3),
+    "Yearly": ("yearly", 1),
+    "Last day of the month": ("last_day", 1),
+    "Last business day of the month": ("last_business_day", 1),
+}
+
+
+def month_day(frequency, anchor_day, year, month):
+    """Day of the month an occurrence of a month based rule falls on"""
+    last = calendar.monthrange(year, month)[1]
+    if frequency == "last_business_day":
+        # Saturday and Sunday move back to Friday
+        return last - max(0, calendar.weekday(year, month, last) - 4)
+    if frequency == "last_day":
+        return last
+    # The 31st is the last day in shorter months, Feb 29 the 28th in common years
+    return min(anchor_day, last)
+
+
+def iterate(frequency, every, start, since):
+    """Yield a rule's occurrences from since, which must be one of them, onwards"""
+    if frequency in ("daily", "weekly"):
+        step = every * (7 if frequency == "weekly" else 1)
+        ordinal = since.toordinal()
+        while True:
+            yield date.fromordinal(ordinal)
+            ordinal += step
+    step = every * (12 if frequency == "yearly" else 1)
+    index = since.year * 12 + since.month - 1
+    while True:
+        year, month = divmod(index, 12)
+        yield date(year, month + 1, month_day(frequency, start.day, year, month + 1))
+        index += step
+
+
+def first_occurrence(frequency, start):
+    """Return the first occurrence of a rule starting on start"""
+    if frequency not in ("last_day", "last_business_day"):
+        return start
+    day = date(start.year, start.month, month_day(frequency, start.day, start.year, start.month))
+    if day < start:
+        year, month = divmod(start.year * 12 + start.month, 12)
+        day = date(year, month + 1, month_day(frequency, start.day, year, month + 1))
+    return day
+
+
+def occurrence_key(rule_id, day):
+    """Idempotency key of an occurrence, stored in import_hash
+    
+    The importer's keys start with a date or "id|", so they never collide.
+    """
+    return hashlib.blake2b(f"rule|{rule_id}|{day}".encode("utf-8"), digest_size=16).digest()
+
+
+def last_of_month(year, month_num):
+    """Return the ISO date of a month's last day"""
+    return date(year, month_num, calendar.monthrange(year, month_num)[1]).isoformat()
+
+
+def due_through(year, month_num, today=None):
+    """Return the last day materialized when a month is opened
+    
+    That is the month's last day, but months after the current one are not
+    filled in ahead of time.
+    """
+    today = today or date.today()
+    if (year, month_num) > (today.year, today.month):
+        year, month_num = today.year, today.month
+    return last_of_month(year, month_num)
+
+
+def add_rule(conn, amount_str, category, start_str, description, frequency, every=1, until=None):
+    """Validate and store a rule, returning its id
+    
+    Nothing is added to expenses until the rule is materialized. Raises
+    ValueError with a message suitable for showing to the user.
+    """
+    amount = expenses.validate_expense(amount_str, start_str)
+    category_id = categories.ids(conn).get(category)
+    if category_id is None:
+        raise ValueError(f"No category named {category}")
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"Frequency must be one of {', '.join(FREQUENCIES)}")
+    if every < 1:
+        raise ValueError("A rule must repeat every 1 or more days, weeks, months or years")
+    if until is not None:
+        date.fromisoformat(until)
+        if until < start_str:
+            raise ValueError("A rule cannot end before it starts")
+    archive.check_open(conn, start_str)
+    
+    first = first_occurrence(frequency, date.fromisoformat(start_str)).isoformat()
+    with conn:
+        return conn.execute("""
+            INSERT INTO recurring_rules (amount, category_id, description, frequency, every, start_date, until_date, next_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (amount, category_id, description, frequency, every, start_str, until,
+              first if until is None or first <= until else None)).lastrowid
+
+
+def stop_rule(conn, rule_id, until):
+    """End a rule after the day until; occurrences already added stay"""
+    date.fromisoformat(until)
+    with conn:
+        cursor = conn.execute("""
+            UPDATE recurring_rules
+            SET until_date = ?, next_date = CASE WHEN next_date > ? THEN NULL ELSE next_date END
+            WHERE id = ?
+        """, (until, until, rule_id))
+    if cursor.rowcount == 0:
+        raise ValueError(f"No rule with id {rule_id}")
+
+
+def remove_rule(conn, rule_id):
+    """Delete a rule; occurrences already added stay"""
+    with conn:
+        cursor = conn.execute("DELETE FROM recurring_rules WHERE id = ?", (rule_id,))
+    if cursor.rowcount == 0:
+        raise ValueError(f"No rule with id {rule_id}")
+
+
+def list_rules(conn):
+    """Return (id, amount, category, description, frequency, every, start, until, next) for every rule"""
+    names = categories.names(conn)
+    return [row[:2] + (names.get(row[2]),) + row[3:] for row in conn.execute("""
+        SELECT id, amount, category_id, description, frequency, every, start_date, until_date, next_date
+        FROM recurring_rules ORDER BY id
+    """)]
+
+
+def occurrence_keys(conn, start, end):
+    """Return the idempotency keys of every rule's occurrences on days in [start, end)"""
+    first, last = date.fromisoformat(start), date.fromisoformat(end)
+    keys = []
+    for rule_id, frequency, every, start_date, until in conn.execute("""
+        SELECT id, frequency, every, start_date, until_date FROM recurring_rules
+        WHERE start_date < ? AND (until_date IS NULL OR until_date >= ?)
+    """, (end, start)):
+        rule_start = date.fromisoformat(start_date)
+        for day in iterate(frequency, every, rule_start, first_occurrence(frequency, rule_start)):
+            if day >= last:
+                break
+            if day >= first:
+                keys.append(occurrence_key(rule_id, day.isoformat()))
+    return keys
+
+
+def materialize(conn, through, rule_id=None):
+    """Add every occurrence due up to and including the day through as an expense
+    
+    Only the rule rule_id is run when it is given. Returns (number added,
+    dates): the days occurrences were due on, whose months may have changed.
+    Occurrences in archived years are passed over.
+    """
+    only = "" if rule_id is None else "AND id = ?"
+    rules = conn.execute(f"""
+        SELECT id, amount, category_id, description, frequency, every, start_date, until_date, next_date
+        FROM recurring_rules WHERE next_date <= ? {only}
+    """, (through,) if rule_id is None else (through, rule_id)).fetchall()
+    if not rules:
+        return 0, []
+    last_year = database.archived_through(conn)
+    first_open_day = "" if last_year is None else f"{last_year + 1}"
+    through_day = date.fromisoformat(through)
+    
+    rows = []
+    advanced = []
+    for rule_id, amount, category_id, description, frequency, every, start, until, next_date in rules:
+        end = min(through_day, date.fromisoformat(until)) if until else through_day
+        for day in iterate(frequency, every, date.fromisoformat(start), date.fromisoformat(next_date)):
+            if day > end:
+                break
+            iso_day = day.isoformat()
+            if iso_day >= first_open_day:
+                rows.append((amount, category_id, iso_day, description, occurrence_key(rule_id, iso_day)))
+        # The first occurrence after end
+        following = day.isoformat()
+        advanced.append((following if until is None or following <= until else None, rule_id))
+    
+    # Ids follow the dates, so the new rows go in along the date indexes
+    rows.sort(key=lambda row: row[2])
+    with conn:
+        # The rules are written first: that takes the write lock, so no other
+        # connection can add expenses between reading the next id and using it
+        conn.executemany("UPDATE recurring_rules SET next_date = ? WHERE id = ?", advanced)
+        added = 0
+        if rows:
+            # Staged in a temporary table and added with one INSERT ... SELECT:
+            # executemany would be one statement per row, and the search
+            # index trigger flushes FTS5's pending terms at every statement
+            conn.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS recurring_occurrences (
+                    id INTEGER PRIMARY KEY, amount REAL, category_id INTEGER,
+                    date TEXT, description TEXT, import_hash BLOB
+                )
+            """)
+            # Explicit ids stay clear of archived expenses
+            next_id = archive.next_id(conn)
+            conn.executemany("INSERT INTO temp.recurring_occurrences VALUES (?, ?, ?, ?, ?, ?)",
+                             [(next_id + number,) + row for number, row in enumerate(rows)])
+            # A key another run added is skipped. WHERE true tells the parser
+            # ON CONFLICT is not a join.
+            added = conn.execute("""
+                INSERT INTO expenses (id, amount, category_id, date, description, import_hash)
+                SELECT id, amount, category_id, date, description, import_hash
+                FROM temp.recurring_occurrences WHERE true ORDER BY id
+                ON CONFLICT (import_hash) DO NOTHING
+            """).rowcount
+            conn.execute("DELETE FROM temp.recurring_occurrences")
+    return added, sorted({row[2] for row in rows})
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Manage recurring expenses and add the ones that are due")
+    parser.add_argument("--db", default=database.DB_PATH, help="path to the SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list the rules")
+    add = commands.add_parser("add", help="add a rule")
+    add.add_argument("amount")
+    add.add_argument("category")
+    add.add_argument("frequency", choices=FREQUENCIES)
+    add.add_argument("--start", default=date.today().isoformat(), help="first day (default: today)")
+    add.add_argument("--every", type=int, default=1, help="repeat every N days, weeks, months or years")
+    add.add_argument("--until", help="last day an occurrence may fall on")
+    add.add_argument("--description", default="")
+    stop = commands.add_parser("stop", help="end a rule after a day")
+    stop.add_argument("id", type=int)
+    stop.add_argument("until")
+    commands.add_parser("remove", help="delete a rule").add_argument("id", type=int)
+    run = commands.add_parser("materialize", help="add the occurrences due up to a day")
+    run.add_argument("--through", default=last_of_month(date.today().year, date.today().month),
+                     help="last day to add (default: the end of this month)")
+    args = parser.parse_args(argv)
+    
+    conn = database.connect(args.db)
+    try:
+        if args.command == "list":
+            for rule_id, amount, category, description, frequency, every, start, until, following in list_rules(conn):
+                repeat = frequency if every == 1 else f"{frequency} x{every}"
+                print(f"{rule_id:>4}  {amount:>10.2f}  {category:<15}{repeat:<22}{start} to {until or '...':<12}"
+                      f"next {following or '-':<12}{description}")
+        elif args.command == "add":
+            rule_id = add_rule(conn, args.amount, args.category, args.start, args.description,
+                               args.frequency, args.every, args.until)
+            print(f"Added rule {rule_id}")
+        elif args.command == "stop":
+            stop_rule(conn, args.id, args.until)
+        elif args.command == "remove":
+            remove_rule(conn, args.id)
+        else:
+            added, dates = materialize(conn, args.through)
+            print(f"Added {added:,} expenses due through {args.through}")
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,247 @@
+"""Expense summaries over arbitrary date ranges, independent of the GUI
+
+Usage:
+    python reports.py month 2024-03
+    python reports.py quarter 2024-Q1
+    python reports.py ytd [--year 2024]
+    python reports.py rolling 30
+    python reports.py range 2024-01-15 2024-02-14
+with --format json|csv, --output FILE and --db PATH.
+
+Ranges are [start, end): start is the first day included and end the first
+day after the range. Whole months inside a range are read from the
+monthly_category_totals rollup and only the partial months at either end
+scan expenses, each in a single grouped query, so reports stay fast on
+multi-million row databases.
+"""
+import csv
+import sys
+import json
+import calendar
+import argparse
+from datetime import date, timedelta
+
+import archive
+import categories
+import database
+
+MONTH_NUMBERS = {name: number for number, name in enumerate(calendar.month_name) if name}
+
+
+def month_range(year, month_num):
+    """Return the [start, end) ISO dates covering a month"""
+    start_date = f"{year}-{month_num:02d}-01"
+    if month_num == 12:
+        end_date = f"{year+1}-01-01"
+    else:
+        end_date = f"{year}-{month_num+1:02d}-01"
+    return start_date, end_date
+
+
+def quarter_range(year, quarter):
+    """Return the [start, end) ISO dates covering quarter 1-4 of a year"""
+    first_month = 3 * (quarter - 1) + 1
+    return month_range(year, first_month)[0], month_range(year, first_month + 2)[1]
+
+
+def ytd_range(today=None):
+    """Return the [start, end) ISO dates from January 1st through today"""
+    today = today or date.today()
+    return f"{today.year}-01-01", (today + timedelta(days=1)).isoformat()
+
+
+def rolling_range(days, today=None):
+    """Return the [start, end) ISO dates covering the last N days including today"""
+    today = today or date.today()
+    return (today - timedelta(days=days - 1)).isoformat(), (today + timedelta(days=1)).isoformat()
+
+
+def first_of_next_month(day):
+    """Return the first day of the month after day's month"""
+    return date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+
+
+def spent_by_category(conn, start, end):
+    """Return {category: [total, count]} for expenses in [start, end)"""
+    start_day, end_day = date.fromisoformat(start), date.fromisoformat(end)
+    totals = {}
+    
+    # Rows are grouped by category id and named once at the end
+    def add(rows):
+        for category_id, total, count in rows:
+            entry = totals.setdefault(category_id, [0.0, 0])
+            entry[0] += total
+            entry[1] += count
+    
+    def scan(scan_start, scan_end):
+        bounds = (scan_start.isoformat(), scan_end.isoformat())
+        for schema in archive.schemas(conn, *bounds):
+            add(conn.execute(f"""
+                SELECT category_id, SUM(amount), COUNT(*)
+                FROM {schema}.expenses
+                WHERE date >= ? AND date < ?
+                GROUP BY category_id
+            """, bounds))
+    
+    # Split the range into a partial month at the start, whole months in the
+    # middle, and a partial month at the end
+    head_end = start_day if start_day.day == 1 else min(first_of_next_month(start_day), end_day)
+    tail_start = max(head_end, end_day.replace(day=1))
+    
+    if start_day < head_end:
+        scan(start_day, head_end)
+    if head_end < tail_start:
+        add(conn.execute("""
+            SELECT category_id, SUM(total), SUM(count)
+            FROM monthly_category_totals
+            WHERE month >= ? AND month < ?
+            GROUP BY category_id
+        """, (head_end.isoformat()[:7], tail_start.isoformat()[:7])))
+    if tail_start < end_day:
+        scan(tail_start, end_day)
+    
+    # Ids without a category are counted under categories.UNKNOWN
+    names = categories.names(conn)
+    spent = {}
+    for category_id, (total, count) in totals.items():
+        entry = spent.setdefault(names.get(category_id, categories.UNKNOWN), [0.0, 0])
+        entry[0] += total
+        entry[1] += count
+    return spent
+
+
+def budget_by_category(conn, start, end):
+    """Return {category: budget} for [start, end)
+    
+    Monthly budgets count in full for whole months and in proportion to the
+    number of days covered for partial months.
+    """
+    start_day, end_day = date.fromisoformat(start), date.fromisoformat(end)
+    budgets = {}
+    if start_day >= end_day:
+        return budgets
+    
+    rows = conn.execute("""
+        SELECT year, month, category_id, amount FROM budgets
+        WHERE year BETWEEN ? AND ?
+    """, (start_day.year, (end_day - timedelta(days=1)).year))
+    
+    names = categories.names(conn)
+    for year, month, category_id, amount in rows:
+        category = names.get(category_id)
+        month_num = MONTH_NUMBERS.get(month)
+        # A budget left without a category cannot be shown or edited
+        if category is None or month_num is None:
+            continue
+        month_start = date(year, month_num, 1)
+        month_end = first_of_next_month(month_start)
+        covered = (min(month_end, end_day) - max(month_start, start_day)).days
+        if covered > 0:
+            weight = covered / (month_end - month_start).days
+            budgets[category] = budgets.get(category, 0) + amount * weight
+    return budgets
+
+
+def summarize(conn, start, end):
+    """Summarize spending against budget for [start, end)
+    
+    Returns a dict with the range, overall total, count, budget and remaining,
+    and a per-category breakdown sorted by category name.
+    """
+    spent = spent_by_category(conn, start, end)
+    budgets = budget_by_category(conn, start, end)
+    
+    categories = []
+    for category in sorted(spent.keys() | budgets.keys()):
+        total, count = spent.get(category, (0.0, 0))
+        budget = budgets.get(category, 0.0)
+        categories.append({
+            "category": category,
+            "spent": round(total, 2),
+            "count": count,
+            "budget": round(budget, 2),
+            "remaining": round(budget - total, 2),
+        })
+    
+    total = sum(total for total, _ in spent.values())
+    budget = sum(budgets.values(), 0.0)
+    return {
+        "start": start,
+        "end": end,
+        "total": round(total, 2),
+        "count": sum(count for _, count in spent.values()),
+        "budget": round(budget, 2),
+        "remaining": round(budget - total, 2),
+        "categories": categories,
+    }
+
+
+def write_csv(summary, out):
+    """Write a summary as CSV, one row per category plus a total row"""
+    writer = csv.writer(out)
+    writer.writerow(["category", "spent", "count", "budget", "remaining"])
+    for row in summary["categories"]:
+        writer.writerow([row["category"], f"{row['spent']:.2f}", row["count"], f"{row['budget']:.2f}", f"{row['remaining']:.2f}"])
+    writer.writerow(["TOTAL", f"{summary['total']:.2f}", summary["count"], f"{summary['budget']:.2f}", f"{summary['remaining']:.2f}"])
+
+
+def parse_period(args):
+    """Turn the parsed command line into a [start, end) range"""
+    if args.period == "month":
+        year, month = args.value.split("-")
+        return month_range(int(year), int(month))
+    if args.period == "quarter":
+        year, quarter = args.value.upper().split("-Q")
+        return quarter_range(int(year), int(quarter))
+    if args.period == "ytd":
+        today = date.today() if args.year is None else date(args.year, 12, 31)
+        return ytd_range(today)
+    if args.period == "rolling":
+        return rolling_range(int(args.value))
+    # range takes an inclusive last day, like a bank statement
+    return args.value, (date.fromisoformat(args.last) + timedelta(days=1)).isoformat()
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Summarize expenses over a date range")
+    parser.add_argument("--db", default=database.DB_PATH, help="path to the SQLite database")
+    parser.add_argument("--format", choices=["json", "csv"], default="json", help="output format")
+    parser.add_argument("--output", help="write to this file instead of stdout")
+    periods = parser.add_subparsers(dest="period", required=True)
+    periods.add_parser("month", help="a calendar month").add_argument("value", metavar="YYYY-MM")
+    periods.add_parser("quarter", help="a calendar quarter").add_argument("value", metavar="YYYY-QN")
+    periods.add_parser("ytd", help="January 1st through today").add_argument("--year", type=int, help="a full past year instead")
+    periods.add_parser("rolling", help="the last N days including today").add_argument("value", metavar="DAYS")
+    period_range = periods.add_parser("range", help="an explicit range, both days included")
+    period_range.add_argument("value", metavar="FIRST_DAY")
+    period_range.add_argument("last", metavar="LAST_DAY")
+    args = parser.parse_args(argv)
+    
+    try:
+        start, end = parse_period(args)
+        date.fromisoformat(start), date.fromisoformat(end)
+    except ValueError as e:
+        parser.error(f"invalid {args.period}: {e}")
+    
+    conn = database.connect(args.db)
+    try:
+        summary = summarize(conn, start, end)
+    finally:
+        conn.close()
+    
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "csv":
+            write_csv(summary, out)
+        else:
+            json.dump(summary, out, indent=2)
+            out.write("\n")
+    finally:
+        if args.output:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,414 @@
+"""Share one expenses database between several users over a local HTTP/JSON API
+
+Usage: python server.py [--db data/expenses.db] [--host 127.0.0.1] [--port 8765] [--token SECRET]
+
+The GUI becomes a client with `python demo.py --server http://HOST:PORT`.
+
+Reads run on a pool of connections, one per request in flight, which WAL
+lets proceed while a write is committing. Writes go through a single writer
+thread that takes every write queued while the previous batch committed and
+applies them in one transaction, each inside its own savepoint so a failing
+write does not undo the others. A request's response is only sent once its
+batch has committed. Every response carries X-Ledger-Version, the number of
+batches committed so far, so clients know when their cached months are out
+of date.
+
+Endpoints (months are numbered 1-12):
+    GET    /version
+    GET    /categories
+    GET    /months/YEAR/MONTH                first page of rows and the summary
+    GET    /months/YEAR/MONTH/summary
+    GET    /months/YEAR/MONTH/alerts         budget, unusual spending and duplicate alerts
+    GET    /months/YEAR/MONTH/expenses       every expense of the month as columns
+    GET    /expenses?text=&category=&min_amount=&max_amount=&start_date=&end_date=
+                    &after_date=&after_id=&before=1&limit=
+    GET    /expenses/ID
+    POST   /expenses                         one expense or a list of them
+    PUT    /expenses/ID
+    DELETE /expenses/ID
+    GET    /budgets/YEAR/MONTH
+    PUT    /budgets/YEAR/MONTH               {"amounts": {category: amount}, "months": 1}
+    GET    /trends?start_year=&end_year=&window=
+    POST   /recurring                        a rule, {"frequency", "every", "until"} plus an expense
+    POST   /recurring/materialize            {"through": date, "rule_id": null}
+Expenses are {"amount", "category", "date", "description"}; a rule's date is
+its first day. Invalid input is answered with 400 and {"error": message}.
+"""
+import re
+import hmac
+import json
+import math
+import queue
+import sqlite3
+import calendar
+import argparse
+import threading
+from urllib.parse import parse_qsl
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import analytics
+import budgets
+import categories
+import database
+import expense_model
+import expenses
+import queries
+import recurring
+import trends
+
+DEFAULT_PORT = 8765
+READERS = 4
+# Writes committed together at most
+WRITE_BATCH = 256
+MAX_LIMIT = 1000
+
+
+class BatchConnection:
+    """The writer's connection as seen by one write of a batch
+    
+    The write functions commit through `with conn:`; here the writer commits
+    the whole batch instead, so commits and rollbacks are left to it.
+    """
+    
+    def __init__(self, conn):
+        self.conn = conn
+    
+    def execute(self, *args):
+        return self.conn.execute(*args)
+    
+    def executemany(self, *args):
+        return self.conn.executemany(*args)
+    
+    def commit(self):
+        pass
+    
+    def rollback(self):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+
+
+class Writer:
+    """Single thread applying writes, committing the ones queued together as one batch"""
+    
+    def __init__(self, path, batch_size=WRITE_BATCH):
+        self.path = path
+        self.batch_size = batch_size
+        self.requests = queue.Queue()
+        self.version = 0
+        self.batches = 0
+        self.thread = threading.Thread(target=self.run, name="db-writer", daemon=True)
+        self.thread.start()
+    
+    def submit(self, function, *args):
+        """Run function(conn, *args) in the next batch and return its result once committed"""
+        slot = {"done": threading.Event(), "result": None, "error": None}
+        self.requests.put((function, args, slot))
+        slot["done"].wait()
+        if slot["error"] is not None:
+            raise slot["error"]
+        return slot["result"]
+    
+    def run(self):
+        # Transactions are managed here, not by the sqlite3 module
+        conn = database.open_connection(self.path, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout = 5000")
+        batch_conn = BatchConnection(conn)
+        stopping = False
+        while not stopping:
+            batch = [self.requests.get()]
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                stopping = True
+                batch.pop()
+            if batch:
+                self.apply(conn, batch_conn, batch)
+        conn.close()
+    
+    def apply(self, conn, batch_conn, batch):
+        """Apply a batch of writes in one transaction and wake their requests"""
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for function, args, slot in batch:
+                conn.execute("SAVEPOINT write")
+                try:
+                    slot["result"] = function(batch_conn, *args)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write")
+                    slot["error"] = e
+                conn.execute("RELEASE write")
+            conn.execute("COMMIT")
+            self.version += 1
+            self.batches += 1
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for function, args, slot in batch:
+                slot["result"], slot["error"] = None, slot["error"] or e
+        finally:
+            for function, args, slot in batch:
+                slot["done"].set()
+    
+    def close(self):
+        self.requests.put(None)
+        self.thread.join()
+
+
+class ReaderPool:
+    """Read-only connections handed to one request at a time"""
+    
+    def __init__(self, path, size=READERS):
+        self.connections = queue.Queue()
+        for _ in range(size):
+            conn = database.open_connection(path, check_same_thread=False)
+            conn.execute("PRAGMA query_only = ON")
+            self.connections.put(conn)
+    
+    def run(self, function, *args):
+        """Return function(conn, *args) on a free connection"""
+        conn = self.connections.get()
+        try:
+            return function(conn, *args)
+        finally:
+            self.connections.put(conn)
+    
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get().close()
+
+
+class NotFound(Exception):
+    """The requested expense or route does not exist"""
+
+
+def month_name(month):
+    """Turn a month number from a URL into the name budgets are stored under"""
+    month = int(month)
+    if not 1 <= month <= 12:
+        raise ValueError(f"{month} is not a month")
+    return calendar.month_name[month]
+
+
+def json_value(value):
+    """Make NumPy arrays JSON serializable, with NaN as null"""
+    if hasattr(value, "tolist"):
+        value = value.tolist()
+    if isinstance(value, list):
+        return [json_value(item) for item in value]
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def search_filters(params):
+    """Return the queries.search_expenses arguments of a query string"""
+    filters = {name: params[name] for name in ("text", "category", "start_date", "end_date") if params.get(name)}
+    for name in ("min_amount", "max_amount"):
+        if params.get(name):
+            filters[name] = float(params[name])
+    key = (params["after_date"], int(params["after_id"])) if params.get("after_date") else None
+    limit = min(int(params.get("limit", queries.PAGE_SIZE)), MAX_LIMIT)
+    return filters, key, params.get("before") == "1", limit
+
+
+def expense_fields(body):
+    """Return the save_expense arguments of an expense in a request body"""
+    if not isinstance(body, dict):
+        raise ValueError("An expense must be a JSON object")
+    return (str(body.get("amount", "")), body.get("category"), str(body.get("date", "")),
+            body.get("description") or "")
+
+
+def add_expenses(conn, items):
+    """Add one or more expenses, all or none"""
+    return [expenses.save_expense(conn, None, *fields)[0] for fields in items]
+
+
+def get_expense(server, match, params, body):
+    expense = server.readers.run(expenses.get_expense, int(match[1]))
+    if expense is None:
+        raise NotFound(f"No expense with id {match[1]}")
+    return dict(zip(("id", "amount", "category", "date", "description"), expense))
+
+
+def post_expenses(server, match, params, body):
+    # A list is added in one transaction, and as one savepoint of its batch
+    items = [expense_fields(item) for item in (body if isinstance(body, list) else [body])]
+    ids = server.writer.submit(add_expenses, items)
+    return {"ids": ids} if isinstance(body, list) else {"id": ids[0], "dates": [items[0][2]]}
+
+
+def put_expense(server, match, params, body):
+    expense_id, dates = server.writer.submit(expenses.save_expense, int(match[1]), *expense_fields(body))
+    return {"id": expense_id, "dates": dates}
+
+
+def delete_expense(server, match, params, body):
+    deleted = server.writer.submit(expenses.delete_expense, int(match[1]))
+    if deleted is None:
+        raise NotFound(f"No expense with id {match[1]}")
+    return {"date": deleted}
+
+
+def put_budgets(server, match, params, body):
+    if not isinstance(body, dict) or not isinstance(body.get("amounts"), dict):
+        raise ValueError('Budgets must be {"amounts": {category: amount}}')
+    amounts = {category: float(amount) for category, amount in body["amounts"].items()}
+    server.writer.submit(budgets.save, month_name(match[2]), int(match[1]), amounts, int(body.get("months", 1)))
+    return {"saved": len(amounts)}
+
+
+def post_rule(server, match, params, body):
+    fields = expense_fields(body)
+    every = int(body.get("every", 1))
+    until = str(body["until"]) if body.get("until") else None
+    rule_id = server.writer.submit(recurring.add_rule, *fields, str(body.get("frequency")), every, until)
+    return {"id": rule_id}
+
+
+def post_materialize(server, match, params, body):
+    if not isinstance(body, dict) or not body.get("through"):
+        raise ValueError('Materialize needs {"through": "YYYY-MM-DD"}')
+    rule_id = int(body["rule_id"]) if body.get("rule_id") is not None else None
+    added, dates = server.writer.submit(recurring.materialize, str(body["through"]), rule_id)
+    return {"added": added, "dates": dates}
+
+
+# (method, path pattern, handler(server, match, params, body))
+ROUTES = [
+    ("GET", r"/version", lambda server, match, params, body: {"version": server.writer.version}),
+    ("GET", r"/categories", lambda server, match, params, body: server.readers.run(categories.sorted_names)),
+    ("GET", r"/months/(\d+)/(\d+)", lambda server, match, params, body:
+        server.readers.run(queries.load_month, int(match[1]), int(match[2]))),
+    ("GET", r"/months/(\d+)/(\d+)/summary", lambda server, match, params, body:
+        server.readers.run(queries.load_summary, int(match[1]), int(match[2]))),
+    ("GET", r"/months/(\d+)/(\d+)/alerts", lambda server, match, params, body:
+        server.readers.run(analytics.month_alerts, int(match[1]), int(match[2]))),
+    ("GET", r"/months/(\d+)/(\d+)/expenses", lambda server, match, params, body:
+        server.readers.run(expense_model.load_month, int(match[1]), int(match[2])).columns()),
+    ("GET", r"/expenses", lambda server, match, params, body:
+        server.readers.run(queries.search_expenses, *search_filters(params))),
+    ("GET", r"/expenses/(\d+)", get_expense),
+    ("POST", r"/expenses", post_expenses),
+    ("PUT", r"/expenses/(\d+)", put_expense),
+    ("DELETE", r"/expenses/(\d+)", delete_expense),
+    ("GET", r"/budgets/(\d+)/(\d+)", lambda server, match, params, body:
+        server.readers.run(budgets.load, month_name(match[2]), int(match[1]))),
+    ("PUT", r"/budgets/(\d+)/(\d+)", put_budgets),
+    ("GET", r"/trends", lambda server, match, params, body:
+        server.readers.run(trends.load_trends, int(params["start_year"]), int(params["end_year"]),
+                           int(params.get("window", 3)))),
+    ("POST", r"/recurring", post_rule),
+    ("POST", r"/recurring/materialize", post_materialize),
+]
+ROUTES = [(method, re.compile(pattern + "$"), handler) for method, pattern, handler in ROUTES]
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Routes one HTTP request to its handler and answers in JSON"""
+    # Keep-alive, so a client reuses one TCP connection
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this each response
+    # waits for the client's delayed ACK
+    disable_nagle_algorithm = True
+    
+    def do_GET(self):
+        self.handle_request("GET")
+    
+    def do_POST(self):
+        self.handle_request("POST")
+    
+    def do_PUT(self):
+        self.handle_request("PUT")
+    
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+    
+    def handle_request(self, method):
+        server = self.server
+        path, _, query = self.path.partition("?")
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length)) if length else None
+            if server.token and not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {server.token}"):
+                self.respond(401, {"error": "Missing or wrong token"})
+                return
+            
+            for route_method, pattern, handler in ROUTES:
+                match = pattern.match(path)
+                if match and route_method == method:
+                    self.respond(200, handler(server, match, dict(parse_qsl(query)), body))
+                    return
+            raise NotFound(f"No route for {method} {path}")
+        except NotFound as e:
+            self.respond(404, {"error": str(e)})
+        except (ValueError, TypeError, KeyError) as e:
+            self.respond(400, {"error": str(e)})
+        except Exception as e:
+            self.respond(500, {"error": str(e)})
+    
+    def respond(self, status, payload):
+        data = json.dumps(json_value(payload), default=json_value).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("X-Ledger-Version", str(self.server.writer.version))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class LedgerServer(ThreadingHTTPServer):
+    """HTTP server owning the reader pool and the writer of one database"""
+    daemon_threads = True
+    
+    def __init__(self, address, path=database.DB_PATH, readers=READERS, token=None, verbose=False):
+        # Creates and migrates the database, and switches it to WAL
+        database.connect(path).close()
+        self.readers = ReaderPool(path, readers)
+        self.writer = Writer(path)
+        self.token = token
+        self.verbose = verbose
+        super().__init__(address, RequestHandler)
+    
+    def server_close(self):
+        super().server_close()
+        self.writer.close()
+        self.readers.close()
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Serve an expenses database to several clients")
+    parser.add_argument("--db", default=database.DB_PATH, help="path to the SQLite database")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on")
+    parser.add_argument("--readers", type=int, default=READERS, help="pooled read connections")
+    parser.add_argument("--token", help="require 'Authorization: Bearer TOKEN' on every request")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+    
+    server = LedgerServer((args.host, args.port), args.db, args.readers, args.token, args.verbose)
+    print(f"Serving {args.db} on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,80 @@
+"""Monthly spending trends per category over a multi-year range
+
+All series are built from one grouped query over the monthly rollup (plus
+one over budgets) and computed with NumPy array operations, so ten years of
+history is a few thousand values no matter how many expenses there are.
+"""
+import numpy as np
+
+import categories
+from reports import MONTH_NUMBERS
+
+
+def load_trends(conn, start_year, end_year, window=3):
+    """Return monthly spend, moving averages and budget variance for a year range
+    
+    The result is a dict with:
+        months          labels "YYYY-MM" for every month in the range
+        categories      category names, one row per category in the arrays
+        spend           (categories, months) array of monthly totals
+        total           (months,) total spend per month
+        moving_average  (months,) trailing mean of total over `window` months,
+                        NaN until enough months are available
+        budget          (months,) sum of category budgets per month
+        variance        (months,) budget minus total, negative when over
+    """
+    first = start_year * 12
+    month_count = (end_year - start_year + 1) * 12
+    
+    # One grouped read of the rollup; the month ordinal is computed in SQL
+    # so the result converts straight into index arrays
+    rows = conn.execute("""
+        SELECT CAST(substr(month, 1, 4) AS INTEGER) * 12 + CAST(substr(month, 6, 2) AS INTEGER) - 1,
+               category_id, total
+        FROM monthly_category_totals
+        WHERE month >= ? AND month < ?
+    """, (f"{start_year}-01", f"{end_year + 1}-01")).fetchall()
+    
+    if rows:
+        ordinals, category_ids, totals = zip(*rows)
+        names = categories.names(conn)
+        category_names, category_index = np.unique(np.array([names.get(i, categories.UNKNOWN) for i in category_ids], dtype=object),
+                                                   return_inverse=True)
+        spend = np.zeros((len(category_names), month_count))
+        np.add.at(spend, (category_index, np.asarray(ordinals) - first), np.asarray(totals, dtype=float))
+    else:
+        category_names = np.array([], dtype=object)
+        spend = np.zeros((0, month_count))
+    
+    budget = np.zeros(month_count)
+    budget_rows = conn.execute("""
+        SELECT year, month, SUM(amount) FROM budgets
+        WHERE year BETWEEN ? AND ? AND category_id IN (SELECT id FROM categories)
+        GROUP BY year, month
+    """, (start_year, end_year)).fetchall()
+    budget_rows = [(year, MONTH_NUMBERS[month], amount) for year, month, amount in budget_rows if month in MONTH_NUMBERS]
+    if budget_rows:
+        years, month_nums, amounts = (np.asarray(column) for column in zip(*budget_rows))
+        np.add.at(budget, years * 12 + month_nums - 1 - first, amounts.astype(float))
+    
+    total = spend.sum(axis=0)
+    return {
+        "months": [f"{year}-{month:02d}" for year in range(start_year, end_year + 1) for month in range(1, 13)],
+        "categories": [str(name) for name in category_names],
+        "spend": spend,
+        "total": total,
+        "moving_average": moving_average(total, window),
+        "budget": budget,
+        "variance": budget - total,
+    }
+
+
+def moving_average(values, window):
+    """Trailing mean over `window` values, NaN for the first window - 1 positions"""
+    result = np.full(len(values), np.nan)
+    if window < 1 or len(values) < window:
+        return result
+    
+    sums = np.cumsum(np.insert(values, 0, 0.0))
+    result[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return result